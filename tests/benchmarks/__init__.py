@@ -0,0 +1,14 @@
+"""Offline crawl-throughput benchmarks.
+
+The benchmarks run the spider templates end to end against
+:class:`~tests.benchmarks.sites.SyntheticSiteResource`, a mock Zyte API that
+serves generated e-commerce, article and job posting websites of a
+configurable size, and report requests/sec, items/sec, peak RSS and
+per-callback CPU time for each spider and crawl strategy.
+
+Run them from the root of the repository::
+
+    python -m tests.benchmarks --categories 5 --depth 2 --pages 3 --items 20
+
+Use ``--help`` to see all options.
+"""
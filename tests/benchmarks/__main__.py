@@ -0,0 +1,118 @@
+import argparse
+import json
+from typing import Any, Dict, List
+
+from ..mockserver import MockServer
+from .runner import SCENARIOS, run_scenario_subprocess
+from .sites import SyntheticSiteResource
+
+COLUMNS = (
+    ("spider", "{}"),
+    ("strategy", "{}"),
+    ("requests", "{}"),
+    ("items", "{}"),
+    ("requests_per_second", "{:.1f}"),
+    ("items_per_second", "{:.1f}"),
+    ("peak_rss", "{:.1f}"),
+    ("cpu_time", "{:.2f}"),
+)
+
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    header = [
+        "spider",
+        "strategy",
+        "requests",
+        "items",
+        "req/s",
+        "items/s",
+        "peak RSS (MiB)",
+        "CPU (s)",
+    ]
+    rows = [header]
+    for result in results:
+        result = {**result, "peak_rss": result["peak_rss"] / 2**20}
+        rows.append([fmt.format(result[key]) for key, fmt in COLUMNS])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows
+    ]
+    for result in results:
+        callbacks = ", ".join(
+            f"{name}={cpu_time:.3f}s"
+            for name, cpu_time in sorted(result["callback_cpu_time"].items())
+        )
+        lines.append(f"{result['spider']}/{result['strategy']} callbacks: {callbacks}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.benchmarks",
+        description="Crawl synthetic websites with the spider templates and "
+        "report their throughput.",
+    )
+    parser.add_argument(
+        "--spider",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Spider to benchmark. May be repeated. Defaults to all spiders.",
+    )
+    parser.add_argument(
+        "--strategy",
+        action="append",
+        help="Crawl strategy to benchmark. May be repeated. Defaults to all "
+        "the strategies of each spider.",
+    )
+    parser.add_argument("--categories", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--feeds", type=int, default=2)
+    parser.add_argument(
+        "-s",
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Scrapy setting to use in every crawl. Values are parsed as JSON "
+        "when possible. May be repeated.",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Output one JSON object per line."
+    )
+    args = parser.parse_args()
+
+    site_kwargs = {
+        "categories": args.categories,
+        "depth": args.depth,
+        "pages": args.pages,
+        "items": args.items,
+        "feeds": args.feeds,
+    }
+    settings: Dict[str, Any] = {}
+    for setting in args.set:
+        name, value = setting.split("=", 1)
+        try:
+            settings[name] = json.loads(value)
+        except ValueError:
+            settings[name] = value
+
+    results = []
+    with MockServer(SyntheticSiteResource, resource_kwargs=site_kwargs) as server:
+        for spider in args.spider or SCENARIOS:
+            for strategy in SCENARIOS[spider][2]:
+                if args.strategy and strategy not in args.strategy:
+                    continue
+                result = run_scenario_subprocess(
+                    spider, strategy, server.urljoin("/"), site_kwargs, settings
+                )
+                if args.json:
+                    print(json.dumps(result), flush=True)
+                results.append(result)
+    if not args.json:
+        print(format_table(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from subprocess import PIPE, run
+from typing import Any, AsyncIterable, Dict, Iterable, List, Optional, Tuple
+
+from scrapy import Spider, signals
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.http import Response
+from scrapy.utils.misc import load_object
+
+from ..utils import get_addons
+from .sites import ARTICLE_DOMAIN, ECOMMERCE_DOMAIN, JOB_POSTING_DOMAIN, SyntheticSite
+
+SCENARIOS: Dict[str, Tuple[str, str, List[str]]] = {
+    "ecommerce": (
+        "zyte_spider_templates.EcommerceSpider",
+        ECOMMERCE_DOMAIN,
+        ["automatic", "full", "navigation", "pagination_only", "direct_item"],
+    ),
+    "article": (
+        "zyte_spider_templates.ArticleSpider",
+        ARTICLE_DOMAIN,
+        ["full", "direct_item"],
+    ),
+    "job_posting": (
+        "zyte_spider_templates.JobPostingSpider",
+        JOB_POSTING_DOMAIN,
+        ["navigation", "direct_item"],
+    ),
+}
+
+
+class CallbackCPUTimeMiddleware:
+    """Spider middleware that measures the CPU time spent iterating the output
+    of each spider callback.
+
+    It must be the spider middleware closest to the spider, so that the time
+    of other spider middlewares is not included.
+    """
+
+    def __init__(self, crawler: Crawler):
+        self.cpu_time: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        self.stats = crawler.stats
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler)
+
+    def _callback_name(self, response: Response) -> str:
+        callback = response.request.callback if response.request else None
+        return getattr(callback, "__name__", "parse")
+
+    def process_spider_output(
+        self, response: Response, result: Iterable, spider: Spider
+    ) -> Iterable:
+        name = self._callback_name(response)
+        self.calls[name] += 1
+        iterator = iter(result)
+        while True:
+            start = time.process_time()
+            try:
+                item_or_request = next(iterator)
+            except StopIteration:
+                self.cpu_time[name] += time.process_time() - start
+                return
+            self.cpu_time[name] += time.process_time() - start
+            yield item_or_request
+
+    async def process_spider_output_async(
+        self, response: Response, result: AsyncIterable, spider: Spider
+    ) -> AsyncIterable:
+        name = self._callback_name(response)
+        self.calls[name] += 1
+        iterator = result.__aiter__()
+        while True:
+            start = time.process_time()
+            try:
+                item_or_request = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.cpu_time[name] += time.process_time() - start
+                return
+            self.cpu_time[name] += time.process_time() - start
+            yield item_or_request
+
+    def spider_closed(self, spider: Spider) -> None:
+        assert self.stats
+        for name, cpu_time in self.cpu_time.items():
+            self.stats.set_value(f"benchmark/callback_cpu_time/{name}", cpu_time)
+            self.stats.set_value(f"benchmark/callback_calls/{name}", self.calls[name])
+
+
+class CrawlTimer:
+    """Extension that records when the first request reaches the downloader
+    and when the last response is received.
+
+    The time between both is used to compute throughput, so that the
+    start-up time and the idle time before the spider closes are not taken
+    into account.
+    """
+
+    def __init__(self, crawler: Crawler):
+        self.first_request: Optional[float] = None
+        self.last_response: Optional[float] = None
+        crawler.signals.connect(
+            self.request_reached_downloader, signal=signals.request_reached_downloader
+        )
+        crawler.signals.connect(
+            self.response_received, signal=signals.response_received
+        )
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        self.stats = crawler.stats
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler)
+
+    def request_reached_downloader(self, request, spider) -> None:
+        if self.first_request is None:
+            self.first_request = time.perf_counter()
+
+    def response_received(self, response, request, spider) -> None:
+        self.last_response = time.perf_counter()
+
+    def spider_closed(self, spider: Spider) -> None:
+        assert self.stats
+        if self.first_request is not None and self.last_response is not None:
+            self.stats.set_value(
+                "benchmark/crawl_time", self.last_response - self.first_request
+            )
+
+
+def _peak_rss() -> int:
+    """Return the peak resident set size of the current process in bytes."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def get_spider_kwargs(
+    spider: str, strategy: str, site: SyntheticSite
+) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {"crawl_strategy": strategy, "max_requests": 10**9}
+    if strategy == "direct_item":
+        kwargs["urls"] = site.item_urls()
+    else:
+        kwargs["url"] = site.home_url
+    return kwargs
+
+
+def run_scenario(
+    spider: str,
+    strategy: str,
+    zyte_api_url: str,
+    site_kwargs: Dict[str, Any],
+    settings: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Crawl a synthetic website in the current process and return the
+    benchmark results.
+
+    As it starts the Twisted reactor, it can only be called once per process.
+    """
+    spider_path, domain, _ = SCENARIOS[spider]
+    site = SyntheticSite(domain, **site_kwargs)
+    spider_cls = load_object(spider_path)
+    process = CrawlerProcess(
+        {
+            "ZYTE_API_URL": zyte_api_url,
+            "ZYTE_API_KEY": "a",
+            "ADDONS": get_addons(),
+            "SPIDER_MIDDLEWARES": {CallbackCPUTimeMiddleware: 10000},
+            "EXTENSIONS": {CrawlTimer: 0},
+            "TWISTED_REACTOR": "twisted.internet.asyncioreactor.AsyncioSelectorReactor",
+            "LOG_FILE": os.devnull,
+            **(settings or {}),
+        }
+    )
+    crawler = process.create_crawler(spider_cls)
+    start_cpu = time.process_time()
+    process.crawl(crawler, **get_spider_kwargs(spider, strategy, site))
+    process.start()
+    cpu_time = time.process_time() - start_cpu
+
+    assert crawler.stats
+    stats = crawler.stats.get_stats()
+    requests = stats.get("downloader/request_count", 0)
+    items = stats.get("item_scraped_count", 0)
+    elapsed = stats.get("benchmark/crawl_time") or float("nan")
+    prefix = "benchmark/callback_cpu_time/"
+    return {
+        "spider": spider,
+        "strategy": strategy,
+        "requests": requests,
+        "items": items,
+        "site_items": len(site.item_urls()),
+        "elapsed": elapsed,
+        "cpu_time": cpu_time,
+        "requests_per_second": requests / elapsed,
+        "items_per_second": items / elapsed,
+        "peak_rss": _peak_rss(),
+        "callback_cpu_time": {
+            key[len(prefix) :]: value
+            for key, value in stats.items()
+            if key.startswith(prefix)
+        },
+    }
+
+
+def run_scenario_subprocess(
+    spider: str,
+    strategy: str,
+    zyte_api_url: str,
+    site_kwargs: Dict[str, Any],
+    settings: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Run :func:`run_scenario` in a new Python process, so that each scenario
+    gets its own reactor and its own peak RSS measurement."""
+    arguments = {
+        "spider": spider,
+        "strategy": strategy,
+        "zyte_api_url": zyte_api_url,
+        "site_kwargs": site_kwargs,
+        "settings": settings or {},
+    }
+    process = run(
+        [sys.executable, "-m", "tests.benchmarks.runner", json.dumps(arguments)],
+        stdout=PIPE,
+        check=True,
+    )
+    return json.loads(process.stdout.decode().strip().splitlines()[-1])
+
+
+def main():
+    result = run_scenario(**json.loads(sys.argv[1]))
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
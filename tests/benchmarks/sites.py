@@ -0,0 +1,244 @@
+import json
+from base64 import b64encode
+from itertools import product as cartesian_product
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from scrapy_zyte_api.responses import _API_RESPONSE
+
+from ..mockserver import DefaultResource
+
+ECOMMERCE_DOMAIN = "shop.example"
+ARTICLE_DOMAIN = "daily.example"
+JOB_POSTING_DOMAIN = "hiring.example"
+
+ITEM_PATHS = {
+    ECOMMERCE_DOMAIN: "product",
+    ARTICLE_DOMAIN: "story",
+    JOB_POSTING_DOMAIN: "job",
+}
+
+
+class SyntheticSite:
+    """Link structure shared by all synthetic websites.
+
+    Every website has a homepage with *categories* subcategories, each of
+    which has *categories* subcategories of its own, down to *depth* levels.
+    The homepage and every category are paginated into *pages* pages with
+    *items* item links each. Article websites also expose *feeds* RSS feeds on
+    their homepage, each listing the items of the first page of a top-level
+    category.
+
+    URLs look as follows::
+
+        https://<domain>/
+        https://<domain>/c/1/2
+        https://<domain>/c/1/2/page/3
+        https://<domain>/<item path>/1-2/3/4
+        https://<domain>/feed/1
+    """
+
+    def __init__(
+        self,
+        domain: str,
+        categories: int = 3,
+        depth: int = 2,
+        pages: int = 2,
+        items: int = 10,
+        feeds: int = 0,
+    ):
+        self.domain = domain
+        self.categories = categories
+        self.depth = depth
+        self.pages = pages
+        self.items = items
+        self.feeds = feeds
+        self.item_path = ITEM_PATHS[domain]
+
+    @property
+    def home_url(self) -> str:
+        return f"https://{self.domain}/"
+
+    def category_paths(self) -> Iterator[Tuple[int, ...]]:
+        for level in range(self.depth + 1):
+            yield from cartesian_product(range(1, self.categories + 1), repeat=level)
+
+    def category_url(self, path: Tuple[int, ...], page: int = 1) -> str:
+        url = f"https://{self.domain}/"
+        if path:
+            url += "c/" + "/".join(str(index) for index in path)
+        if page > 1:
+            url = url.rstrip("/") + f"/page/{page}"
+        return url
+
+    def item_url(self, path: Tuple[int, ...], page: int, index: int) -> str:
+        category = "-".join(str(i) for i in path) or "0"
+        return f"https://{self.domain}/{self.item_path}/{category}/{page}/{index}"
+
+    def feed_url(self, index: int) -> str:
+        return f"https://{self.domain}/feed/{index}"
+
+    def item_urls(self) -> List[str]:
+        return [
+            self.item_url(path, page, index)
+            for path in self.category_paths()
+            for page in range(1, self.pages + 1)
+            for index in range(1, self.items + 1)
+        ]
+
+    def parse_url(self, url: str) -> Tuple[str, Optional[Tuple[int, ...]], int]:
+        """Return the page type (``"category"``, ``"item"``, ``"feed"`` or
+        ``"other"``), the category path and the page number of *url*."""
+        parts = [part for part in urlparse(url).path.split("/") if part]
+        if not parts:
+            return "category", (), 1
+        if parts[0] == "c":
+            page = 1
+            if len(parts) >= 3 and parts[-2] == "page":
+                page = int(parts[-1])
+                parts = parts[:-2]
+            path = tuple(int(part) for part in parts[1:])
+            if (
+                len(path) > self.depth
+                or page > self.pages
+                or any(not 1 <= index <= self.categories for index in path)
+            ):
+                return "other", None, 1
+            return "category", path, page
+        if parts[0] == "page" and len(parts) == 2:
+            return "category", (), int(parts[1])
+        if parts[0] == self.item_path:
+            return "item", None, 1
+        if parts[0] == "feed" and len(parts) == 2:
+            index = int(parts[1])
+            return "feed", ((index - 1) % self.categories + 1,), 1
+        return "other", None, 1
+
+    def navigation(self, url: str) -> Dict[str, Any]:
+        page_type, path, page = self.parse_url(url)
+        navigation: Dict[str, Any] = {"url": url}
+        if page_type != "category":
+            return navigation
+        assert path is not None
+        navigation["items"] = [
+            {"url": self.item_url(path, page, index)}
+            for index in range(1, self.items + 1)
+        ]
+        if page < self.pages:
+            navigation["nextPage"] = {"url": self.category_url(path, page + 1)}
+        if page == 1 and len(path) < self.depth:
+            navigation["subCategories"] = [
+                {"url": self.category_url(path + (index,))}
+                for index in range(1, self.categories + 1)
+            ]
+        return navigation
+
+    def html(self, url: str) -> str:
+        navigation = self.navigation(url)
+        links = [
+            link["url"]
+            for key in ("subCategories", "items")
+            for link in navigation.get(key, [])
+        ]
+        if "nextPage" in navigation:
+            links.append(navigation["nextPage"]["url"])
+        head = ""
+        if url == self.home_url:
+            head = "".join(
+                f'<link rel="alternate" type="application/rss+xml" '
+                f'href="{self.feed_url(index)}">'
+                for index in range(1, self.feeds + 1)
+            )
+        anchors = "".join(
+            f'<a href="{link}">Link {number}</a>'
+            for number, link in enumerate(links, start=1)
+        )
+        return (
+            f"<html><head><title>{url}</title>{head}</head>"
+            f"<body>{anchors}</body></html>"
+        )
+
+    def feed(self, url: str) -> str:
+        _, path, _ = self.parse_url(url)
+        assert path is not None
+        entries = "".join(
+            f"<item><title>Item {index}</title>"
+            f"<link>{self.item_url(path, 1, index)}</link></item>"
+            for index in range(1, self.items + 1)
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<rss version="2.0"><channel><title>{url}</title>'
+            f"<link>{self.home_url}</link>{entries}</channel></rss>"
+        )
+
+    def item(self, url: str) -> Dict[str, Any]:
+        page_type, _, _ = self.parse_url(url)
+        probability = 1.0 if page_type == "item" else 0.01
+        return {
+            "url": url,
+            "name": url,
+            "headline": url,
+            "jobTitle": url,
+            "metadata": {"probability": probability},
+        }
+
+
+class SyntheticSiteResource(DefaultResource):
+    """Mock Zyte API serving :class:`SyntheticSite` websites.
+
+    Requests for the ``shop.example``, ``daily.example`` and
+    ``hiring.example`` domains are answered from synthetic e-commerce, article
+    and job posting websites respectively, with every constructor parameter
+    forwarded to :class:`SyntheticSite`. Requests for other URLs are handled
+    by :class:`~tests.mockserver.DefaultResource`.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__()
+        self.sites = {
+            domain: SyntheticSite(domain, **kwargs)
+            for domain in (ECOMMERCE_DOMAIN, ARTICLE_DOMAIN, JOB_POSTING_DOMAIN)
+        }
+
+    def render_POST(self, request):
+        request_data = json.loads(request.content.read())
+        site = self.sites.get(urlparse(request_data["url"]).netloc)
+        if site is None:
+            request.content.seek(0)
+            return super().render_POST(request)
+
+        request.responseHeaders.setRawHeaders(b"Content-Type", [b"application/json"])
+        request.responseHeaders.setRawHeaders(b"request-id", [b"abcd1234"])
+        url = request_data["url"]
+        response_data: _API_RESPONSE = {"url": url}
+
+        if request_data.get("browserHtml") is True:
+            response_data["browserHtml"] = site.html(url)
+        if request_data.get("httpResponseBody") is True:
+            page_type, _, _ = site.parse_url(url)
+            if page_type == "feed":
+                body, content_type = site.feed(url), "application/rss+xml"
+            else:
+                body, content_type = site.html(url), "text/html; charset=utf-8"
+            response_data["httpResponseBody"] = b64encode(body.encode()).decode()
+            response_data["httpResponseHeaders"] = [
+                {"name": "Content-Type", "value": content_type}
+            ]
+        for key in ("product", "article", "jobPosting"):
+            if request_data.get(key) is True:
+                response_data[key] = site.item(url)
+        if request_data.get("productList") is True:
+            response_data["productList"] = {
+                "url": url,
+                "products": site.navigation(url).get("items", []),
+            }
+        for key in (
+            "productNavigation",
+            "articleNavigation",
+            "jobPostingNavigation",
+        ):
+            if request_data.get(key) is True:
+                response_data[key] = site.navigation(url)
+
+        return json.dumps(response_data).encode()
@@ -1,7 +1,9 @@
 from asyncio import ensure_future
-from unittest.mock import MagicMock, patch
+from time import time
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from scrapy import Request, signals
 from scrapy.statscollectors import StatsCollector
 from scrapy.utils.request import RequestFingerprinter
 from twisted.internet.defer import Deferred, inlineCallbacks
@@ -11,9 +13,20 @@ from zyte_spider_templates._incremental.manager import CollectionsFingerprintsMa
 from zyte_spider_templates.spiders.article import ArticleSpider
 
 
+def get_setting(name, default=None):
+    if name.startswith("INCREMENTAL_CRAWL_"):
+        return default
+    return MagicMock()
+
+
 @pytest.fixture
 def mock_crawler():
-    return MagicMock()
+    crawler = MagicMock()
+    # Incremental crawl settings other than the batch size use their defaults.
+    crawler.settings.getfloat.return_value = 0.0
+    crawler.settings.getbool.return_value = False
+    crawler.settings.get.side_effect = get_setting
+    return crawler
 
 
 def crawler_for_incremental():
@@ -48,6 +61,7 @@ def crawler_for_incremental():
 @inlineCallbacks
 def test_get_existing_fingerprints(
     mock_scrapinghub_client,
+    mock_crawler,
     batch_size,
     fingerprints,
     keys_in_collection,
@@ -63,7 +77,6 @@ def test_get_existing_fingerprints(
         mock_collection
     )
 
-    mock_crawler = MagicMock()
     mock_crawler.settings.getint.return_value = batch_size
 
     mock_manager = CollectionsFingerprintsManager(mock_crawler)
@@ -84,7 +97,9 @@ def test_get_existing_fingerprints(
     ],
 )
 @patch("scrapinghub.ScrapinghubClient")
-def test_get_keys_from_collection(mock_crawler, fingerprints, expected_keys):
+def test_get_keys_from_collection(
+    mock_scrapinghub_client, mock_crawler, fingerprints, expected_keys
+):
     mock_collection = MagicMock()
     mock_collection.list.return_value = [
         {"_key": key, "value": {}} for key in expected_keys
@@ -105,8 +120,11 @@ def test_get_keys_from_collection(mock_crawler, fingerprints, expected_keys):
         ([], []),
     ],
 )
+@patch("zyte_spider_templates._incremental.manager.time", return_value=1700000000.5)
 @patch("scrapinghub.ScrapinghubClient")
-def test_save_to_collection(mock_crawler, keys, expected_items_written):
+def test_save_to_collection(
+    mock_scrapinghub_client, mock_time, mock_crawler, keys, expected_items_written
+):
     mock_writer = MagicMock()
     mock_writer.write.return_value = expected_items_written
     mock_crawler.settings.getint.return_value = 50
@@ -114,7 +132,7 @@ def test_save_to_collection(mock_crawler, keys, expected_items_written):
     manager.writer = mock_writer  # type: ignore
     manager.save_to_collection(keys)
     mock_writer.write.assert_called_once_with(
-        [{"_key": key, "value": value} for key, value in keys]
+        [{"_key": key, "value": value, "t": 1700000000} for key, value in keys]
     )
 
 
@@ -207,3 +225,277 @@ def test_spider_closed(mock_scrapinghub_client):
     fp_manager.save_batch = MagicMock(side_effect=fp_manager.save_batch)  # type: ignore
     fp_manager.spider_closed()
     fp_manager.save_batch.assert_called_once()
+
+
+@patch("scrapinghub.ScrapinghubClient")
+def test_prefetch(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    mock_collection = MagicMock()
+    mock_collection.iter.return_value = [{"_key": "abcd1", "value": "url1"}]
+    fp_manager.collection = mock_collection  # type: ignore
+    fp_manager.prefetch(["abcd"])
+    mock_collection.iter.assert_called_once_with(prefix="abcd")
+    assert fp_manager.prefetched_prefixes == {"abcd"}
+    assert fp_manager._may_be_stored("abcd1")
+    assert not fp_manager._may_be_stored("abcd2")
+    assert fp_manager._may_be_stored("ef012")
+
+
+@patch("scrapinghub.ScrapinghubClient")
+def test_background_writes(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_BATCH_SIZE", 2)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    assert fp_manager.background_writer is not None
+    mock_writer = MagicMock()
+    fp_manager.writer = mock_writer  # type: ignore
+    fp_manager.add_to_batch({("fp1", "url1"), ("fp2", "url2"), ("fp3", "url3")})
+    assert len(fp_manager.batch) == 1
+    fp_manager.spider_closed()
+    assert fp_manager.batch == set()
+    written = [
+        item for call in mock_writer.write.call_args_list for item in call.args[0]
+    ]
+    assert sorted(item["_key"] for item in written) == ["fp1", "fp2", "fp3"]
+    assert mock_writer.flush.call_count == 2
+
+
+@patch("zyte_spider_templates._incremental.manager.time", return_value=1700000000)
+@patch("scrapinghub.ScrapinghubClient")
+def test_synchronous_writes(mock_scrapinghub_client, mock_time):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_WRITE_QUEUE_SIZE", 0)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    assert fp_manager.background_writer is None
+    mock_writer = MagicMock()
+    fp_manager.writer = mock_writer  # type: ignore
+    fp_manager.add_to_batch({("fp1", "url1")})
+    fp_manager.save_batch()
+    mock_writer.write.assert_called_once_with(
+        [{"_key": "fp1", "value": "url1", "t": 1700000000}]
+    )
+
+
+@patch("zyte_spider_templates._incremental.manager.time", return_value=1700000000)
+@patch("scrapinghub.ScrapinghubClient")
+def test_compact_writes(mock_scrapinghub_client, mock_time):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_WRITE_QUEUE_SIZE", 0)
+    crawler.settings.set("INCREMENTAL_CRAWL_KEY_FORMAT", "compact")
+    crawler.settings.set("INCREMENTAL_CRAWL_STORE_URLS", False)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    mock_writer = MagicMock()
+    fp_manager.writer = mock_writer  # type: ignore
+    fp_manager.add_to_batch({("c35d" + "00ff" * 10, "url1")})
+    fp_manager.save_batch()
+    mock_writer.write.assert_called_once_with(
+        [{"_key": "c35dAP8A_wD_AP8A_wD_", "t": 1700000000}]
+    )
+
+
+@patch("scrapinghub.ScrapinghubClient")
+def test_flush_interval(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_FLUSH_INTERVAL", 5)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    fp_manager.spider_opened()
+    assert fp_manager._flush_task is not None
+    assert fp_manager._flush_task.running
+    assert fp_manager._flush_task.interval == 5
+    fp_manager.spider_closed()
+    assert not fp_manager._flush_task.running
+
+    crawler.settings.set("INCREMENTAL_CRAWL_FLUSH_INTERVAL", 0)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    fp_manager.spider_opened()
+    assert fp_manager._flush_task is None
+
+
+@patch("scrapinghub.ScrapinghubClient")
+def test_executor(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_MAX_WORKERS", 3)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    assert fp_manager._executor is None
+    executor = fp_manager.executor
+    assert executor._max_workers == 3
+    assert fp_manager.executor is executor
+    assert CollectionsFingerprintsManager(crawler).executor is not executor
+    fp_manager.close()
+    assert fp_manager._executor is None
+    assert executor._shutdown
+
+
+@patch("scrapinghub.ScrapinghubClient")
+@inlineCallbacks
+def test_lookup_latency_stats(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    fp_manager.get_keys_from_collection = MagicMock(return_value={"fp1"})  # type: ignore
+    r = yield Deferred.fromFuture(
+        ensure_future(fp_manager.get_keys_async({"fp1", "fp2"}))
+    )
+    assert r == {"fp1"}
+    assert "incremental_crawling/lookup_latency/execution/count" not in (
+        crawler.stats.get_stats()
+    )
+    fp_manager.spider_closed()
+    stats = crawler.stats.get_stats()
+    assert stats["incremental_crawling/lookup_latency/queue_wait/count"] == 1
+    assert stats["incremental_crawling/lookup_latency/execution/count"] == 1
+    assert "incremental_crawling/lookup_latency/execution/p99" in stats
+
+
+@patch("scrapinghub.ScrapinghubClient")
+@inlineCallbacks
+def test_get_keys_from_collection_async(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    fp_manager.get_keys_from_collection = MagicMock(return_value={"fp1"})  # type: ignore
+    with pytest.warns(DeprecationWarning, match="use get_keys_async"):
+        r = yield Deferred.fromFuture(
+            ensure_future(fp_manager.get_keys_from_collection_async({"fp1", "fp2"}))
+        )
+    assert r == {"fp1"}
+
+
+class _Response:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def text(self):
+        return '{"_key": "fp1", "value": "url1"}\n'
+
+
+@patch("scrapinghub.ScrapinghubClient")
+@inlineCallbacks
+def test_aiohttp_lookups(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_AIOHTTP_ENABLED", True)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    fp_manager.get_keys_from_collection = MagicMock()  # type: ignore
+    session = MagicMock()
+    session.get.return_value = _Response()
+    fp_manager._http_session = session  # type: ignore[assignment]
+    r = yield Deferred.fromFuture(
+        ensure_future(fp_manager.get_keys_async({"fp1", "fp2"}))
+    )
+    assert r == {"fp1"}
+    session.get.assert_called_once_with(
+        fp_manager.api_url,
+        params=[("key", "fp1"), ("key", "fp2"), ("meta", "_key")],
+    )
+    fp_manager.get_keys_from_collection.assert_not_called()
+    assert fp_manager._executor is None
+    assert fp_manager.lookup_execution.count == 1
+    assert fp_manager.lookup_queue_wait.count == 0
+
+    # The session is closed before the spider closed signal handling ends.
+    session.close = AsyncMock()
+    yield crawler.signals.send_catch_log_deferred(
+        signals.spider_closed, spider=crawler.spider
+    )
+    session.close.assert_awaited_once()
+    assert fp_manager._http_session is None
+
+
+@pytest.mark.parametrize(
+    "settings, expected",
+    [
+        ({}, {"fp1", "fp2", "fp3"}),
+        # Entries saved without timestamps do not expire.
+        ({"INCREMENTAL_CRAWL_RECRAWL_TTL": 3600}, {"fp1", "fp3"}),
+        # Per page type TTLs override the global TTL.
+        (
+            {
+                "INCREMENTAL_CRAWL_RECRAWL_TTL": 3600,
+                "INCREMENTAL_CRAWL_RECRAWL_TTL_PER_PAGE_TYPE": {"product": 86400},
+            },
+            {"fp1", "fp2", "fp3"},
+        ),
+        (
+            {"INCREMENTAL_CRAWL_RECRAWL_TTL_PER_PAGE_TYPE": {"product": 60}},
+            {"fp3"},
+        ),
+    ],
+)
+@patch("scrapinghub.ScrapinghubClient")
+@inlineCallbacks
+def test_recrawl_ttl(mock_scrapinghub_client, settings, expected):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_LOOKUP_CACHE_SIZE", 0)
+    for name, value in settings.items():
+        crawler.settings.set(name, value)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    mock_collection = MagicMock()
+    mock_collection.list.return_value = [
+        {"_key": "fp1", "value": "url1", "t": int(time()) - 600},
+        {"_key": "fp2", "value": "url2", "t": int(time()) - 7200},
+        # Saved before timestamps were stored.
+        {"_key": "fp3", "value": "url3"},
+    ]
+    fp_manager.collection = mock_collection  # type: ignore
+    fp_manager.get_keys_from_collection = MagicMock(  # type: ignore
+        return_value={"fp1", "fp2", "fp3"}
+    )
+    product = Request(
+        "https://example.com", meta={"crawling_logs": {"page_type": "product"}}
+    )
+    ttls = (
+        {fp: fp_manager.get_recrawl_ttl(product) for fp in ("fp1", "fp2")}
+        if fp_manager.recrawl_ttl_per_page_type
+        else None
+    )
+    r = yield Deferred.fromFuture(
+        ensure_future(
+            fp_manager.get_existing_fingerprints_async(["fp1", "fp2", "fp3"], ttls)
+        )
+    )
+    assert r == expected
+    if settings:
+        assert crawler.stats.get_value(
+            "incremental_crawling/expired_fingerprints", 0
+        ) == 3 - len(expected)
+
+
+@patch("scrapinghub.ScrapinghubClient")
+@inlineCallbacks
+def test_recrawl_ttl_lookup_cache(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_RECRAWL_TTL", 3600)
+    crawler.settings.set(
+        "INCREMENTAL_CRAWL_RECRAWL_TTL_PER_PAGE_TYPE", {"product": 86400}
+    )
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    mock_collection = MagicMock()
+    mock_collection.list.return_value = [
+        {"_key": "fp1", "value": "url1", "t": int(time()) - 7200},
+    ]
+    fp_manager.collection = mock_collection  # type: ignore
+    fp_manager.get_keys_from_collection = MagicMock(  # type: ignore
+        return_value={"fp1"}
+    )
+
+    def lookup(ttl):
+        return Deferred.fromFuture(
+            ensure_future(
+                fp_manager.get_existing_fingerprints_async(["fp1"], {"fp1": ttl})
+            )
+        )
+
+    # A cached hit for the product TTL is not a hit for the default TTL.
+    assert (yield lookup(86400)) == {"fp1"}
+    assert (yield lookup(3600)) == set()
+    assert (yield lookup(86400)) == {"fp1"}
+    assert mock_collection.list.call_count == 2
+    assert fp_manager.lookup_cache
+    assert fp_manager.lookup_cache.hits == 1
+
+    # Saved fingerprints are hits for every TTL.
+    fp_manager.add_to_batch({("fp1", "url1")})
+    assert (yield lookup(3600)) == {"fp1"}
+    assert mock_collection.list.call_count == 2
@@ -4,15 +4,16 @@ import pytest
 from pytest_twisted import ensureDeferred
 from scrapy.statscollectors import StatsCollector
 from scrapy.utils.request import RequestFingerprinter
-from zyte_common_items import Article
+from zyte_common_items import Article, JobPosting, Product, ProductList
 
 from tests import get_crawler
-from zyte_spider_templates import ArticleSpider
+from zyte_spider_templates import ArticleSpider, EcommerceSpider
 from zyte_spider_templates._incremental.manager import (
     CollectionsFingerprintsManager,
     IncrementalCrawlingManager,
     Request,
 )
+from zyte_spider_templates.utils import get_request_fingerprint
 
 
 def crawler_for_incremental():
@@ -309,6 +310,72 @@ async def test_process_incremental_several_items(
         await manager.process_incremental_async(input_request, input_result.copy())
 
 
+@patch("scrapinghub.ScrapinghubClient")
+@ensureDeferred
+async def test_process_incremental_stream(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_BATCH_SIZE", 2)
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    manager = IncrementalCrawlingManager(crawler, fp_manager)
+    seen_request = Request(url="https://example.com/article2.html")
+    # Not in the batch, which is saved once the item fills it.
+    assert fp_manager.lookup_cache is not None
+    fp_manager.lookup_cache.add_hit(get_request_fingerprint(crawler, seen_request))
+
+    input_request = Request(url="https://example.com/article.html")
+    received = []
+
+    async def result():
+        for element in [
+            Request(url="https://example.com/article1.html"),
+            Article(url="https://example.com/article.html"),
+            seen_request,
+            Request(url="https://example.com/article3.html"),
+        ]:
+            received.append(element)
+            yield element
+
+    processed = []
+    async for element in manager.process_incremental_stream(input_request, result()):
+        processed.append((element.url, len(received)))  # type: ignore[union-attr]
+
+    assert processed == [
+        # Items that need no lookup are not held back.
+        ("https://example.com/article.html", 2),
+        ("https://example.com/article1.html", 3),
+        ("https://example.com/article3.html", 4),
+    ]
+    stats = crawler.stats.get_stats()
+    assert stats["incremental_crawling/requests_to_check"] == 3
+    assert stats["incremental_crawling/filtered_items_and_requests"] == 1
+
+
+@patch("scrapinghub.ScrapinghubClient")
+@ensureDeferred
+async def test_process_incremental_stream_seen_item(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    manager = IncrementalCrawlingManager(crawler, fp_manager)
+    input_request = Request(url="https://example.com/article.html")
+    fp_manager.batch = {
+        (
+            get_request_fingerprint(
+                crawler, input_request, "https://example.com/article1.html"
+            ),
+            "https://example.com/article1.html",
+        )
+    }
+
+    async def result():
+        yield Article(url="https://example.com/article1.html")
+
+    processed = [
+        element
+        async for element in manager.process_incremental_stream(input_request, result())
+    ]
+    assert processed == []
+
+
 @patch("scrapinghub.ScrapinghubClient")
 @pytest.mark.parametrize(
     "request_url, item, expected",
@@ -357,6 +424,14 @@ async def test_process_incremental_several_items(
                 "https://example.com/article2.html": "canonicalUrl",
             },
         ),
+        (
+            "https://example.com/job.html",
+            JobPosting(url="https://example.com/job1.html"),
+            {
+                "https://example.com/job.html": "request_url",
+                "https://example.com/job1.html": "url",
+            },
+        ),  # No canonicalUrl field
     ],
 )
 def test_get_unique_urls(mock_scrapinghub_client, request_url, item, expected):
@@ -365,3 +440,70 @@ def test_get_unique_urls(mock_scrapinghub_client, request_url, item, expected):
     fp_manager = CollectionsFingerprintsManager(crawler)
     manager = IncrementalCrawlingManager(crawler, fp_manager)
     assert manager._get_unique_urls(request_url, item) == expected
+
+
+@patch("scrapinghub.ScrapinghubClient")
+@ensureDeferred
+async def test_process_incremental_item_type(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    crawler.spider = EcommerceSpider.from_crawler(
+        crawler, url="https://example.com", incremental=True
+    )
+    fp_manager = CollectionsFingerprintsManager(crawler)
+    manager = IncrementalCrawlingManager(crawler, fp_manager)
+    assert manager.item_type == "product"
+
+    meta = {"incremental_item_type": "product"}
+    seen_request = Request(url="https://example.com/product1.html", meta=meta)
+    seen_fingerprint = manager._get_fingerprint(seen_request)
+    assert seen_fingerprint != get_request_fingerprint(crawler, seen_request)
+    assert seen_fingerprint[:4] == get_request_fingerprint(crawler, seen_request)[:4]
+    fp_manager.batch = {(seen_fingerprint, seen_request.url)}
+
+    input_request = Request(url="https://example.com/product.html", meta=meta)
+    input_result = [
+        seen_request,
+        # Not a product request, so not checked even if its URL was seen.
+        Request(url="https://example.com/product1.html"),
+        Request(url="https://example.com/product2.html", meta=meta),
+        {
+            "product": Product(
+                url="https://example.com/product.html",
+                canonicalUrl="https://example.com/product-canonical.html",
+            ),
+            "customAttributes": None,
+        },
+    ]
+    processed_result = await manager.process_incremental_async(
+        input_request, input_result.copy()
+    )
+    assert processed_result == input_result[1:]
+    assert crawler.stats.get_value("incremental_crawling/requests_to_check") == 2
+    assert {url for _, url in fp_manager.batch} == {
+        "https://example.com/product1.html",
+        "https://example.com/product.html",
+        "https://example.com/product-canonical.html",
+    }
+
+    # Items of other pages, e.g. product lists of navigation pages, are not
+    # recorded as products.
+    navigation_request = Request(url="https://example.com/category.html")
+    product_list = ProductList(url="https://example.com/category.html")
+    processed_result = await manager.process_incremental_async(
+        navigation_request, [product_list]
+    )
+    assert processed_result == [product_list]
+
+    async def result():
+        yield product_list
+
+    streamed = [
+        element
+        async for element in manager.process_incremental_stream(
+            navigation_request, result()
+        )
+    ]
+    assert streamed == [product_list]
+    assert "https://example.com/category.html" not in {
+        url for _, url in fp_manager.batch
+    }
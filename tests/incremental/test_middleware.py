@@ -10,7 +10,10 @@ from scrapy.utils.request import RequestFingerprinter
 
 from tests import get_crawler
 from zyte_spider_templates import IncrementalCrawlMiddleware
-from zyte_spider_templates._incremental.manager import IncrementalCrawlingManager
+from zyte_spider_templates._incremental.manager import (
+    IncrementalCrawlingManager,
+    SQLiteFingerprintsManager,
+)
 from zyte_spider_templates.spiders.article import ArticleSpider
 
 
@@ -87,3 +90,53 @@ async def test_middleware_process_spider_output(mock_scrapinghub_client):
 
     for res_ex, res_proc in zip(input_result, processed_result_list):
         assert res_ex == res_proc
+
+
+@patch("scrapinghub.ScrapinghubClient")
+@ensureDeferred
+async def test_middleware_process_spider_output_streaming(mock_scrapinghub_client):
+    crawler = crawler_for_incremental()
+    crawler.spider.settings = Settings({"INCREMENTAL_CRAWL_ENABLED": True})
+    crawler.settings.set("INCREMENTAL_CRAWL_STREAMING_ENABLED", True)
+
+    middleware = IncrementalCrawlMiddleware(crawler)
+    assert middleware.streaming_enabled
+    request = Request(url=crawler.spider.url)
+    response = Response(url=crawler.spider.url, request=request)
+    input_result = [
+        Request(url="https://example.com/1"),
+        Request(url="https://example.com/2"),
+        Request(url="https://example.com/3"),
+    ]
+
+    async def async_generator():
+        for item in input_result:
+            yield item
+
+    processed_result_list = [
+        processed_item
+        async for processed_item in middleware.process_spider_output(
+            response, async_generator(), crawler.spider
+        )
+    ]
+    assert [r.url for r in processed_result_list] == [  # type: ignore[union-attr]
+        r.url for r in input_result
+    ]
+
+
+def test_prepare_manager_with_sqlite(tmp_path):
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_STORAGE", "sqlite")
+    crawler.settings.set("INCREMENTAL_CRAWL_SQLITE_PATH", str(tmp_path / "fp.sqlite3"))
+
+    manager = IncrementalCrawlMiddleware.prepare_incremental_manager(crawler)
+    assert isinstance(manager.fm, SQLiteFingerprintsManager)
+    manager.fm.close()
+
+
+def test_prepare_manager_invalid_storage():
+    crawler = crawler_for_incremental()
+    crawler.settings.set("INCREMENTAL_CRAWL_STORAGE", "foo")
+
+    with pytest.raises(ValueError, match="Unsupported INCREMENTAL_CRAWL_STORAGE"):
+        IncrementalCrawlMiddleware.prepare_incremental_manager(crawler)
@@ -0,0 +1,36 @@
+import os
+
+from zyte_spider_templates._incremental.spool import FingerprintSpool
+
+
+def test_append_and_replay(tmp_path):
+    path = str(tmp_path / "fingerprints.spool")
+    spool = FingerprintSpool(path, sync_size=2)
+    assert spool.replay() == []
+    spool.append([("fp1", "url1")])
+    assert spool._unsynced == 1
+    spool.append([("fp2", "url2")])
+    assert spool._unsynced == 0
+    # Entries can be replayed even if the spool is not closed, e.g. after a
+    # crash.
+    assert FingerprintSpool(path).replay() == [("fp1", "url1"), ("fp2", "url2")]
+    spool.close()
+
+
+def test_replay_truncated(tmp_path):
+    path = tmp_path / "fingerprints.spool"
+    path.write_text('["fp1", "url1"]\n["fp2", "ur')
+    assert FingerprintSpool(str(path)).replay() == [("fp1", "url1")]
+
+
+def test_reset(tmp_path):
+    path = str(tmp_path / "fingerprints.spool")
+    spool = FingerprintSpool(path)
+    spool.append([("fp1", "url1"), ("fp2", "url2")])
+    spool.reset([("fp2", "url2")])
+    assert spool.replay() == [("fp2", "url2")]
+    spool.append([("fp3", "url3")])
+    assert spool.replay() == [("fp2", "url2"), ("fp3", "url3")]
+    spool.reset()
+    assert not os.path.exists(path)
+    assert spool.replay() == []
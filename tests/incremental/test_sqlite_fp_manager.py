@@ -0,0 +1,294 @@
+import sqlite3
+from asyncio import ensure_future, gather
+from time import time
+from unittest.mock import MagicMock
+
+import pytest
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.request import RequestFingerprinter
+from twisted.internet.defer import Deferred, inlineCallbacks
+
+from tests import get_crawler
+from zyte_spider_templates._incremental.manager import SQLiteFingerprintsManager
+from zyte_spider_templates.spiders.article import ArticleSpider
+from zyte_spider_templates.utils import get_compact_fingerprint, get_domain_fingerprint
+
+
+def crawler_for_incremental(path, batch_size=50):
+    url = "https://example.com"
+    crawler = get_crawler(
+        settings={
+            "INCREMENTAL_CRAWL_BATCH_SIZE": batch_size,
+            "INCREMENTAL_CRAWL_SQLITE_PATH": str(path),
+        }
+    )
+    crawler.request_fingerprinter = RequestFingerprinter()
+    crawler.stats = StatsCollector(crawler)
+    crawler.spider = ArticleSpider.from_crawler(crawler, url=url)
+    return crawler
+
+
+def test_save_and_get_keys(tmp_path):
+    path = tmp_path / "fingerprints.sqlite3"
+    fp_manager = SQLiteFingerprintsManager(crawler_for_incremental(path, 2))
+    fp_manager.add_to_batch({("fp1", "url1"), ("fp2", "url2"), ("fp3", "url3")})
+    assert len(fp_manager.batch) == 1
+    assert fp_manager.get_keys({"fp1", "fp2", "fp3", "fp4"}) | {
+        fp for fp, _ in fp_manager.batch
+    } == {"fp1", "fp2", "fp3"}
+    fp_manager.spider_closed()
+
+    # Fingerprints persist across crawls.
+    fp_manager = SQLiteFingerprintsManager(crawler_for_incremental(path))
+    assert fp_manager.get_keys({"fp1", "fp2", "fp3", "fp4"}) == {"fp1", "fp2", "fp3"}
+    assert fp_manager.connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    fp_manager.close()
+
+
+def test_get_keys_many(tmp_path):
+    fp_manager = SQLiteFingerprintsManager(
+        crawler_for_incremental(tmp_path / "fingerprints.sqlite3")
+    )
+    fp_manager.save_items((f"fp{i}", f"url{i}") for i in range(0, 2000, 2))
+    assert fp_manager.get_keys({f"fp{i}" for i in range(2000)}) == {
+        f"fp{i}" for i in range(0, 2000, 2)
+    }
+    fp_manager.close()
+
+
+@pytest.mark.parametrize("batch_size", [50, 2])
+@inlineCallbacks
+def test_get_existing_fingerprints(tmp_path, batch_size):
+    fp_manager = SQLiteFingerprintsManager(
+        crawler_for_incremental(tmp_path / "fingerprints.sqlite3", batch_size)
+    )
+    fp_manager.save_items([("fp1", "url1"), ("fp2", "url2")])
+    fp_manager.batch = {("fp3", "url3")}
+    result = yield Deferred.fromFuture(
+        ensure_future(
+            fp_manager.get_existing_fingerprints_async(["fp1", "fp2", "fp3", "fp4"])
+        )
+    )
+    assert result == {"fp1", "fp2", "fp3"}
+    fp_manager.close()
+
+
+def test_default_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    crawler = crawler_for_incremental("")
+    crawler.settings.set("INCREMENTAL_CRAWL_COLLECTION_NAME", "articles")
+    fp_manager = SQLiteFingerprintsManager(crawler)
+    assert fp_manager.path == "articles.sqlite3"
+    fp_manager.close()
+    assert (tmp_path / "articles.sqlite3").exists()
+
+
+@inlineCallbacks
+def test_prefetch(tmp_path):
+    crawler = crawler_for_incremental(tmp_path / "fingerprints.sqlite3")
+    crawler.settings.set("INCREMENTAL_CRAWL_LOOKUP_CACHE_SIZE", 0)
+    crawler.spider.start_urls = ["https://example.com"]
+    fp_manager = SQLiteFingerprintsManager(crawler)
+    prefix = get_domain_fingerprint("https://example.com")
+    other_prefix = get_domain_fingerprint("https://other.example")
+    stored = [prefix + "a" * 40, other_prefix + "b" * 40]
+    fp_manager.save_items([(fp, "url") for fp in stored])
+    fp_manager.get_keys = MagicMock(side_effect=fp_manager.get_keys)  # type: ignore
+
+    fp_manager.prefetch_seed_domains()
+    assert fp_manager.prefetched_prefixes == {prefix}
+    assert crawler.stats.get_value("incremental_crawling/prefetched_fingerprints") == 1
+
+    new = [prefix + "c" * 40, other_prefix + "d" * 40]
+    result = yield Deferred.fromFuture(
+        ensure_future(fp_manager.get_existing_fingerprints_async(stored + new))
+    )
+    assert result == set(stored)
+    # The new fingerprint of a prefetched domain is not looked up.
+    fp_manager.get_keys.assert_called_once_with({*stored, new[1]})
+    assert crawler.stats.get_value("incremental_crawling/prefetch_skipped_lookups") == 1
+
+    # Saved fingerprints are added to the filter.
+    fp_manager.add_to_batch({(new[0], "url")})
+    fp_manager.save_batch()
+    fp_manager.get_keys.reset_mock()
+    result = yield Deferred.fromFuture(
+        ensure_future(fp_manager.get_existing_fingerprints_async([new[0]]))
+    )
+    assert result == {new[0]}
+    fp_manager.get_keys.assert_called_once_with({new[0]})
+    fp_manager.close()
+
+
+@pytest.mark.parametrize(
+    "max_keys,lookups,windows",
+    ((500, 1, 1), (3, 2, 2)),
+)
+@inlineCallbacks
+def test_coalesced_lookups(tmp_path, max_keys, lookups, windows):
+    crawler = crawler_for_incremental(tmp_path / "fingerprints.sqlite3")
+    crawler.settings.set("INCREMENTAL_CRAWL_LOOKUP_WINDOW", 0.05)
+    crawler.settings.set("INCREMENTAL_CRAWL_LOOKUP_WINDOW_MAX_KEYS", max_keys)
+    fp_manager = SQLiteFingerprintsManager(crawler)
+    fp_manager.save_items([("fp1", "url1"), ("fp3", "url3")])
+    fp_manager.get_keys = MagicMock(side_effect=fp_manager.get_keys)  # type: ignore
+
+    results = yield Deferred.fromFuture(
+        ensure_future(
+            gather(
+                fp_manager.get_existing_fingerprints_async(["fp1", "fp2"]),
+                fp_manager.get_existing_fingerprints_async(["fp2", "fp3"]),
+                fp_manager.get_existing_fingerprints_async(["fp3", "fp4"]),
+            )
+        )
+    )
+    assert results == [{"fp1"}, {"fp3"}, {"fp3"}]
+    assert fp_manager.get_keys.call_count == lookups
+    assert crawler.stats.get_value("incremental_crawling/lookup_windows") == windows
+    fp_manager.close()
+
+
+@inlineCallbacks
+def test_lookup_cache(tmp_path):
+    crawler = crawler_for_incremental(tmp_path / "fingerprints.sqlite3")
+    crawler.settings.set("INCREMENTAL_CRAWL_LOOKUP_CACHE_SIZE", 3)
+    fp_manager = SQLiteFingerprintsManager(crawler)
+    fp_manager.save_items([("fp1", "url1")])
+    fp_manager.get_keys = MagicMock(side_effect=fp_manager.get_keys)  # type: ignore
+
+    def lookup(*fingerprints):
+        return Deferred.fromFuture(
+            ensure_future(
+                fp_manager.get_existing_fingerprints_async(list(fingerprints))
+            )
+        )
+
+    assert (yield lookup("fp1", "fp2")) == {"fp1"}
+    fp_manager.get_keys.assert_called_once_with({"fp1", "fp2"})
+
+    # Both hits and misses are cached.
+    fp_manager.get_keys.reset_mock()
+    assert (yield lookup("fp1", "fp2")) == {"fp1"}
+    fp_manager.get_keys.assert_not_called()
+
+    # Added fingerprints are cached as hits.
+    fp_manager.add_to_batch({("fp2", "url2")})
+    fp_manager.save_batch()
+    assert (yield lookup("fp2")) == {"fp2"}
+    fp_manager.get_keys.assert_not_called()
+
+    # The least recently used fingerprint is evicted.
+    assert (yield lookup("fp3", "fp4")) == set()
+    assert fp_manager.lookup_cache is not None
+    assert len(fp_manager.lookup_cache) == 3
+    assert (yield lookup("fp1")) == {"fp1"}
+    fp_manager.get_keys.assert_called_with({"fp1"})
+
+    fp_manager.spider_closed()
+    assert crawler.stats.get_value("incremental_crawling/lookup_cache/hits") == 3
+    assert crawler.stats.get_value("incremental_crawling/lookup_cache/misses") == 5
+    assert (
+        crawler.stats.get_value("incremental_crawling/lookup_cache/hit_rate") == 0.375
+    )
+
+
+def test_timestamps(tmp_path):
+    path = tmp_path / "fingerprints.sqlite3"
+    # A database created before last-seen timestamps were stored.
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            "CREATE TABLE fingerprints "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID"
+        )
+        connection.execute("INSERT INTO fingerprints VALUES ('fp1', 'url1')")
+    connection.close()
+
+    fp_manager = SQLiteFingerprintsManager(crawler_for_incremental(path))
+    before = int(time())
+    fp_manager.save_items([("fp2", "url2")])
+    timestamps = fp_manager.get_timestamps({"fp1", "fp2", "fp3"})
+    assert timestamps.keys() == {"fp1", "fp2"}
+    assert timestamps["fp1"] is None
+    timestamp = timestamps["fp2"]
+    assert timestamp is not None
+    assert before <= timestamp <= int(time())
+
+    # Saving a fingerprint again refreshes its timestamp.
+    fp_manager.save_items([("fp1", "url1")])
+    assert fp_manager.get_timestamps({"fp1"})["fp1"] is not None
+    fp_manager.close()
+
+
+def test_spool(tmp_path):
+    path = tmp_path / "fingerprints.sqlite3"
+    spool_path = tmp_path / "fingerprints.spool"
+
+    def crawler():
+        crawler = crawler_for_incremental(path, 2)
+        crawler.settings.set("INCREMENTAL_CRAWL_SPOOL_PATH", str(spool_path))
+        return crawler
+
+    fp_manager = SQLiteFingerprintsManager(crawler())
+    fp_manager.add_to_batch({("fp1", "url1"), ("fp2", "url2")})
+    fp_manager.add_to_batch({("fp3", "url3")})
+    assert fp_manager.get_keys({"fp1", "fp2", "fp3"}) == {"fp1", "fp2"}
+    # The spool is compacted when saving a batch.
+    assert len(spool_path.read_text().splitlines()) == 1
+    fp_manager.connection.close()  # Crash before saving fp3.
+
+    crawler2 = crawler()
+    fp_manager = SQLiteFingerprintsManager(crawler2)
+    assert fp_manager.batch == {("fp3", "url3")}
+    assert crawler2.stats.get_value("incremental_crawling/spool_replayed") == 1
+    fp_manager.spider_closed()
+    assert not spool_path.exists()
+
+    fp_manager = SQLiteFingerprintsManager(crawler())
+    assert fp_manager.batch == set()
+    assert fp_manager.get_keys({"fp1", "fp2", "fp3"}) == {"fp1", "fp2", "fp3"}
+    fp_manager.close()
+
+
+@inlineCallbacks
+def test_compact_keys(tmp_path):
+    path = tmp_path / "fingerprints.sqlite3"
+    fp1, fp2, fp3 = (f"c35d{i:02x}" + "00" * 19 for i in range(1, 4))
+
+    # Saved by a crawl using the hex key format.
+    fp_manager = SQLiteFingerprintsManager(crawler_for_incremental(path))
+    fp_manager.save_fingerprints([(fp1, "url1")])
+    fp_manager.close()
+
+    crawler = crawler_for_incremental(path)
+    crawler.settings.set("INCREMENTAL_CRAWL_KEY_FORMAT", "compact")
+    crawler.settings.set("INCREMENTAL_CRAWL_STORE_URLS", False)
+    fp_manager = SQLiteFingerprintsManager(crawler)
+    fp_manager.add_to_batch({(fp2, "url2")})
+    fp_manager.save_batch()
+    assert set(
+        fp_manager.connection.execute("SELECT key, value FROM fingerprints")
+    ) == {(fp1, "url1"), (get_compact_fingerprint(fp2), "")}
+    result = yield Deferred.fromFuture(
+        ensure_future(fp_manager.get_existing_fingerprints_async([fp1, fp2, fp3]))
+    )
+    assert result == {fp1, fp2}
+    fp_manager.close()
+
+    # Once migrated, keys in the hex format can be ignored.
+    crawler = crawler_for_incremental(path)
+    crawler.settings.set("INCREMENTAL_CRAWL_KEY_FORMAT", "compact")
+    crawler.settings.set("INCREMENTAL_CRAWL_READ_LEGACY_KEYS", False)
+    fp_manager = SQLiteFingerprintsManager(crawler)
+    result = yield Deferred.fromFuture(
+        ensure_future(fp_manager.get_existing_fingerprints_async([fp1, fp2, fp3]))
+    )
+    assert result == {fp2}
+    fp_manager.close()
+
+
+def test_invalid_key_format(tmp_path):
+    crawler = crawler_for_incremental(tmp_path / "fingerprints.sqlite3")
+    crawler.settings.set("INCREMENTAL_CRAWL_KEY_FORMAT", "base64")
+    with pytest.raises(ValueError, match="INCREMENTAL_CRAWL_KEY_FORMAT"):
+        SQLiteFingerprintsManager(crawler)
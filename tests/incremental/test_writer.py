@@ -0,0 +1,105 @@
+from threading import Event
+from typing import List, Tuple
+
+from pytest_twisted import ensureDeferred
+from scrapy.statscollectors import StatsCollector
+from twisted.internet.defer import Deferred
+
+from tests import get_crawler
+from zyte_spider_templates._incremental.writer import BackgroundWriter
+
+
+def test_write():
+    saved: List[List[Tuple[str, str]]] = []
+    writer = BackgroundWriter(saved.append, 10)
+    writer.write([("fp1", "url1"), ("fp2", "url2")])
+    writer.write([("fp3", "url3")])
+    writer.close()
+    assert saved == [[("fp1", "url1"), ("fp2", "url2")], [("fp3", "url3")]]
+    assert writer.pending({"fp1", "fp3"}) == set()
+
+
+@ensureDeferred
+async def test_pending_and_backpressure():
+    crawler = get_crawler()
+    stats = StatsCollector(crawler)
+    started, unblocked = Event(), Event()
+    saved: List[List[Tuple[str, str]]] = []
+    calls: List[str] = []
+    resumed: Deferred = Deferred()
+
+    def save(batch):
+        started.set()
+        unblocked.wait()
+        saved.append(batch)
+
+    def resume():
+        calls.append("resume")
+        resumed.callback(None)
+
+    writer = BackgroundWriter(
+        save, 1, stats, pause=lambda: calls.append("pause"), resume=resume
+    )
+    writer.write([("fp1", "url1")])
+    started.wait()
+    # The first batch is being saved, the second one fills the queue.
+    writer.write([("fp2", "url2")])
+    assert writer.pending({"fp1", "fp2", "fp3"}) == {"fp1", "fp2"}
+    assert stats.get_value("incremental_crawling/write_backpressure") is None
+
+    # The next batches do not block, but pause the crawl once.
+    writer.write([("fp3", "url3")])
+    writer.write([("fp4", "url4")])
+    assert calls == ["pause"]
+    assert stats.get_value("incremental_crawling/write_backpressure") == 1
+    assert writer.pending({"fp3", "fp4"}) == {"fp3", "fp4"}
+
+    unblocked.set()
+    await resumed
+    assert calls == ["pause", "resume"]
+    writer.close()
+    assert saved == [
+        [("fp1", "url1")],
+        [("fp2", "url2")],
+        [("fp3", "url3")],
+        [("fp4", "url4")],
+    ]
+    assert writer.pending({"fp1", "fp2", "fp3", "fp4"}) == set()
+
+
+def test_close_overflow():
+    unblocked = Event()
+    saved: List[List[Tuple[str, str]]] = []
+
+    def save(batch):
+        unblocked.wait()
+        saved.append(batch)
+
+    writer = BackgroundWriter(save, 1)
+    for i in range(4):
+        writer.write([(f"fp{i}", f"url{i}")])
+    unblocked.set()
+    # Overflowing batches are saved before the writer stops.
+    writer.close()
+    assert saved == [[(f"fp{i}", f"url{i}")] for i in range(4)]
+
+
+def test_errors(caplog):
+    crawler = get_crawler()
+    stats = StatsCollector(crawler)
+    saved: List[List[Tuple[str, str]]] = []
+
+    def save(batch):
+        if batch == [("fp1", "url1")]:
+            raise ValueError
+        saved.append(batch)
+
+    writer = BackgroundWriter(save, 10, stats)
+    writer.write([("fp1", "url1")])
+    writer.write([("fp2", "url2")])
+    writer.close()
+    assert saved == [[("fp2", "url2")]]
+    assert stats.get_value("incremental_crawling/write_errors") == 1
+    assert "Could not save 1 fingerprints" in caplog.text
+    assert writer.failed() == [("fp1", "url1")]
+    assert writer.idle()
@@ -8,7 +8,6 @@ from subprocess import PIPE, Popen
 from typing import Any, Dict
 
 from scrapy_zyte_api.responses import _API_RESPONSE
-from twisted.internet import reactor
 from twisted.web.resource import Resource
 from twisted.web.server import Site
 
@@ -144,9 +143,10 @@ class DefaultResource(Resource):
 
 
 class MockServer:
-    def __init__(self, resource=None, port=None):
+    def __init__(self, resource=None, port=None, resource_kwargs=None):
         resource = resource or DefaultResource
         self.resource = "{}.{}".format(resource.__module__, resource.__name__)
+        self.resource_kwargs = resource_kwargs or {}
         self.proc = None
         self.host = socket.gethostbyname(socket.gethostname())
         self.port = port or get_ephemeral_port()
@@ -162,6 +162,8 @@ class MockServer:
                 self.resource,
                 "--port",
                 str(self.port),
+                "--kwargs",
+                json.dumps(self.resource_kwargs),
             ],
             stdout=PIPE,
         )
@@ -180,13 +182,16 @@ class MockServer:
 
 
 def main():
+    from twisted.internet import reactor
+
     parser = argparse.ArgumentParser()
     parser.add_argument("resource")
     parser.add_argument("--port", type=int)
+    parser.add_argument("--kwargs", default="{}")
     args = parser.parse_args()
     module_name, name = args.resource.rsplit(".", 1)
     sys.path.append(".")
-    resource = getattr(import_module(module_name), name)()
+    resource = getattr(import_module(module_name), name)(**json.loads(args.kwargs))
     # Typing issue: https://github.com/twisted/twisted/issues/9909
     http_port = reactor.listenTCP(args.port, Site(resource))  # type: ignore[attr-defined]
 
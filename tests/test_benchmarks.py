@@ -0,0 +1,65 @@
+import pytest
+
+from .benchmarks.runner import run_scenario_subprocess
+from .benchmarks.sites import (
+    ARTICLE_DOMAIN,
+    ECOMMERCE_DOMAIN,
+    SyntheticSite,
+    SyntheticSiteResource,
+)
+from .mockserver import MockServer
+
+
+def test_synthetic_site_navigation():
+    site = SyntheticSite(ECOMMERCE_DOMAIN, categories=2, depth=1, pages=2, items=1)
+    assert list(site.category_paths()) == [(), (1,), (2,)]
+    assert site.navigation("https://shop.example/") == {
+        "url": "https://shop.example/",
+        "items": [{"url": "https://shop.example/product/0/1/1"}],
+        "nextPage": {"url": "https://shop.example/page/2"},
+        "subCategories": [
+            {"url": "https://shop.example/c/1"},
+            {"url": "https://shop.example/c/2"},
+        ],
+    }
+    assert site.navigation("https://shop.example/c/2/page/2") == {
+        "url": "https://shop.example/c/2/page/2",
+        "items": [{"url": "https://shop.example/product/2/2/1"}],
+    }
+    assert site.navigation("https://shop.example/c/3") == {
+        "url": "https://shop.example/c/3"
+    }
+    assert len(site.item_urls()) == 6
+    assert site.item("https://shop.example/product/2/2/1")["metadata"] == {
+        "probability": 1.0
+    }
+    assert site.item("https://shop.example/c/1")["metadata"] == {"probability": 0.01}
+
+
+def test_synthetic_site_feeds():
+    site = SyntheticSite(ARTICLE_DOMAIN, categories=2, depth=1, items=2, feeds=3)
+    home = site.html(site.home_url)
+    assert home.count('type="application/rss+xml"') == 3
+    assert site.parse_url(site.feed_url(3)) == ("feed", (1,), 1)
+    feed = site.feed(site.feed_url(2))
+    assert "<link>https://daily.example/story/2/1/1</link>" in feed
+    assert "<link>https://daily.example/story/2/1/2</link>" in feed
+
+
+@pytest.mark.parametrize(
+    "spider,strategy,items,callbacks",
+    (
+        ("ecommerce", "navigation", 6, {"parse_navigation", "parse_product"}),
+        ("job_posting", "direct_item", 6, {"parse_job_posting"}),
+    ),
+)
+def test_run_scenario(spider, strategy, items, callbacks):
+    site_kwargs = {"categories": 2, "depth": 1, "pages": 1, "items": 2}
+    with MockServer(SyntheticSiteResource, resource_kwargs=site_kwargs) as server:
+        result = run_scenario_subprocess(
+            spider, strategy, server.urljoin("/"), site_kwargs
+        )
+    assert result["items"] == result["site_items"] == items
+    assert result["requests"] >= items
+    assert result["peak_rss"] > 0
+    assert set(result["callback_cpu_time"]) == callbacks
@@ -0,0 +1,311 @@
+import json
+import mmap
+from io import BytesIO
+
+import pytest
+from scrapy import Request, Spider, signals
+from scrapy.http import Response
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.test import get_crawler
+
+from zyte_spider_templates import CrawlingLogsMiddleware
+from zyte_spider_templates.crawl_graph import (
+    CrawlGraph,
+    CrawlGraphEncoder,
+    main,
+    read_records,
+)
+
+HOME_FP = "aa" * 20
+CATEGORY_FP = "bb" * 20
+PRODUCT_FP = "cc" * 20
+OTHER_FP = "dd" * 20
+
+HOME_RECORD = {
+    "time": "2023-10-10 20:09:29",
+    "current": {
+        "url": "https://example.com/",
+        "request_url": "https://example.com",
+        "request_fingerprint": HOME_FP,
+        "page_type": None,
+        "probability": None,
+    },
+    "to_crawl": {
+        "subCategories": [
+            {
+                "name": "Category",
+                "page_type": "subCategories",
+                "probability": 0.9951,
+                "request_url": "https://example.com/category",
+                "request_priority": 98,
+                "request_fingerprint": CATEGORY_FP,
+            }
+        ],
+        "unknown": [
+            {
+                "request_url": "https://example.com/other",
+                "request_priority": -5,
+                "request_fingerprint": OTHER_FP,
+            }
+        ],
+    },
+}
+CATEGORY_RECORD = {
+    "time": "2023-10-10 20:09:30",
+    "current": {
+        "url": "https://example.com/category",
+        "request_url": "https://example.com/category",
+        "request_fingerprint": CATEGORY_FP,
+        "page_type": "subCategories",
+        "probability": 0.5,
+    },
+    "to_crawl": {
+        "product": [
+            {
+                "page_type": "product",
+                "probability": 1.0,
+                "request_url": "https://example.com/product",
+                "request_priority": 199,
+                "request_fingerprint": PRODUCT_FP,
+            }
+        ],
+        "subCategories": [
+            {
+                "page_type": "subCategories",
+                "probability": 0.1,
+                "request_url": "https://example.com/category",
+                "request_priority": 100,
+                "request_fingerprint": CATEGORY_FP,
+            }
+        ],
+    },
+}
+SUMMARY_RECORD = {"time": "2023-10-10 20:09:31", "summary": {"responses": {"a": 1}}}
+
+
+def encode(*records):
+    encoder = CrawlGraphEncoder()
+    return b"".join(encoder(record) for record in records)
+
+
+def without_names(record):
+    return {
+        **record,
+        "to_crawl": {
+            page_type: [
+                {key: value for key, value in child.items() if key != "name"}
+                for child in children
+            ]
+            for page_type, children in record["to_crawl"].items()
+        },
+    }
+
+
+def test_round_trip():
+    data = encode(HOME_RECORD, CATEGORY_RECORD, SUMMARY_RECORD)
+    assert list(read_records(BytesIO(data))) == [
+        without_names(HOME_RECORD),
+        CATEGORY_RECORD,
+        {"summary": SUMMARY_RECORD["summary"]},
+    ]
+    # URLs and fingerprints are only stored once.
+    assert data.count(b"https://example.com/category") == 1
+    assert data.count(bytes.fromhex(CATEGORY_FP)) == 1
+    assert len(data) < len(json.dumps([HOME_RECORD, CATEGORY_RECORD])) / 2
+
+
+def test_encode_error():
+    encoder = CrawlGraphEncoder()
+    invalid_record = {
+        **CATEGORY_RECORD,
+        "to_crawl": {"product": [{"request_url": "https://example.com/product"}]},
+    }
+    with pytest.raises(KeyError):
+        encoder(invalid_record)
+    # Table entries of the failed record are not kept, so that later records
+    # only refer to entries that were written.
+    data = encoder(HOME_RECORD) + encoder(CATEGORY_RECORD)
+    assert list(read_records(BytesIO(data))) == [
+        without_names(HOME_RECORD),
+        CATEGORY_RECORD,
+    ]
+
+
+def test_read_records_closes_mmap(tmp_path, monkeypatch):
+    maps = []
+    mmap_cls = mmap.mmap
+
+    def track_mmap(*args, **kwargs):
+        maps.append(mmap_cls(*args, **kwargs))
+        return maps[-1]
+
+    monkeypatch.setattr(mmap, "mmap", track_mmap)
+    path = tmp_path / "crawling_logs.bin"
+    path.write_bytes(encode(HOME_RECORD, CATEGORY_RECORD))
+    with path.open("rb") as file:
+        records = read_records(file)
+        next(records)
+        records.close()
+    assert len(maps) == 1
+    assert maps[0].closed
+
+
+def test_appended_crawls(tmp_path):
+    path = tmp_path / "crawling_logs.bin"
+    path.write_bytes(encode(HOME_RECORD) + encode(CATEGORY_RECORD))
+    with path.open("rb") as file:
+        assert list(read_records(file)) == [without_names(HOME_RECORD), CATEGORY_RECORD]
+
+
+@pytest.mark.parametrize(
+    "data,message",
+    (
+        (b"\x06\x00ZSTXX\x01", "Invalid crawl graph header"),
+        (b"\x06\x00ZSTCG\x02", "Unsupported crawl graph version 2"),
+        (b"\x01\x09", "Unknown crawl graph record type 9"),
+    ),
+)
+def test_read_records_invalid(data, message):
+    with pytest.raises(ValueError, match=message):
+        list(read_records(BytesIO(data)))
+
+
+def test_read_records_truncated(caplog):
+    data = encode(HOME_RECORD, CATEGORY_RECORD)
+    complete = encode(HOME_RECORD)
+    for size in (len(complete) + 1, len(data) - 1):
+        caplog.clear()
+        assert list(read_records(BytesIO(data[:size]))) == [without_names(HOME_RECORD)]
+        assert "the file is truncated" in caplog.text
+    # A record size cut short.
+    data = complete + b"\x80"
+    assert list(read_records(BytesIO(data))) == [without_names(HOME_RECORD)]
+
+
+def test_read_records_corrupt():
+    # A node record pointing to a missing URL.
+    data = encode(HOME_RECORD)[:8] + b"\x03\x03\x05\xaa"
+    with pytest.raises(ValueError, match="Invalid crawl graph record at byte 8"):
+        list(read_records(BytesIO(data)))
+
+
+def test_crawl_graph():
+    graph = CrawlGraph.from_records(
+        read_records(BytesIO(encode(HOME_RECORD, CATEGORY_RECORD, SUMMARY_RECORD)))
+    )
+    assert graph.edges == {
+        HOME_FP: [CATEGORY_FP, OTHER_FP],
+        CATEGORY_FP: [PRODUCT_FP, CATEGORY_FP],
+    }
+    assert graph.urls[OTHER_FP] == "https://example.com/other"
+    assert graph.fan_out_stats() == {
+        "unknown": {
+            "responses": 1,
+            "requests": 2,
+            "max": 2,
+            "mean": 2.0,
+            "to_crawl": {"subCategories": 1, "unknown": 1},
+        },
+        "subCategories": {
+            "responses": 1,
+            "requests": 2,
+            "max": 2,
+            "mean": 2.0,
+            "to_crawl": {"product": 1, "subCategories": 1},
+        },
+    }
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / "crawling_logs.bin"
+    path.write_bytes(encode(HOME_RECORD, CATEGORY_RECORD))
+
+    main([str(path)])
+    assert capsys.readouterr().out == (
+        "subCategories: 1 responses, 2 requests (mean 2.00, max 2 per response)\n"
+        "  - product: 1\n"
+        "  - subCategories: 1\n"
+        "unknown: 1 responses, 2 requests (mean 2.00, max 2 per response)\n"
+        "  - subCategories: 1\n"
+        "  - unknown: 1\n"
+    )
+
+    edges_path = tmp_path / "edges.tsv"
+    main([str(path), "--json", "--edges", str(edges_path)])
+    assert json.loads(capsys.readouterr().out)["unknown"]["requests"] == 2
+    assert edges_path.read_text().splitlines() == [
+        "https://example.com\thttps://example.com/category",
+        "https://example.com\thttps://example.com/other",
+        "https://example.com/category\thttps://example.com/product",
+        "https://example.com/category\thttps://example.com/category",
+    ]
+
+    main([str(path), "--jsonl"])
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        without_names(HOME_RECORD),
+        CATEGORY_RECORD,
+    ]
+
+    path.write_bytes(b"\x01\x09")
+    with pytest.raises(SystemExit) as exc_info:
+        main([str(path)])
+    assert exc_info.value.code == 1
+    assert "Unknown crawl graph record type 9" in capsys.readouterr().err
+
+
+def test_crawling_logs_middleware_binary(tmp_path):
+    path = tmp_path / "crawling_logs.bin"
+    crawler = get_crawler(
+        Spider,
+        settings_dict={
+            "CRAWLING_LOGS_FILE": str(path),
+            "CRAWLING_LOGS_FORMAT": "binary",
+        },
+    )
+    crawler.stats = StatsCollector(crawler)
+    middleware = CrawlingLogsMiddleware.from_crawler(crawler)
+    request = Request(
+        "https://example.com",
+        meta={"crawling_logs": {"page_type": "productNavigation"}},
+    )
+    response = Response(url=request.url, request=request)
+    child = Request(
+        "https://example.com/product",
+        priority=10,
+        meta={"crawling_logs": {"page_type": "product", "probability": 0.75}},
+    )
+    assert list(middleware.process_spider_output(response, [child], None)) == [child]
+    crawler.signals.send_catch_log(signal=signals.spider_closed, spider=None)
+
+    with path.open("rb") as file:
+        (record,) = read_records(file)
+    fingerprinter = crawler.request_fingerprinter
+    assert fingerprinter
+    assert record["current"]["request_fingerprint"] == (
+        fingerprinter.fingerprint(request).hex()
+    )
+    assert record["current"]["page_type"] == "productNavigation"
+    assert record["to_crawl"] == {
+        "product": [
+            {
+                "page_type": "product",
+                "probability": 0.75,
+                "request_url": "https://example.com/product",
+                "request_priority": 10,
+                "request_fingerprint": fingerprinter.fingerprint(child).hex(),
+            }
+        ]
+    }
+
+
+def test_crawling_logs_middleware_invalid_format(tmp_path):
+    crawler = get_crawler(
+        Spider,
+        settings_dict={
+            "CRAWLING_LOGS_FILE": str(tmp_path / "crawling_logs"),
+            "CRAWLING_LOGS_FORMAT": "xml",
+        },
+    )
+    with pytest.raises(ValueError, match="Unsupported CRAWLING_LOGS_FORMAT"):
+        CrawlingLogsMiddleware.from_crawler(crawler)
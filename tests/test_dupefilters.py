@@ -0,0 +1,131 @@
+import os
+from hashlib import sha1
+
+import pytest
+from scrapy.settings import Settings
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.test import get_crawler
+
+from zyte_spider_templates._dupefilters import (
+    DiskFingerprintStore,
+    HashTableFingerprintStore,
+    ScalableBloomFilterStore,
+    SetFingerprintStore,
+)
+
+
+def _fingerprint(i: int) -> bytes:
+    return sha1(str(i).encode()).digest()
+
+
+@pytest.mark.parametrize(
+    "store",
+    (
+        SetFingerprintStore(),
+        HashTableFingerprintStore(capacity=8),
+        ScalableBloomFilterStore(capacity=8, error_rate=0.0001),
+    ),
+)
+def test_add(store):
+    for i in range(100):
+        assert store.add(_fingerprint(i)) is False
+    assert len(store) == 100
+    for i in range(100):
+        assert store.add(_fingerprint(i)) is True
+    assert len(store) == 100
+    assert store.memory_usage > 0
+
+
+def test_hash_table():
+    store = HashTableFingerprintStore(capacity=10)
+    assert store.add(bytes(20)) is False
+    assert store.add(bytes(20)) is True
+    for i in range(11):
+        store.add(_fingerprint(i))
+    assert len(store) == 12
+    assert store.load_factor == 11 / 16
+    store.add(_fingerprint(11))
+    assert store.load_factor == 12 / 32
+    assert store.memory_usage < 32 * 20 + 100
+    with pytest.raises(ValueError, match="Expected a 20-byte fingerprint"):
+        store.add(b"short")
+
+
+def test_hash_table_memory():
+    store = HashTableFingerprintStore(capacity=2**14)
+    set_store = SetFingerprintStore()
+    for i in range(10_000):
+        store.add(_fingerprint(i))
+        set_store.add(_fingerprint(i))
+    assert store.memory_usage * 4 < set_store.memory_usage
+
+
+def test_bloom_filter_error_rate():
+    store = ScalableBloomFilterStore(capacity=1000, error_rate=0.01)
+    for i in range(20_000):
+        store.add(_fingerprint(i))
+    assert len(store.filters) == 5
+    assert 0.3 < store.load_factor < 0.32
+    false_positives = sum(store.add(_fingerprint(i)) for i in range(20_000, 40_000))
+    assert false_positives < 20_000 * 0.01
+
+
+def test_bloom_filter_short_fingerprints():
+    store = ScalableBloomFilterStore()
+    assert store.add(b"a") is False
+    assert store.add(b"a") is True
+    assert store.add(b"b") is False
+    assert b"a" in store
+    assert b"c" not in store
+
+
+def test_bloom_filter_invalid_error_rate():
+    with pytest.raises(ValueError, match="error rate"):
+        ScalableBloomFilterStore(error_rate=1)
+
+
+def test_disk(tmp_path):
+    path = str(tmp_path / "dupe_filter")
+    store = DiskFingerprintStore(path, buffer_size=10)
+    for i in range(95):
+        assert store.add(_fingerprint(i)) is False
+    assert len(store) == 95
+    # 9 buffer flushes of 10 fingerprints, merged into runs of similar size.
+    assert [run.count for run in store._runs] == [80, 10]
+    assert len(store._buffer) == 5
+    for i in range(95):
+        assert store.add(_fingerprint(i)) is True
+    assert store.add(b"short") is False
+    assert store.add(b"short") is True
+    store.close()
+    assert sorted(os.listdir(path)) == [
+        "00000014-20.run",
+        "00000015-20.run",
+        "00000016-5.run",
+        "00000017-20.run",
+    ]
+
+    # Resume
+    store = DiskFingerprintStore(path, buffer_size=10)
+    assert len(store) == 96
+    for i in range(100):
+        assert store.add(_fingerprint(i)) is (i < 95)
+    assert store.add(b"short") is True
+    store.close()
+
+
+def test_disk_from_settings(tmp_path):
+    jobdir = tmp_path / "job"
+    store = DiskFingerprintStore.from_settings(Settings({"JOBDIR": str(jobdir)}))
+    store.add(_fingerprint(0))
+    store.close()
+    assert len(os.listdir(jobdir / "dupe_filter")) == 1
+
+    store = DiskFingerprintStore.from_settings(Settings())
+    store.add(_fingerprint(0))
+    stats = StatsCollector(get_crawler())
+    store.to_stats(stats, "test")
+    assert stats.get_value("test/disk") == 0
+    assert stats.get_value("test/fingerprints") == 1
+    store.close()
+    assert not os.path.exists(store.path)
@@ -697,6 +697,32 @@ def test_metadata():
                     "title": "URLs file",
                     "type": "string",
                 },
+                "incremental": {
+                    "default": False,
+                    "description": (
+                        "Skip items with URLs already stored in the specified Zyte Scrapy Cloud Collection. "
+                        "This feature helps avoid reprocessing previously crawled items and requests by comparing "
+                        "their URLs against the stored collection."
+                    ),
+                    "title": "Incremental",
+                    "type": "boolean",
+                },
+                "incremental_collection_name": {
+                    "anyOf": [
+                        {"type": "string", "pattern": "^[a-zA-Z0-9_]+$"},
+                        {"type": "null"},
+                    ],
+                    "default": None,
+                    "description": "Name of the Zyte Scrapy Cloud Collection used during an incremental crawl."
+                    "By default, a Collection named after the spider (or virtual spider) is used, "
+                    "meaning that matching URLs from previous runs of the same spider are skipped, "
+                    "provided those previous runs had `incremental` argument set to `true`."
+                    "Using a different collection name makes sense, for example, in the following cases:"
+                    "- different spiders share a collection."
+                    "- the same spider uses different collections (e.g., for development runs vs. production runs). "
+                    "Only ASCII alphanumeric characters and underscores are allowed in the collection name.",
+                    "title": "Incremental Collection Name",
+                },
                 "search_queries": {
                     "default": [],
                     "description": (
@@ -909,6 +935,27 @@ def test_get_parse_product_request():
     request = ProbabilityRequest(url="https://example.com")
     scrapy_request = spider.get_parse_product_request(request)
     assert scrapy_request.meta.get("allow_offsite") is True
+    assert "incremental_item_type" not in scrapy_request.meta
+
+
+def test_incremental():
+    crawler = get_crawler()
+    spider = EcommerceSpider.from_crawler(
+        crawler,
+        url="https://example.com",
+        incremental=True,
+        incremental_collection_name="products",
+    )
+    assert spider.settings.getbool("INCREMENTAL_CRAWL_ENABLED") is True
+    assert spider.settings.get("INCREMENTAL_CRAWL_COLLECTION_NAME") == "products"
+    # Unlike for articles, navigation depth is not limited.
+    assert spider.settings.get("NAVIGATION_DEPTH_LIMIT") is None
+
+    request = ProbabilityRequest(url="https://example.com/product")
+    scrapy_request = spider.get_parse_product_request(request)
+    assert scrapy_request.meta["incremental_item_type"] == "product"
+    scrapy_request = spider.get_subcategory_request(request)
+    assert "incremental_item_type" not in scrapy_request.meta
 
 
 def test_get_subcategory_request():
@@ -152,6 +152,25 @@ def test_crawl_strategy_direct_item():
     start_requests = list(spider.start_requests())
     assert len(start_requests) == 1
     assert start_requests[0].callback == spider.parse_job_posting
+    assert "incremental_item_type" not in start_requests[0].meta
+
+
+def test_incremental():
+    crawler = get_crawler()
+    spider = JobPostingSpider.from_crawler(
+        crawler,
+        url="https://example.com",
+        crawl_strategy="direct_item",
+        incremental=True,
+    )
+    assert spider.settings.getbool("INCREMENTAL_CRAWL_ENABLED") is True
+    start_requests = list(spider.start_requests())
+    assert start_requests[0].meta["incremental_item_type"] == "jobPosting"
+    request = ProbabilityRequest(url="https://example.com/jobs/1")
+    scrapy_request = spider.get_parse_job_posting_request(request)
+    assert scrapy_request.meta["incremental_item_type"] == "jobPosting"
+    scrapy_request = spider.get_parse_navigation_request(request)
+    assert "incremental_item_type" not in scrapy_request.meta
 
 
 @pytest.mark.parametrize(
@@ -347,6 +366,32 @@ def test_metadata():
                     "title": "URLs file",
                     "type": "string",
                 },
+                "incremental": {
+                    "default": False,
+                    "description": (
+                        "Skip items with URLs already stored in the specified Zyte Scrapy Cloud Collection. "
+                        "This feature helps avoid reprocessing previously crawled items and requests by comparing "
+                        "their URLs against the stored collection."
+                    ),
+                    "title": "Incremental",
+                    "type": "boolean",
+                },
+                "incremental_collection_name": {
+                    "anyOf": [
+                        {"type": "string", "pattern": "^[a-zA-Z0-9_]+$"},
+                        {"type": "null"},
+                    ],
+                    "default": None,
+                    "description": "Name of the Zyte Scrapy Cloud Collection used during an incremental crawl."
+                    "By default, a Collection named after the spider (or virtual spider) is used, "
+                    "meaning that matching URLs from previous runs of the same spider are skipped, "
+                    "provided those previous runs had `incremental` argument set to `true`."
+                    "Using a different collection name makes sense, for example, in the following cases:"
+                    "- different spiders share a collection."
+                    "- the same spider uses different collections (e.g., for development runs vs. production runs). "
+                    "Only ASCII alphanumeric characters and underscores are allowed in the collection name.",
+                    "title": "Incremental Collection Name",
+                },
                 "search_queries": {
                     "default": [],
                     "description": (
@@ -0,0 +1,133 @@
+import time
+
+from pytest_twisted import ensureDeferred
+from scrapy import Request, Spider, signals
+from scrapy.http import Response
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.test import get_crawler
+from zyte_common_items import Article
+
+from zyte_spider_templates import (
+    CrawlingLogsMiddleware,
+    IncrementalCrawlMiddleware,
+    TrackSeedsSpiderMiddleware,
+)
+from zyte_spider_templates._addon import _time_spider_middlewares
+from zyte_spider_templates._latency import LatencyHistogram, timed_spider_middleware
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0
+
+    for microseconds in range(1, 101):
+        histogram.record(microseconds / 1_000_000)
+    histogram.record(1)
+
+    assert histogram.count == 101
+    assert 50 <= histogram.percentile(50) <= 55
+    assert 95 <= histogram.percentile(95) <= 104
+    assert 99 <= histogram.percentile(99) <= 109
+    assert 1_000_000 <= histogram.percentile(100) <= 1_091_000
+    assert len(histogram.buckets) < 60
+
+
+def _get_crawler():
+    class TestSpider(Spider):
+        name = "test"
+
+    crawler = get_crawler(TestSpider)
+    crawler.spider = TestSpider()
+    crawler.stats = StatsCollector(crawler)
+    return crawler
+
+
+def test_timed_spider_middleware():
+    crawler = _get_crawler()
+    timed_cls = timed_spider_middleware(TrackSeedsSpiderMiddleware)
+    assert issubclass(timed_cls, TrackSeedsSpiderMiddleware)
+    assert timed_spider_middleware(TrackSeedsSpiderMiddleware) is timed_cls
+    middleware = timed_cls.from_crawler(crawler)
+
+    def callback():
+        yield Article(url="https://example.com/article")
+        time.sleep(0.05)
+        yield Request("https://example.com/1")
+        yield Request("https://example.com/2")
+
+    response = Response(
+        "https://example.com", request=Request("https://example.com", meta={"seed": 1})
+    )
+    result = list(
+        middleware.process_spider_output(response, callback(), crawler.spider)
+    )
+    assert len(result) == 3
+    assert all(request.meta["seed"] == 1 for request in result[1:])
+
+    crawler.signals.send_catch_log(signal=signals.spider_closed, spider=crawler.spider)
+    stats = crawler.stats.get_stats()
+    prefix = "middleware_latency/TrackSeedsSpiderMiddleware"
+    assert stats[f"{prefix}/per_response/count"] == 1
+    assert stats[f"{prefix}/per_request/count"] == 2
+    # The time spent in the callback is not counted.
+    assert stats[f"{prefix}/per_response/p99"] < 50_000
+    assert stats[f"{prefix}/per_request/p50"] <= stats[f"{prefix}/per_request/p99"]
+
+
+@ensureDeferred
+async def test_timed_spider_middleware_async():
+    crawler = _get_crawler()
+    middleware = timed_spider_middleware(TrackSeedsSpiderMiddleware).from_crawler(
+        crawler
+    )
+
+    async def callback():
+        yield Request("https://example.com/1")
+        yield Article(url="https://example.com/article")
+
+    response = Response(
+        "https://example.com", request=Request("https://example.com", meta={"seed": 1})
+    )
+    result = [
+        item_or_request
+        async for item_or_request in middleware.process_spider_output_async(
+            response, callback(), crawler.spider
+        )
+    ]
+    assert len(result) == 2
+
+    crawler.signals.send_catch_log(signal=signals.spider_closed, spider=crawler.spider)
+    prefix = "middleware_latency/TrackSeedsSpiderMiddleware"
+    assert crawler.stats.get_value(f"{prefix}/per_response/count") == 1
+    assert crawler.stats.get_value(f"{prefix}/per_request/count") == 1
+
+
+def test_timed_spider_middleware_methods():
+    # Only the output processing methods of the original class are wrapped.
+    timed_cls = timed_spider_middleware(IncrementalCrawlMiddleware)
+    assert not hasattr(timed_cls, "process_spider_output_async")
+    assert timed_cls.process_spider_output is not (
+        IncrementalCrawlMiddleware.process_spider_output
+    )
+
+
+def test_time_spider_middlewares():
+    crawler = get_crawler(
+        settings_dict={
+            "SPIDER_MIDDLEWARES": {
+                "zyte_spider_templates.CrawlingLogsMiddleware": 1000,
+                TrackSeedsSpiderMiddleware: 550,
+                "zyte_spider_templates.OnlyFeedsMiddleware": None,
+                "scrapy.spidermiddlewares.depth.DepthMiddleware": 900,
+            },
+        }
+    )
+    _time_spider_middlewares(crawler.settings)
+    assert crawler.settings.getdict("SPIDER_MIDDLEWARES") == {
+        "zyte_spider_templates.CrawlingLogsMiddleware": None,
+        timed_spider_middleware(CrawlingLogsMiddleware): 1000,
+        TrackSeedsSpiderMiddleware: None,
+        timed_spider_middleware(TrackSeedsSpiderMiddleware): 550,
+        "zyte_spider_templates.OnlyFeedsMiddleware": None,
+        "scrapy.spidermiddlewares.depth.DepthMiddleware": 900,
+    }
@@ -1,23 +1,34 @@
+import json
 import logging
 from collections import defaultdict
+from types import SimpleNamespace
 from typing import Iterable, Union
 from unittest.mock import MagicMock
 
 import pytest
+from duplicate_url_discarder.url_canonicalizer import UrlCanonicalizer
+from duplicate_url_discarder_rules import RULE_PATHS
 from freezegun import freeze_time
 from pytest_twisted import ensureDeferred
-from scrapy import Spider
+from scrapy import Spider, signals
 from scrapy.exceptions import IgnoreRequest, NotConfigured
 from scrapy.http import Request, Response
 from scrapy.settings import Settings
+from scrapy.squeues import FifoMemoryQueue
 from scrapy.statscollectors import StatsCollector
+from scrapy.utils.httpobj import urlparse_cached
 from scrapy.utils.misc import create_instance
 from scrapy.utils.test import get_crawler
+from scrapy.utils.url import url_is_from_any_domain
 from scrapy_poet import DynamicDeps
 from zyte_common_items import Article, Item, Product
 
+from zyte_spider_templates import SeedAwarePriorityQueue
+from zyte_spider_templates._dupefilters import DiskFingerprintStore
+from zyte_spider_templates._url_rules import DomainRuleIndex
 from zyte_spider_templates.middlewares import (
     AllowOffsiteMiddleware,
+    CanonicalizeUrlsSpiderMiddleware,
     CrawlingLogsMiddleware,
     DummyDupeFilter,
     DupeFilterSpiderMiddleware,
@@ -392,6 +403,228 @@ def test_crawling_logs_middleware():
     )
 
 
+def test_crawling_logs_middleware_streaming(caplog):
+    crawler = get_crawler()
+    middleware = create_instance(
+        CrawlingLogsMiddleware, settings=crawler.settings, crawler=crawler
+    )
+    url = "https://example.com"
+    response = Response(url=url, request=Request(url))
+    consumed = []
+
+    def results_gen():
+        for index in range(2):
+            consumed.append(index)
+            yield Request(f"https://example.com/{index}")
+
+    caplog.set_level(logging.INFO, logger="zyte_spider_templates.middlewares")
+    output = middleware.process_spider_output(response, results_gen(), None)
+    next(output)
+    # The output is not consumed before being passed on.
+    assert consumed == [0]
+    assert "Crawling Logs" not in caplog.text
+    assert len(list(output)) == 1
+    assert "Number of Requests per page type:\n- unknown: 2" in caplog.text
+
+    # Logged data is not added to the crawling_logs metadata of requests.
+    request = Request("https://example.com/0", meta={"crawling_logs": {}})
+    assert list(middleware.process_spider_output(response, [request], None)) == [
+        request
+    ]
+    assert request.meta["crawling_logs"] == {}
+
+    # Nothing is built if crawling logs would not be logged.
+    caplog.clear()
+    caplog.set_level(logging.WARNING, logger="zyte_spider_templates.middlewares")
+    fingerprinter = crawler.request_fingerprinter = MagicMock()
+    output = middleware.process_spider_output(response, results_gen(), None)
+    assert len(list(output)) == 2
+    assert not caplog.text
+    fingerprinter.fingerprint.assert_not_called()
+
+
+@ensureDeferred
+async def test_crawling_logs_middleware_file(tmp_path, caplog):
+    path = tmp_path / "crawling_logs.jsonl"
+    crawler = get_crawler(Spider, settings_dict={"CRAWLING_LOGS_FILE": str(path)})
+    crawler.stats = StatsCollector(crawler)
+    middleware = create_instance(
+        CrawlingLogsMiddleware, settings=crawler.settings, crawler=crawler
+    )
+    request_fingerprint = get_fingerprinter(crawler)
+
+    url = "https://example.com"
+    request = Request(url, meta={"crawling_logs": {"page_type": "productNavigation"}})
+    response = Response(url=url, request=request)
+    item = Product(url="https://example.com/product")
+    product_request = Request(
+        "https://example.com/product",
+        meta={"crawling_logs": {"page_type": "product", "probability": 0.9}},
+    )
+
+    caplog.set_level(logging.INFO, logger="zyte_spider_templates.middlewares")
+    result = await result_as_async_gen(
+        middleware, response, [item, product_request], None
+    )
+    assert result == [item, product_request]
+    assert product_request.meta["crawling_logs"] == {
+        "page_type": "product",
+        "probability": 0.9,
+    }
+    await result_as_async_gen(middleware, response, [], None)
+    crawler.signals.send_catch_log(signal=signals.spider_closed, spider=None)
+
+    assert "Crawling Logs" not in caplog.text
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["current"] == {
+        "url": url,
+        "request_url": url,
+        "request_fingerprint": request_fingerprint(request),
+        "page_type": "productNavigation",
+        "probability": None,
+    }
+    assert json.loads(lines[0])["to_crawl"] == {
+        "product": [
+            {
+                "page_type": "product",
+                "probability": 0.9,
+                "request_url": "https://example.com/product",
+                "request_priority": 0,
+                "request_fingerprint": request_fingerprint(product_request),
+            }
+        ]
+    }
+    assert json.loads(lines[1])["to_crawl"] == {}
+    assert ": " not in lines[0]
+
+
+def test_crawling_logs_middleware_file_queue_full(tmp_path):
+    crawler = get_crawler(
+        Spider,
+        settings_dict={
+            "CRAWLING_LOGS_FILE": str(tmp_path / "crawling_logs.jsonl"),
+            "CRAWLING_LOGS_QUEUE_SIZE": 1,
+        },
+    )
+    crawler.stats = StatsCollector(crawler)
+    middleware = create_instance(
+        CrawlingLogsMiddleware, settings=crawler.settings, crawler=crawler
+    )
+    middleware._writer.write = MagicMock(return_value=False)
+    url = "https://example.com"
+    response = Response(url=url, request=Request(url))
+    list(middleware.process_spider_output(response, [], None))
+    assert crawler.stats.get_value("crawling_logs/dropped") == 1
+    middleware.spider_closed(None)
+
+
+def test_crawling_logs_middleware_sampling(caplog):
+    crawler = get_crawler(
+        Spider,
+        settings_dict={
+            "CRAWLING_LOGS_SAMPLE_RATE": 2,
+            "CRAWLING_LOGS_SAMPLE_RATES": {"product": 0, "subCategories": 1},
+        },
+    )
+    crawler.stats = StatsCollector(crawler)
+    middleware = create_instance(
+        CrawlingLogsMiddleware, settings=crawler.settings, crawler=crawler
+    )
+
+    def get_response(page_type):
+        request = Request(
+            f"https://example.com/{page_type}",
+            meta={"crawling_logs": {"page_type": page_type}},
+        )
+        return Response(url=request.url, request=request)
+
+    def results_gen():
+        yield Request(
+            "https://example.com/product",
+            meta={"crawling_logs": {"page_type": "product", "probability": 0.95}},
+        )
+        yield Request(
+            "https://example.com/product",
+            meta={"crawling_logs": {"page_type": "product", "probability": 1.0}},
+        )
+        yield Request(
+            "https://example.com/product",
+            meta={"crawling_logs": {"page_type": "product", "probability": 0.05}},
+        )
+        yield Request("https://example.com/unknown")
+        yield Product(url="https://example.com/product")
+
+    caplog.set_level(logging.INFO, logger="zyte_spider_templates.middlewares")
+    logged = []
+    for page_type in ["nextPage"] * 5 + ["product"] * 2 + ["subCategories"] * 2:
+        caplog.clear()
+        output = middleware.process_spider_output(
+            get_response(page_type), results_gen(), None
+        )
+        assert len(list(output)) == 5
+        if "Crawling Logs for" in caplog.text:
+            logged.append(page_type)
+    assert logged == ["nextPage"] * 3 + ["subCategories"] * 2
+    assert crawler.stats.get_value("crawling_logs/sampled_out") == 4
+
+    # Nothing is counted if crawling logs would not be logged.
+    caplog.set_level(logging.WARNING, logger="zyte_spider_templates.middlewares")
+    output = middleware.process_spider_output(
+        get_response("nextPage"), results_gen(), None
+    )
+    assert len(list(output)) == 5
+    caplog.set_level(logging.INFO, logger="zyte_spider_templates.middlewares")
+
+    caplog.clear()
+    middleware.spider_closed(None)
+    assert caplog.text.count("Crawling Logs Summary") == 1
+    summary = json.loads(caplog.text.split("Crawling Logs Summary:\n")[1])
+    assert summary == {
+        "responses": {"nextPage": 5, "product": 2, "subCategories": 2},
+        "logged_responses": 5,
+        "to_crawl": {
+            "product": {"requests": 27, "probability": {"0.0": 9, "0.9": 18}},
+            "unknown": {"requests": 9, "probability": {"none": 9}},
+        },
+    }
+
+
+@ensureDeferred
+async def test_crawling_logs_middleware_sampling_file(tmp_path):
+    path = tmp_path / "crawling_logs.jsonl"
+    crawler = get_crawler(
+        Spider,
+        settings_dict={
+            "CRAWLING_LOGS_FILE": str(path),
+            "CRAWLING_LOGS_SAMPLE_RATE": 3,
+            "CRAWLING_LOGS_SUMMARY_INTERVAL": 0,
+        },
+    )
+    crawler.stats = StatsCollector(crawler)
+    middleware = create_instance(
+        CrawlingLogsMiddleware, settings=crawler.settings, crawler=crawler
+    )
+    assert middleware._summary_task is None
+
+    url = "https://example.com"
+    response = Response(url=url, request=Request(url))
+    for _ in range(4):
+        await result_as_async_gen(
+            middleware, response, [Request("https://example.com/1")], None
+        )
+    crawler.signals.send_catch_log(signal=signals.spider_closed, spider=None)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 3
+    assert all("current" in record for record in records[:2])
+    assert records[2]["summary"] == {
+        "responses": {"unknown": 4},
+        "logged_responses": 2,
+        "to_crawl": {"unknown": {"requests": 4, "probability": {"none": 4}}},
+    }
+
+
 def test_crawling_logs_middleware_deprecated_subclassing():
     class CustomCrawlingLogsMiddleware(CrawlingLogsMiddleware):
         def __init__(self):
@@ -431,6 +664,7 @@ def test_item_offsite_middleware(req, allowed):
 @pytest.fixture
 def mock_crawler():
     mock_settings = MagicMock(spec=Settings)
+    mock_settings.getbool.return_value = False
     mock_crawler = MagicMock(spec=["spider", "settings"])
     mock_crawler.settings = mock_settings
     return mock_crawler
@@ -893,6 +1127,220 @@ def test_process_request_seed_none():
     assert downloader_middleware.requests_per_seed == {}
 
 
+def test_seed_ids():
+    class TestSpider(Spider):
+        name = "test"
+
+    crawler = get_crawler(
+        settings_dict={"SEED_IDS_ENABLED": True, "MAX_REQUESTS_PER_SEED": 2}
+    )
+    crawler.spider = TestSpider()
+    crawler.spider.settings = crawler.settings
+    crawler.stats = StatsCollector(crawler)
+    track_seeds = TrackSeedsSpiderMiddleware(crawler)
+    max_requests = MaxRequestsPerSeedDownloaderMiddleware(crawler)
+    offsite = OffsiteRequestsPerSeedMiddleware(crawler)
+
+    seed_1 = "https://example.com/1"
+    seed_2 = "https://example.org/1"
+    start_requests = [Request(seed_1), Request(seed_2, meta={"seed": "custom"})]
+    request_1, request_2 = track_seeds.process_start_requests(
+        start_requests, crawler.spider
+    )
+    assert request_1.meta["seed"] == 0
+    assert request_2.meta["seed"] == 1
+    for request in (request_1, request_2):
+        max_requests.process_request(request, crawler.spider)
+    assert max_requests.requests_per_seed == {seed_1: 1, "custom": 1}
+
+    response = Response(url=seed_1, request=request_1)
+    response.meta["seed_domains"] = {"example.com"}
+    result = list(
+        offsite.process_spider_output(
+            response,
+            track_seeds.process_spider_output(
+                response,
+                [Request("https://a.example.com"), Request("https://example.net")],
+                crawler.spider,
+            ),
+            crawler.spider,
+        )
+    )
+    assert [request.meta["seed"] for request in result] == [0, 0]  # type: ignore[union-attr]
+    assert offsite.allowed_domains_per_seed == {seed_1: {"example.com"}}
+
+    max_requests.process_request(result[0], crawler.spider)
+    with pytest.raises(IgnoreRequest):
+        max_requests.process_request(result[1], crawler.spider)
+    assert max_requests.requests_per_seed == {seed_1: 2, "custom": 1}
+    assert max_requests.seeds_reached_limit == {seed_1}
+
+
+def test_max_requests_per_seed_adaptive():
+    class TestSpider(Spider):
+        name = "test"
+
+    crawler = get_crawler(
+        settings_dict={
+            "MAX_REQUESTS_PER_SEED": 2,
+            "MAX_REQUESTS_PER_SEED_ADAPTIVE": True,
+        }
+    )
+    crawler.spider = TestSpider()
+    crawler.spider.settings = crawler.settings
+    crawler.stats = StatsCollector(crawler)
+    middleware = MaxRequestsPerSeedDownloaderMiddleware(crawler)
+
+    def schedule(url, seed):
+        request = Request(url, meta={"seed": seed})
+        crawler.signals.send_catch_log(
+            signals.request_scheduled, request=request, spider=crawler.spider
+        )
+        return request
+
+    def download(request, items=0):
+        middleware.process_request(request, crawler.spider)
+        response = Response(request.url, request=request)
+        for _ in range(items):
+            crawler.signals.send_catch_log(
+                signals.item_scraped,
+                item={},
+                response=response,
+                spider=crawler.spider,
+            )
+
+    def send(url, seed, items=0):
+        download(schedule(url, seed), items)
+
+    # Until all start requests have been read, the budget is unknown, so
+    # seeds cannot go over their share.
+    send("https://a.example/1", "a", 1)
+    send("https://a.example/2", "a", 1)
+    with pytest.raises(IgnoreRequest):
+        send("https://a.example/3", "a")
+
+    # Every seed has 2 requests in a common 2 * 4 budget. The share of seeds
+    # without requests yet, like c and d, is reserved.
+    start_requests = [
+        Request(f"https://{seed}.example", meta={"seed": seed}) for seed in "abcd"
+    ]
+    track_seeds = TrackSeedsSpiderMiddleware(crawler)
+    assert (
+        len(list(track_seeds.process_start_requests(start_requests, crawler.spider)))
+        == 4
+    )
+    with pytest.raises(IgnoreRequest):
+        send("https://a.example/3", "a")
+
+    # Seed b has no pending requests, so seed a can use its unused share.
+    send("https://b.example/1", "b")
+    c1, c2 = schedule("https://c.example/1", "c"), schedule("https://c.example/2", "c")
+    send("https://a.example/4", "a", 1)
+    assert crawler.stats.get_value("seeds/released_budget_requests") == 1
+
+    # Seed c has pending requests, so the rest of its share is reserved.
+    with pytest.raises(IgnoreRequest):
+        send("https://a.example/5", "a")
+
+    # Once its ratio of items per request is below that of the crawl, seed c
+    # releases the rest of its share, even with pending requests.
+    download(c1)
+    send("https://a.example/6", "a", 1)
+    assert crawler.stats.get_value("seeds/released_budget_requests") == 2
+
+    # Seed c can then only use what is left of its share.
+    with pytest.raises(IgnoreRequest):
+        download(c2)
+    send("https://d.example/1", "d")
+    send("https://c.example/3", "c")
+    assert middleware.requests_per_seed == {"a": 4, "b": 1, "c": 2, "d": 1}
+
+    # The whole budget has been used.
+    with pytest.raises(IgnoreRequest):
+        send("https://a.example/7", "a")
+
+
+def test_max_requests_per_seed_adaptive_ignored_before():
+    class TestSpider(Spider):
+        name = "test"
+
+    crawler = get_crawler(
+        settings_dict={
+            "MAX_REQUESTS_PER_SEED": 1,
+            "MAX_REQUESTS_PER_SEED_ADAPTIVE": True,
+        }
+    )
+    crawler.spider = TestSpider()
+    crawler.spider.settings = crawler.settings
+    crawler.stats = StatsCollector(crawler)
+    middleware = MaxRequestsPerSeedDownloaderMiddleware(crawler)
+
+    def schedule(url, seed):
+        request = Request(url, meta={"seed": seed})
+        crawler.signals.send_catch_log(
+            signals.request_scheduled, request=request, spider=crawler.spider
+        )
+        return request
+
+    start_requests = [
+        Request(f"https://{seed}.example", meta={"seed": seed}) for seed in "ab"
+    ]
+    track_seeds = TrackSeedsSpiderMiddleware(crawler)
+    assert (
+        len(list(track_seeds.process_start_requests(start_requests, crawler.spider)))
+        == 2
+    )
+    middleware.process_request(schedule("https://a.example/1", "a"), crawler.spider)
+    b1 = schedule("https://b.example/1", "b")
+
+    # The share of seed b is reserved while its request is pending.
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(schedule("https://a.example/2", "a"), crawler.spider)
+
+    # An earlier downloader middleware drops the request of seed b, so this
+    # middleware only gets process_exception, which releases its share.
+    middleware.process_exception(b1, IgnoreRequest(), crawler.spider)
+    a3 = schedule("https://a.example/3", "a")
+    middleware.process_request(a3, crawler.spider)
+    assert middleware.requests_per_seed == {"a": 2}
+
+
+def test_max_requests_per_seed_release_enqueued():
+    class TestSpider(Spider):
+        name = "test"
+
+    crawler = get_crawler(settings_dict={"MAX_REQUESTS_PER_SEED": 1})
+    crawler.spider = TestSpider()
+    crawler.spider.settings = crawler.settings
+    crawler.stats = StatsCollector(crawler)
+    crawler.engine = SimpleNamespace(  # type: ignore[assignment]
+        downloader=SimpleNamespace(
+            slots={},
+            get_slot_key=lambda request: "",
+            _get_slot_key=lambda request, spider: "",  # Scrapy < 2.12
+        )
+    )
+    queue = SeedAwarePriorityQueue(crawler, FifoMemoryQueue, "")
+    middleware = MaxRequestsPerSeedDownloaderMiddleware(crawler)
+
+    # A request filtered out by another downloader middleware does not count
+    # towards the enqueued requests of its seed.
+    queue.push(Request("https://other.example/1", meta={"seed": "a"}))
+    request = queue.pop()
+    middleware.process_exception(request, IgnoreRequest(), crawler.spider)
+    queue.push(Request("https://a.example/1", meta={"seed": "a"}))
+    request = queue.pop()
+    assert request is not None
+
+    # Requests dropped by this middleware still count.
+    middleware.process_request(request, crawler.spider)
+    middleware.process_exception(
+        request, IgnoreRequest("max_requests_per_seed_reached"), crawler.spider
+    )
+    queue.push(Request("https://a.example/2", meta={"seed": "a"}))
+    assert len(queue) == 0
+
+
 def test_offsite_requests_per_seed_middleware_not_configured():
     class TestSpider(Spider):
         name = "test"
@@ -1263,6 +1711,54 @@ async def test_offsite_requests_per_seed_middleware_async():
     assert request.meta["seed"] == seed
 
 
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://example.com/1",
+        "https://EXAMPLE.com/1",
+        "https://blog.example.com/1",
+        "https://a.b.example.com/1",
+        "https://example.com:8080/1",
+        "https://notexample.com/1",
+        "https://example.com.evil.org/1",
+        "https://foo.example.org/1",
+        "https://example.org/1",
+        "https://com/1",
+    ],
+)
+def test_offsite_requests_per_seed_middleware_domain_matching(url):
+    class TestSpider(Spider):
+        name = "test"
+
+    crawler = get_crawler()
+    crawler.spider = TestSpider()
+    crawler.stats = StatsCollector(crawler)
+    crawler.spider.settings = Settings({"OFFSITE_REQUESTS_PER_SEED_ENABLED": True})
+    middleware = OffsiteRequestsPerSeedMiddleware(crawler)
+    seed = "https://example.com"
+    domains = {"Example.com", "foo.example.org"}
+    response = Response(
+        url=seed,
+        request=Request(seed, meta={"seed": seed, "is_seed_request": True}),
+    )
+    response.meta["seed_domains"] = domains
+    middleware._fill_allowed_domains_per_seed_dict(response)
+    assert middleware.allowed_domains_per_seed == {seed: domains}
+
+    request = Request(url, meta={"seed": seed})
+    expected = url_is_from_any_domain(url, domains)
+    assert middleware._is_domain_per_seed_allowed(request) is expected
+
+    middleware.allowed_domains_per_seed = {seed: domains}
+    assert middleware._is_domain_per_seed_allowed(request) is expected
+
+    # Domains can be any iterable, e.g. a generator.
+    middleware = OffsiteRequestsPerSeedMiddleware(crawler)
+    middleware._add_allowed_domains(seed, (domain for domain in domains))
+    assert middleware.allowed_domains_per_seed == {seed: domains}
+    assert middleware._is_domain_per_seed_allowed(request) is expected
+
+
 @pytest.mark.parametrize(
     "meta, expected_is_seed_request, expected_seed",
     [
@@ -1648,6 +2144,212 @@ async def test_dupe_filter_spider_middleware_async():
     assert processed_output[1] == item
 
 
+@pytest.mark.parametrize(
+    "backend,load_factor",
+    (("set", False), ("hash_table", True), ("bloom", True), ("disk", False)),
+)
+def test_dupe_filter_spider_middleware_backends(backend, load_factor):
+    class TestSpider(Spider):
+        name = "test"
+
+    crawler = get_crawler_with_settings(settings={"DUPE_FILTER_BACKEND": backend})
+    crawler.spider = TestSpider()
+    crawler.stats = StatsCollector(crawler)
+    middleware = DupeFilterSpiderMiddleware(crawler)
+
+    response = Response(url=f"https://example.com/{backend}")
+    result = [
+        Request(url=f"https://example.com/{backend}/1"),
+        Request(url=f"https://example.com/{backend}/2"),
+        Request(url=f"https://example.com/{backend}/1"),
+    ]
+    processed_output = list(
+        middleware.process_spider_output(response, result, crawler.spider)
+    )
+    assert [request.url for request in processed_output] == [  # type: ignore[union-attr]
+        f"https://example.com/{backend}/1",
+        f"https://example.com/{backend}/2",
+    ]
+
+    crawler.signals.send_catch_log(signals.spider_closed, spider=crawler.spider)
+    stats = crawler.stats.get_stats()
+    assert stats["dupe_filter_spider_mw/url_already_seen"] == 1
+    assert stats["dupe_filter_spider_mw/memory"] > 0
+    assert ("dupe_filter_spider_mw/load_factor" in stats) is load_factor
+
+
+@pytest.mark.parametrize("shared", (False, True))
+def test_dupe_filter_spider_middleware_per_crawler(shared):
+    class TestSpider(Spider):
+        name = "test"
+
+    middlewares = []
+    for _ in range(2):
+        crawler = get_crawler_with_settings(settings={"DUPE_FILTER_SHARED": shared})
+        crawler.spider = TestSpider()
+        crawler.stats = StatsCollector(crawler)
+        middlewares.append(DupeFilterSpiderMiddleware(crawler))
+
+    request = Request(url="https://example.com/per-crawler")
+    assert not middlewares[0].url_already_seen(None, request)
+    assert middlewares[1].url_already_seen(None, request) is shared
+    assert (middlewares[0].fingerprints is middlewares[1].fingerprints) is shared
+
+    first, second = middlewares
+    first.crawler.signals.send_catch_log(signals.spider_closed, spider=None)
+    assert len(first.fingerprints) == 0
+    assert second.url_already_seen(None, request)
+    assert bool(DupeFilterSpiderMiddleware._shared_fingerprints) is shared
+
+    second.crawler.signals.send_catch_log(signals.spider_closed, spider=None)
+    assert len(second.fingerprints) == 0
+    assert DupeFilterSpiderMiddleware._shared_fingerprints == {}
+    assert DupeFilterSpiderMiddleware._shared_users == {}
+
+
+def test_dupe_filter_spider_middleware_shared_jobdir(tmp_path):
+    class TestSpider(Spider):
+        name = "test"
+
+    middlewares = []
+    for jobdir in ("a", "a", "b"):
+        settings = {
+            "DUPE_FILTER_BACKEND": "disk",
+            "DUPE_FILTER_SHARED": True,
+            "JOBDIR": str(tmp_path / jobdir),
+        }
+        crawler = get_crawler_with_settings(settings=settings)
+        crawler.spider = TestSpider()
+        crawler.stats = StatsCollector(crawler)
+        middlewares.append(DupeFilterSpiderMiddleware(crawler))
+
+    # Disk stores are only shared by crawlers with the same JOBDIR.
+    assert middlewares[0].fingerprints is middlewares[1].fingerprints
+    assert middlewares[0].fingerprints is not middlewares[2].fingerprints
+    store = middlewares[2].fingerprints
+    assert isinstance(store, DiskFingerprintStore)
+    assert store.path == str(tmp_path / "b" / "dupe_filter")
+
+    for middleware in middlewares:
+        middleware.crawler.signals.send_catch_log(signals.spider_closed, spider=None)
+    assert DupeFilterSpiderMiddleware._shared_fingerprints == {}
+
+
+def test_dupe_filter_spider_middleware_invalid_backend():
+    crawler = get_crawler_with_settings(settings={"DUPE_FILTER_BACKEND": "foo"})
+    with pytest.raises(ValueError, match="Unsupported DUPE_FILTER_BACKEND"):
+        DupeFilterSpiderMiddleware(crawler)
+
+
+CANONICALIZE_URLS = (
+    "https://example.com/a?utm_source=x&b=1",
+    "https://Example.com:443/a/../b?b=2&a=1#top",
+    "https://www.nytimes.com/a?smid=x&utm_source=y",
+    "https://www.amazon.com/Some-Product/dp/B0000?ref=x&th=1",
+    "https://www.amazon.com/gp/help?utm_source=y",
+    "https://sub.marksandspencer.com/p?pid=1&q=2",
+    "http://127.0.0.1:8080/?utm_medium=x",
+)
+
+
+@pytest.mark.parametrize("url", CANONICALIZE_URLS)
+def test_domain_rule_index_parity(url):
+    assert RULE_PATHS
+    rule_index = DomainRuleIndex(RULE_PATHS)
+    canonicalizer = UrlCanonicalizer(RULE_PATHS)
+    host = urlparse_cached(Request(url)).netloc
+    assert rule_index.process_url(url, host) == canonicalizer.process_url(url)
+
+
+def test_canonicalize_urls_spider_middleware():
+    crawler = get_crawler_with_settings(settings={"DUD_LOAD_RULE_PATHS": RULE_PATHS})
+    crawler.stats = StatsCollector(crawler)
+    middleware = CanonicalizeUrlsSpiderMiddleware.from_crawler(crawler)
+    assert len(middleware.rule_index) > 0
+
+    item = Article(url="https://example.com/article?utm_source=x")
+    unchanged = Request("https://example.com/b")
+    skipped = Request("https://example.com/c?utm_source=x", meta={"dud": False})
+    result = [
+        Request(
+            "https://example.com/a?utm_source=x&b=1",
+            meta={"seed": "https://example.com"},
+        ),
+        item,
+        unchanged,
+        skipped,
+    ]
+    response = Response(url="https://example.com")
+    output = list(middleware.process_spider_output(response, result, None))
+    assert output == result
+    request = result[0]
+    assert isinstance(request, Request)
+    assert request.url == "https://example.com/a?utm_source=x&b=1"
+    assert request.meta == {
+        "seed": "https://example.com",
+        "dud_canonical_url": "https://example.com/a?b=1",
+    }
+    assert "dud_canonical_url" not in unchanged.meta
+    assert "dud_canonical_url" not in skipped.meta
+    assert crawler.stats.get_stats() == {
+        "canonicalize_urls_spider_mw/url_canonicalized": 1
+    }
+
+
+@ensureDeferred
+async def test_canonicalize_urls_spider_middleware_async():
+    crawler = get_crawler_with_settings()
+    crawler.stats = StatsCollector(crawler)
+    middleware = CanonicalizeUrlsSpiderMiddleware(crawler)
+
+    async def result():
+        yield Request("https://example.com/a?utm_medium=x")
+        yield Request("https://example.com/a")
+
+    response = Response(url="https://example.com")
+    output = [
+        request
+        async for request in middleware.process_spider_output_async(
+            response, result(), None
+        )
+    ]
+    assert [request.url for request in output] == [  # type: ignore[union-attr]
+        "https://example.com/a?utm_medium=x",
+        "https://example.com/a",
+    ]
+    assert output[0].meta["dud_canonical_url"] == "https://example.com/a"  # type: ignore[union-attr]
+
+
+def test_canonicalize_urls_dupe_filter():
+    class TestSpider(Spider):
+        name = "test"
+
+    crawler = get_crawler_with_settings()
+    crawler.spider = TestSpider()
+    crawler.stats = StatsCollector(crawler)
+    canonicalize = CanonicalizeUrlsSpiderMiddleware(crawler)
+    dupe_filter = DupeFilterSpiderMiddleware(crawler)
+
+    result = [
+        Request("https://example.com/a?utm_medium=x"),
+        Request("https://example.com/a?utm_source=y"),
+        Request("https://example.com/b"),
+    ]
+    response = Response(url="https://example.com")
+    output = list(
+        dupe_filter.process_spider_output(
+            response,
+            canonicalize.process_spider_output(response, result, None),
+            None,
+        )
+    )
+    # Duplicates are found by canonical URL, but the original URL is kept.
+    assert [request.url for request in output] == [  # type: ignore[union-attr]
+        "https://example.com/a?utm_medium=x",
+        "https://example.com/b",
+    ]
+
+
 def test_track_navigation_depth_spider_middleware():
     class TestSpider(Spider):
         name = "test"
@@ -0,0 +1,191 @@
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from scrapy import Request, signals
+from scrapy.squeues import FifoMemoryQueue, PickleFifoDiskQueue
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.test import get_crawler
+
+from zyte_spider_templates import SeedAwarePriorityQueue
+from zyte_spider_templates._pqueues import release_request
+
+
+def _get_crawler(settings=None):
+    crawler = get_crawler(settings_dict=settings)
+    crawler.stats = StatsCollector(crawler)
+    crawler.engine = SimpleNamespace(  # type: ignore[assignment]
+        downloader=SimpleNamespace(
+            slots={},
+            get_slot_key=lambda request: urlparse_cached(request).hostname,
+            # Scrapy < 2.12
+            _get_slot_key=lambda request, spider: urlparse_cached(request).hostname,
+        )
+    )
+    return crawler
+
+
+def _request(url, seed=None, priority=0):
+    meta = {} if seed is None else {"seed": seed}
+    return Request(url, meta=meta, priority=priority)
+
+
+def _pop_all(queue):
+    urls = []
+    while (request := queue.pop()) is not None:
+        urls.append(request.url)
+    return urls
+
+
+def test_round_robin_per_priority():
+    queue = SeedAwarePriorityQueue(_get_crawler(), FifoMemoryQueue, "")
+    for i in range(1, 4):
+        queue.push(_request(f"https://example.com/a{i}", seed="a"))
+    queue.push(_request("https://example.com/b1", seed="b"))
+    queue.push(_request("https://example.com/b2", seed="b"))
+    queue.push(_request("https://example.com/c1", seed="c"))
+    queue.push(_request("https://example.com/n1"))
+    queue.push(_request("https://example.com/a0", seed="a", priority=1))
+    assert len(queue) == 8
+    request = queue.peek()
+    assert request is not None
+    assert request.url == "https://example.com/a0"
+    assert _pop_all(queue) == [
+        "https://example.com/a0",
+        "https://example.com/a1",
+        "https://example.com/b1",
+        "https://example.com/c1",
+        "https://example.com/n1",
+        "https://example.com/a2",
+        "https://example.com/b2",
+        "https://example.com/a3",
+    ]
+    assert len(queue) == 0
+
+
+def test_max_requests_per_seed():
+    # The budget is shared by the memory and disk queues of the scheduler.
+    crawler = _get_crawler({"MAX_REQUESTS_PER_SEED": 2})
+    memory_queue = SeedAwarePriorityQueue(crawler, FifoMemoryQueue, "")
+    other_queue = SeedAwarePriorityQueue(crawler, FifoMemoryQueue, "")
+    memory_queue.push(_request("https://example.com/a1", seed="a"))
+    other_queue.push(_request("https://example.com/a2", seed="a"))
+    memory_queue.push(_request("https://example.com/a3", seed="a"))
+    other_queue.push(_request("https://example.com/b1", seed="b"))
+    memory_queue.push(_request("https://example.com/n1"))
+    memory_queue.push(_request("https://example.com/n2"))
+    memory_queue.push(_request("https://example.com/n3"))
+    assert crawler.stats.get_value("seeds/max_requests_dropped") == 1
+    assert _pop_all(memory_queue) == [
+        "https://example.com/a1",
+        "https://example.com/n1",
+        "https://example.com/n2",
+        "https://example.com/n3",
+    ]
+    assert _pop_all(other_queue) == [
+        "https://example.com/a2",
+        "https://example.com/b1",
+    ]
+
+    # The budget is about enqueued requests, dequeuing does not reset it.
+    memory_queue.push(_request("https://example.com/a4", seed="a"))
+    assert len(memory_queue) == 0
+    assert crawler.stats.get_value("seeds/max_requests_dropped") == 2
+
+    # Requests filtered out before download release their share.
+    release_request(crawler, _request("https://other.example/a2", seed="a"))
+    memory_queue.push(_request("https://example.com/a5", seed="a"))
+    memory_queue.push(_request("https://example.com/a6", seed="a"))
+    assert _pop_all(memory_queue) == ["https://example.com/a5"]
+    assert crawler.stats.get_value("seeds/max_requests_dropped") == 3
+
+
+def test_max_requests_per_seed_dropped_signal():
+    crawler = _get_crawler({"MAX_REQUESTS_PER_SEED": 1})
+    dropped: List[Request] = []
+
+    def request_dropped(request, spider):
+        dropped.append(request)
+
+    crawler.signals.connect(request_dropped, signal=signals.request_dropped)
+    queue = SeedAwarePriorityQueue(crawler, FifoMemoryQueue, "")
+    queue.push(_request("https://example.com/a1", seed="a"))
+    request = _request("https://example.com/a2", seed="a")
+    queue.push(request)
+    assert dropped == [request]
+
+
+def test_push_error(tmp_path):
+    crawler = _get_crawler({"MAX_REQUESTS_PER_SEED": 1})
+    key = str(tmp_path / "requests.queue")
+    queue = SeedAwarePriorityQueue(crawler, PickleFifoDiskQueue, key)
+    request = _request("https://example.com/a1", seed="a")
+    request.meta["unpicklable"] = lambda: None
+    with pytest.raises(ValueError):
+        queue.push(request)
+    # A request that could not be enqueued does not count towards the budget.
+    queue.push(_request("https://example.com/a2", seed="a"))
+    assert len(queue) == 1
+    queue.close()
+
+
+def test_resume(tmp_path):
+    crawler = _get_crawler()
+    key = str(tmp_path / "requests.queue")
+    queue = SeedAwarePriorityQueue(crawler, PickleFifoDiskQueue, key)
+    queue.push(_request("https://example.com/a1", seed="a"))
+    queue.push(_request("https://example.com/a2", seed="a"))
+    queue.push(_request("https://example.com/b1", seed="b"))
+    queue.push(_request("https://example.com/a3", seed="a", priority=1))
+    request = queue.pop()
+    assert request is not None
+    assert request.url == "https://example.com/a3"
+    state = queue.close()
+    assert state
+
+    queue = SeedAwarePriorityQueue(crawler, PickleFifoDiskQueue, key, state)
+    assert len(queue) == 3
+    assert sorted(_pop_all(queue)[:2]) == [
+        "https://example.com/a1",
+        "https://example.com/b1",
+    ]
+    assert queue.close() == {}
+
+
+def test_max_requests_per_seed_adaptive():
+    crawler = _get_crawler(
+        {"MAX_REQUESTS_PER_SEED": 1, "MAX_REQUESTS_PER_SEED_ADAPTIVE": True}
+    )
+    queue = SeedAwarePriorityQueue(crawler, FifoMemoryQueue, "")
+    queue.push(_request("https://example.com/a1", seed="a"))
+    queue.push(_request("https://example.com/a2", seed="a"))
+    assert len(queue) == 2
+
+
+def test_max_open_disk_queues(tmp_path, monkeypatch):
+    monkeypatch.setattr("zyte_spider_templates._pqueues._MAX_OPEN_DISK_QUEUES", 2)
+    crawler = _get_crawler()
+    key = str(tmp_path / "requests.queue")
+    queue = SeedAwarePriorityQueue(crawler, PickleFifoDiskQueue, key)
+    for i in range(1, 3):
+        for seed in "abcde":
+            queue.push(_request(f"https://example.com/{seed}{i}", seed=seed))
+    assert len(queue._open_queues._queues) == 2
+    assert len(queue) == 10
+
+    # Closed seed queues are opened again from disk when needed.
+    assert _pop_all(queue) == [
+        f"https://example.com/{seed}{i}" for i in range(1, 3) for seed in "abcde"
+    ]
+    assert len(queue._open_queues._queues) == 0
+    assert queue.close() == {}
+
+
+def test_memory_queues_stay_open(monkeypatch):
+    monkeypatch.setattr("zyte_spider_templates._pqueues._MAX_OPEN_DISK_QUEUES", 2)
+    queue = SeedAwarePriorityQueue(_get_crawler(), FifoMemoryQueue, "")
+    for seed in "abcde":
+        queue.push(_request(f"https://example.com/{seed}1", seed=seed))
+    assert len(queue._open_queues._queues) == 5
+    assert len(_pop_all(queue)) == 5
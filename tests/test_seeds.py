@@ -0,0 +1,85 @@
+import pickle
+
+from scrapy.utils.test import get_crawler
+
+from zyte_spider_templates._seeds import SeedRegistry, get_seed_registry
+
+
+def test_seed_ids(caplog):
+    registry = SeedRegistry(ids_in_meta=True)
+    seed_id = registry.to_meta("https://example.com")
+    assert type(seed_id) is int
+    assert seed_id == 0
+    assert registry.to_meta(seed_id) == 0
+    assert registry.get_id(seed_id) == registry.find_id(seed_id) == 0
+    assert registry.get_seed(seed_id) == "https://example.com"
+    assert len(pickle.dumps(seed_id)) < 16
+
+    # Seed IDs of a different registry do not raise, but each of them is
+    # counted as a seed of its own.
+    assert registry.find_id(3) is None
+    assert registry.get_seed(3) == "<unknown seed 3>"
+    assert "Found unknown seed ID" not in caplog.text
+    assert registry.get_id(3) == 3
+    assert "Found unknown seed ID 3" in caplog.text
+    assert registry.seeds[1:] == [
+        "<unknown seed 1>",
+        "<unknown seed 2>",
+        "<unknown seed 3>",
+    ]
+    assert registry.get_id("https://example.org") == 4
+
+    # Other values, including negative integers, are seeds.
+    assert registry.get_id(-1) == 5
+    assert registry.get_seed(-1) == -1
+
+
+def test_seed_ids_disabled():
+    registry = SeedRegistry()
+    assert registry.to_meta("https://example.com") == "https://example.com"
+    assert registry.get_id("https://example.com") == 0
+    assert registry.get_id(0) == 1
+    assert registry.get_seed(0) == 0
+
+
+def test_persistence(tmp_path, caplog):
+    path = str(tmp_path / "seed_registry")
+    registry = SeedRegistry(ids_in_meta=True, path=path)
+    seed_ids = [registry.to_meta(seed) for seed in ("a", "b")]
+    registry.close()
+
+    registry = SeedRegistry(ids_in_meta=True, path=path)
+    assert [registry.get_seed(seed_id) for seed_id in seed_ids] == ["a", "b"]
+    assert registry.get_id("c") == 2
+    registry.close()
+
+    # A seed cut short by a crash is dropped.
+    with open(path, "ab") as file:
+        file.write(pickle.dumps("d")[:-2])
+    registry = SeedRegistry(ids_in_meta=True, path=path)
+    assert "Ignoring an incomplete seed" in caplog.text
+    assert registry.seeds == ["a", "b", "c"]
+    assert registry.get_id("e") == 3
+    registry.close()
+    assert SeedRegistry(path=path).seeds == ["a", "b", "c", "e"]
+
+
+def test_get_seed_registry(tmp_path):
+    crawler = get_crawler(settings_dict={"SEED_IDS_ENABLED": True})
+    registry = get_seed_registry(crawler)
+    assert get_seed_registry(crawler) is registry
+    assert registry.ids_in_meta
+    assert registry._file is None
+
+    jobdir = tmp_path / "job"
+    crawler = get_crawler(
+        settings_dict={"SEED_IDS_ENABLED": True, "JOBDIR": str(jobdir)}
+    )
+    registry = get_seed_registry(crawler)
+    registry.get_id("a")
+    registry.close()
+    assert SeedRegistry(path=str(jobdir / "seed_registry")).seeds == ["a"]
+
+    # The registry is only kept if seed IDs are stored in requests.
+    crawler = get_crawler(settings_dict={"JOBDIR": str(tmp_path / "other")})
+    assert get_seed_registry(crawler)._file is None
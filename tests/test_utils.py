@@ -1,14 +1,18 @@
 import logging
 import os
-from unittest.mock import patch
+from unittest.mock import call, patch
 
 import pytest
 from scrapy import Request, Spider
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.request import RequestFingerprinter
 
 from tests import get_crawler
 from zyte_spider_templates.utils import (
+    get_compact_fingerprint,
     get_domain,
     get_domain_fingerprint,
+    get_fingerprint,
     get_project_id,
     get_request_fingerprint,
     get_spider_name,
@@ -212,3 +216,56 @@ def test_get_request_fingerprint():
             result = get_request_fingerprint(crawler, request)
             assert result == domain_fp + request_fp
             mock_fingerprinter.fingerprint.assert_called_once_with(request)
+
+
+def test_get_fingerprint():
+    crawler = get_crawler()
+    crawler.stats = StatsCollector(crawler)
+    with patch.object(crawler, "request_fingerprinter") as mock_fingerprinter:
+        mock_fingerprinter.fingerprint.side_effect = (
+            lambda request: request.url.encode()
+        )
+        request = Request("https://example.com")
+
+        # The fingerprinter caches fingerprints of requests itself.
+        assert get_fingerprint(crawler, request) == b"https://example.com"
+        assert (
+            get_fingerprint(crawler, request, "https://example.com")
+            == b"https://example.com"
+        )
+        assert mock_fingerprinter.fingerprint.call_args_list == [
+            call(request),
+            call(request),
+        ]
+        assert crawler.stats.get_value("fingerprint_cache/hits") is None
+
+        # Copies of the request with a different URL are cached.
+        url = "https://example.com/other"
+        assert get_fingerprint(crawler, request, url) == url.encode()
+        assert get_fingerprint(crawler, request, url) == url.encode()
+        assert mock_fingerprinter.fingerprint.call_count == 3
+        assert crawler.stats.get_value("fingerprint_cache/hits") == 1
+
+        # Fingerprints are cached per fingerprinter.
+        fingerprinter = RequestFingerprinter()
+        assert get_fingerprint(
+            crawler, request, url, fingerprinter=fingerprinter
+        ) == fingerprinter.fingerprint(Request(url))
+        assert mock_fingerprinter.fingerprint.call_count == 3
+
+
+def test_get_request_fingerprint_url():
+    crawler = get_crawler()
+    crawler.request_fingerprinter = RequestFingerprinter()
+    request = Request("https://example.com")
+    url = "https://sub.example.com/other"
+    assert get_request_fingerprint(crawler, request, url) == get_request_fingerprint(
+        crawler, Request(url)
+    )
+    assert get_request_fingerprint(crawler, request, url).startswith("c35d")
+
+
+def test_get_compact_fingerprint():
+    fingerprint = "c35d" + "00ff" * 10
+    assert get_compact_fingerprint(fingerprint) == "c35dAP8A_wD_AP8A_wD_"
+    assert get_compact_fingerprint(fingerprint, size=3) == "c35dAP8A"
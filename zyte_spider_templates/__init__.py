@@ -2,8 +2,10 @@ from importlib.metadata import version
 from logging import getLogger
 
 from ._incremental.middleware import IncrementalCrawlMiddleware
+from ._pqueues import SeedAwarePriorityQueue
 from .middlewares import (
     AllowOffsiteMiddleware,
+    CanonicalizeUrlsSpiderMiddleware,
     CrawlingLogsMiddleware,
     MaxRequestsPerSeedDownloaderMiddleware,
     OffsiteRequestsPerSeedMiddleware,
@@ -7,6 +7,7 @@ from scrapy.utils.misc import load_object
 
 from zyte_spider_templates import (
     AllowOffsiteMiddleware,
+    CanonicalizeUrlsSpiderMiddleware,
     CrawlingLogsMiddleware,
     IncrementalCrawlMiddleware,
     MaxRequestsPerSeedDownloaderMiddleware,
@@ -15,6 +16,8 @@ from zyte_spider_templates import (
     TrackNavigationDepthSpiderMiddleware,
     TrackSeedsSpiderMiddleware,
 )
+from zyte_spider_templates._latency import timed_spider_middleware
+from zyte_spider_templates.middlewares import DupeFilterSpiderMiddleware
 
 logger = getLogger(__name__)
 
@@ -104,6 +107,32 @@ def _setdefault(settings: BaseSettings, setting: str, cls: Type, pos: int) -> No
     settings[setting][cls] = pos
 
 
+_TIMED_SPIDER_MIDDLEWARES = (
+    CanonicalizeUrlsSpiderMiddleware,
+    CrawlingLogsMiddleware,
+    DupeFilterSpiderMiddleware,
+    IncrementalCrawlMiddleware,
+    OffsiteRequestsPerSeedMiddleware,
+    OnlyFeedsMiddleware,
+    TrackNavigationDepthSpiderMiddleware,
+    TrackSeedsSpiderMiddleware,
+)
+
+
+def _time_spider_middlewares(settings: BaseSettings) -> None:
+    """Replace spider middlewares from this package with subclasses that
+    record their latency, keeping their position."""
+    setting_value = settings["SPIDER_MIDDLEWARES"]
+    for cls_or_path, pos in list(setting_value.items()):
+        if pos is None:
+            continue
+        cls = load_object(cls_or_path) if isinstance(cls_or_path, str) else cls_or_path
+        if not issubclass(cls, _TIMED_SPIDER_MIDDLEWARES):
+            continue
+        setting_value[cls_or_path] = None
+        setting_value[timed_spider_middleware(cls)] = pos
+
+
 class Addon:
     def update_settings(self, settings: BaseSettings) -> None:
         for setting, value in (
@@ -164,3 +193,6 @@ class Addon:
                 OffsiteMiddleware,
                 AllowOffsiteMiddleware,
             )
+
+        if settings.getbool("MIDDLEWARE_LATENCY_STATS_ENABLED"):
+            _time_spider_middlewares(settings)
@@ -0,0 +1,109 @@
+import json
+import logging
+from collections import defaultdict
+from queue import Full, Queue
+from threading import Thread
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def encode_json_line(record: Any) -> bytes:
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+
+class CrawlingLogsWriter:
+    """Writes crawling log records to a file from a background thread.
+
+    Records are encoded into bytes by *encode* in the writer thread, so that
+    serialization does not block the reactor. If the writer falls behind
+    and its queue of *queue_size* records gets full, new records are dropped
+    instead of blocking, and :meth:`write` returns ``False``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        queue_size: int,
+        encode: Callable[[Any], bytes] = encode_json_line,
+    ):
+        self._encode = encode
+        self._file = open(path, "ab")
+        self._queue: Queue = Queue(maxsize=max(queue_size, 1))
+        self._thread: Optional[Thread] = Thread(
+            target=self._run, name="crawling-logs-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, record: Any) -> bool:
+        try:
+            self._queue.put_nowait(record)
+        except Full:
+            return False
+        return True
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is _STOP:
+                break
+            try:
+                self._file.write(self._encode(record))
+            except Exception:
+                logger.exception(f"Could not write crawling logs record {record!r}")
+            if self._queue.empty():
+                self._file.flush()
+        self._file.close()
+
+    def close(self) -> None:
+        """Write pending records and close the file."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+
+class CrawlingLogsSummary:
+    """Aggregates, per page type, the number of responses parsed and the
+    number of requests to crawl, along with the distribution of the
+    probability of those requests in 0.1-wide buckets."""
+
+    def __init__(self, unknown_page_type: str):
+        self.unknown_page_type = unknown_page_type
+        self.responses: Dict[str, int] = defaultdict(int)
+        self.logged_responses = 0
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.probabilities: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+
+    def add_response(self, page_type: Optional[str], logged: bool) -> None:
+        self.responses[page_type or self.unknown_page_type] += 1
+        if logged:
+            self.logged_responses += 1
+
+    def add_request(self, crawling_logs: Dict[str, Any]) -> None:
+        page_type = crawling_logs.get("page_type") or self.unknown_page_type
+        self.requests[page_type] += 1
+        probability = crawling_logs.get("probability")
+        if probability is None:
+            bucket = "none"
+        else:
+            bucket = f"{min(max(int(probability * 10), 0), 9) / 10:.1f}"
+        self.probabilities[page_type][bucket] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "responses": dict(self.responses),
+            "logged_responses": self.logged_responses,
+            "to_crawl": {
+                page_type: {
+                    "requests": count,
+                    "probability": dict(sorted(self.probabilities[page_type].items())),
+                }
+                for page_type, count in self.requests.items()
+            },
+        }
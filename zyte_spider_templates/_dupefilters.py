@@ -0,0 +1,417 @@
+import math
+import mmap
+import os
+import re
+import sys
+from hashlib import blake2b
+from heapq import merge
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type
+
+from scrapy.settings import BaseSettings
+from scrapy.utils.job import job_dir
+
+
+class FingerprintStore:
+    """Set of request fingerprints, as raw bytes."""
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings):
+        return cls()
+
+    @classmethod
+    def sharing_key(cls, settings: BaseSettings) -> Tuple[Any, ...]:
+        """Return the values of *settings* that :meth:`from_settings` uses,
+        so that crawlers only share a store built from equivalent settings."""
+        return ()
+
+    def add(self, fingerprint: bytes) -> bool:
+        """Add *fingerprint*, and return ``True`` if it had already been
+        added."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def memory_usage(self) -> int:
+        """Approximate memory usage, in bytes."""
+        raise NotImplementedError
+
+    @property
+    def load_factor(self) -> Optional[float]:
+        return None
+
+    def close(self) -> None:
+        pass
+
+    def to_stats(self, stats, prefix: str) -> None:
+        stats.set_value(f"{prefix}/fingerprints", len(self))
+        stats.set_value(f"{prefix}/memory", self.memory_usage)
+        if (load_factor := self.load_factor) is not None:
+            stats.set_value(f"{prefix}/load_factor", round(load_factor, 4))
+
+
+class SetFingerprintStore(FingerprintStore):
+    """Stores fingerprints as hexadecimal strings in a Python set, like
+    :class:`~scrapy.dupefilters.RFPDupeFilter`."""
+
+    def __init__(self):
+        self.fingerprints: Set[str] = set()
+
+    def add(self, fingerprint: bytes) -> bool:
+        hex_fingerprint = fingerprint.hex()
+        if hex_fingerprint in self.fingerprints:
+            return True
+        self.fingerprints.add(hex_fingerprint)
+        return False
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    @property
+    def memory_usage(self) -> int:
+        if not self.fingerprints:
+            return sys.getsizeof(self.fingerprints)
+        item_size = sys.getsizeof(next(iter(self.fingerprints)))
+        return sys.getsizeof(self.fingerprints) + item_size * len(self)
+
+
+class HashTableFingerprintStore(FingerprintStore):
+    """Stores fingerprints as fixed-width raw bytes in an open-addressing hash
+    table with linear probing, backed by a single :class:`bytearray`.
+
+    Fingerprints are expected to be hashes, e.g. SHA1 digests, so their
+    first bytes are used as hash value. The table doubles its capacity when
+    its load factor would exceed *max_load_factor*.
+    """
+
+    def __init__(self, capacity: int = 2**16, max_load_factor: float = 0.7):
+        self._capacity = 1 << max(capacity - 1, 1).bit_length()
+        self._max_load_factor = max_load_factor
+        self._width = 0
+        self._empty = b""
+        self._slots = bytearray()
+        self._count = 0
+        # An all-zero fingerprint cannot be stored, as it marks empty slots.
+        self._has_empty = False
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> "HashTableFingerprintStore":
+        return cls(
+            capacity=settings.getint("DUPE_FILTER_INITIAL_CAPACITY", 2**16),
+        )
+
+    def _allocate(self, capacity: int) -> None:
+        old_slots, width = self._slots, self._width
+        self._capacity = capacity
+        self._slots = bytearray(capacity * width)
+        self._count = 0
+        for start in range(0, len(old_slots), width):
+            fingerprint = bytes(old_slots[start : start + width])
+            if fingerprint != self._empty:
+                self._insert(fingerprint)
+
+    def _insert(self, fingerprint: bytes) -> bool:
+        width, slots, mask = self._width, self._slots, self._capacity - 1
+        index = int.from_bytes(fingerprint[:8], "little") & mask
+        while True:
+            start = index * width
+            slot = slots[start : start + width]
+            if slot == fingerprint:
+                return True
+            if slot == self._empty:
+                slots[start : start + width] = fingerprint
+                self._count += 1
+                return False
+            index = (index + 1) & mask
+
+    def add(self, fingerprint: bytes) -> bool:
+        if not self._width:
+            self._width = len(fingerprint)
+            self._empty = bytes(self._width)
+            self._slots = bytearray(self._capacity * self._width)
+        elif len(fingerprint) != self._width:
+            raise ValueError(
+                f"Expected a {self._width}-byte fingerprint, got "
+                f"{len(fingerprint)} bytes: {fingerprint!r}"
+            )
+        if fingerprint == self._empty:
+            seen, self._has_empty = self._has_empty, True
+            return seen
+        if (self._count + 1) / self._capacity > self._max_load_factor:
+            self._allocate(self._capacity * 2)
+        return self._insert(fingerprint)
+
+    def __len__(self) -> int:
+        return self._count + self._has_empty
+
+    @property
+    def memory_usage(self) -> int:
+        return sys.getsizeof(self._slots)
+
+    @property
+    def load_factor(self) -> float:
+        return self._count / self._capacity
+
+
+class _BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, h1: int, h2: int):
+        size = self.size
+        return ((h1 + i * h2) % size for i in range(self.hashes))
+
+    def contains(self, h1: int, h2: int) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h1, h2))
+
+    def add(self, h1: int, h2: int) -> None:
+        bits = self.bits
+        for position in self._positions(h1, h2):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class ScalableBloomFilterStore(FingerprintStore):
+    """Stores fingerprints in a scalable Bloom filter, i.e. a series of Bloom
+    filters of growing capacity and decreasing error rate, so that the
+    overall false positive rate stays below *error_rate* however many
+    fingerprints are added.
+
+    A false positive makes a request be wrongly considered a duplicate.
+    """
+
+    #: Capacity multiplier of each new filter.
+    growth = 2
+    #: Error rate multiplier of each new filter.
+    tightening = 0.5
+
+    def __init__(self, capacity: int = 2**16, error_rate: float = 0.0001):
+        if not 0 < error_rate < 1:
+            raise ValueError(f"The error rate must be in (0, 1), got {error_rate}")
+        self.error_rate = error_rate
+        self.filters: List[_BloomFilter] = [
+            _BloomFilter(capacity, error_rate * (1 - self.tightening))
+        ]
+        self._count = 0
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> "ScalableBloomFilterStore":
+        return cls(
+            capacity=settings.getint("DUPE_FILTER_INITIAL_CAPACITY", 2**16),
+            error_rate=settings.getfloat("DUPE_FILTER_BLOOM_ERROR_RATE", 0.0001),
+        )
+
+    @classmethod
+    def sharing_key(cls, settings: BaseSettings) -> Tuple[Any, ...]:
+        return (settings.getfloat("DUPE_FILTER_BLOOM_ERROR_RATE", 0.0001),)
+
+    @staticmethod
+    def _hashes(fingerprint: bytes) -> Tuple[int, int]:
+        if len(fingerprint) < 16:
+            fingerprint = blake2b(fingerprint, digest_size=16).digest()
+        h1 = int.from_bytes(fingerprint[:8], "little")
+        h2 = int.from_bytes(fingerprint[8:16], "little") | 1
+        return h1, h2
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        h1, h2 = self._hashes(fingerprint)
+        return any(bloom.contains(h1, h2) for bloom in self.filters)
+
+    def add(self, fingerprint: bytes) -> bool:
+        h1, h2 = self._hashes(fingerprint)
+        if any(bloom.contains(h1, h2) for bloom in self.filters):
+            return True
+        bloom = self.filters[-1]
+        if bloom.count >= bloom.capacity:
+            error_rate = self.error_rate * (1 - self.tightening)
+            error_rate *= self.tightening ** len(self.filters)
+            bloom = _BloomFilter(bloom.capacity * self.growth, error_rate)
+            self.filters.append(bloom)
+        bloom.add(h1, h2)
+        self._count += 1
+        return False
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def memory_usage(self) -> int:
+        return sum(sys.getsizeof(bloom.bits) for bloom in self.filters)
+
+    @property
+    def load_factor(self) -> float:
+        """Fill ratio of the current filter."""
+        bloom = self.filters[-1]
+        return bloom.count / bloom.capacity
+
+
+class _Run:
+    """Memory-mapped file of sorted, fixed-width fingerprints."""
+
+    def __init__(self, path: str, width: int):
+        self.path = path
+        self.width = width
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.count = self.size // width
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        data, width = self._map, self.width
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            value = data[middle * width : (middle + 1) * width]
+            if value < fingerprint:
+                low = middle + 1
+            elif value > fingerprint:
+                high = middle
+            else:
+                return True
+        return False
+
+    def __iter__(self) -> Iterator[bytes]:
+        data, width = self._map, self.width
+        for start in range(0, self.size, width):
+            yield data[start : start + width]
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+
+class DiskFingerprintStore(FingerprintStore):
+    """Stores fingerprints on disk, in a log-structured merge layout.
+
+    New fingerprints go into an in-memory buffer. When the buffer reaches
+    *buffer_size* fingerprints, it is written to *path* as a sorted run file,
+    and run files of similar size are merged, so that there are at most
+    about log2(fingerprints / *buffer_size*) runs. Lookups binary-search the
+    memory-mapped runs, so memory usage does not depend on the number of
+    stored fingerprints.
+
+    Runs found in *path* are loaded, and the buffer is written to disk on
+    :meth:`close`, so that fingerprints survive pausing and resuming a job.
+    """
+
+    _run_name = re.compile(r"^(\d+)-(\d+)\.run$")
+
+    def __init__(self, path: str, buffer_size: int = 100_000):
+        self.path = path
+        self.buffer_size = max(buffer_size, 1)
+        self._buffer: Set[bytes] = set()
+        self._runs: List[_Run] = []
+        self._next_run = 0
+        os.makedirs(path, exist_ok=True)
+        names = sorted(
+            (int(match[1]), int(match[2]), name)
+            for name in os.listdir(path)
+            if (match := self._run_name.match(name))
+        )
+        for number, width, name in names:
+            self._runs.append(_Run(os.path.join(path, name), width))
+            self._next_run = number + 1
+        self._temporary_directory: Optional[TemporaryDirectory] = None
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> "DiskFingerprintStore":
+        buffer_size = settings.getint("DUPE_FILTER_DISK_BUFFER_SIZE", 100_000)
+        if jobdir := job_dir(settings):
+            return cls(os.path.join(jobdir, "dupe_filter"), buffer_size)
+        temporary_directory = TemporaryDirectory(prefix="dupe_filter-")
+        store = cls(temporary_directory.name, buffer_size)
+        store._temporary_directory = temporary_directory
+        return store
+
+    @classmethod
+    def sharing_key(cls, settings: BaseSettings) -> Tuple[Any, ...]:
+        jobdir = job_dir(settings)
+        return (os.path.realpath(jobdir) if jobdir else None,)
+
+    def add(self, fingerprint: bytes) -> bool:
+        if fingerprint in self._buffer:
+            return True
+        for run in self._runs:
+            if run.width == len(fingerprint) and fingerprint in run:
+                return True
+        self._buffer.add(fingerprint)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+        return False
+
+    def _write_run(self, fingerprints: Iterable[bytes], width: int) -> _Run:
+        name = f"{self._next_run:08d}-{width}.run"
+        self._next_run += 1
+        path = os.path.join(self.path, name)
+        with open(f"{path}.tmp", "wb") as file:
+            chunk = bytearray()
+            for fingerprint in fingerprints:
+                chunk += fingerprint
+                if len(chunk) >= 1 << 20:
+                    file.write(chunk)
+                    chunk.clear()
+            file.write(chunk)
+        os.replace(f"{path}.tmp", path)
+        return _Run(path, width)
+
+    def flush(self) -> None:
+        """Write the buffer to disk as a new run, and merge runs of similar
+        size."""
+        by_width: Dict[int, List[bytes]] = {}
+        for fingerprint in self._buffer:
+            by_width.setdefault(len(fingerprint), []).append(fingerprint)
+        for width, fingerprints in sorted(by_width.items()):
+            self._runs.append(self._write_run(sorted(fingerprints), width))
+        self._buffer.clear()
+        while (
+            len(self._runs) >= 2
+            and self._runs[-2].width == self._runs[-1].width
+            and self._runs[-2].count <= self._runs[-1].count * 2
+        ):
+            first, second = self._runs[-2], self._runs[-1]
+            merged = self._write_run(merge(first, second), first.width)
+            for run in (first, second):
+                run.close()
+                os.remove(run.path)
+            self._runs[-2:] = [merged]
+
+    def close(self) -> None:
+        if self._buffer:
+            self.flush()
+        for run in self._runs:
+            run.close()
+        self._runs.clear()
+        if self._temporary_directory is not None:
+            self._temporary_directory.cleanup()
+
+    def __len__(self) -> int:
+        return len(self._buffer) + sum(run.count for run in self._runs)
+
+    @property
+    def memory_usage(self) -> int:
+        if not self._buffer:
+            return sys.getsizeof(self._buffer)
+        item_size = sys.getsizeof(next(iter(self._buffer)))
+        return sys.getsizeof(self._buffer) + item_size * len(self._buffer)
+
+    def to_stats(self, stats, prefix: str) -> None:
+        super().to_stats(stats, prefix)
+        stats.set_value(f"{prefix}/disk", sum(run.size for run in self._runs))
+        stats.set_value(f"{prefix}/runs", len(self._runs))
+
+
+FINGERPRINT_STORES: Dict[str, Type[FingerprintStore]] = {
+    "set": SetFingerprintStore,
+    "hash_table": HashTableFingerprintStore,
+    "bloom": ScalableBloomFilterStore,
+    "disk": DiskFingerprintStore,
+}
@@ -1,139 +1,524 @@
 import asyncio
+import json
 import logging
-from collections import defaultdict
+import sqlite3
+from collections import OrderedDict, defaultdict
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Optional, Set, Tuple, Union
+from hashlib import blake2b
+from time import perf_counter, time
+from typing import (
+    TYPE_CHECKING,
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+from warnings import warn
 
 import scrapinghub
 from itemadapter import ItemAdapter
 from scrapinghub.client.exceptions import Unauthorized
+from scrapinghub.client.utils import parse_auth
 from scrapy import signals
 from scrapy.crawler import Crawler
 from scrapy.http.request import Request
+from scrapy.utils.defer import deferred_from_coro
+from twisted.internet import task
+from twisted.internet.defer import Deferred
 from zyte_common_items import Item
 
+from zyte_spider_templates._dupefilters import ScalableBloomFilterStore
+from zyte_spider_templates._incremental.spool import FingerprintSpool
+from zyte_spider_templates._incremental.writer import BackgroundWriter
+from zyte_spider_templates._latency import LatencyHistogram
 from zyte_spider_templates.utils import (
     get_client,
+    get_compact_fingerprint,
+    get_domain_fingerprint,
     get_project_id,
     get_request_fingerprint,
     get_spider_name,
 )
 
+if TYPE_CHECKING:
+    from aiohttp import ClientSession
+
 logger = logging.getLogger(__name__)
 
 INCREMENTAL_SUFFIX = "_incremental"
 COLLECTION_API_URL = "https://storage.scrapinghub.com/collections"
+KEY_FORMATS = ("hex", "compact")
+
+
+class LookupCache:
+    """Bounded mapping of fingerprints to whether they are stored, which
+    evicts the least recently used fingerprints first."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._stored: "OrderedDict[str, bool]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._stored)
+
+    def get(self, fingerprint: str) -> Optional[bool]:
+        """Returns whether *fingerprint* is stored, or ``None`` if
+        unknown."""
+        stored = self._stored.get(fingerprint)
+        if stored is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._stored.move_to_end(fingerprint)
+        return stored
+
+    def _set(self, fingerprint: str, stored: bool) -> None:
+        self._stored[fingerprint] = stored
+        self._stored.move_to_end(fingerprint)
+        if len(self._stored) > self.size:
+            self._stored.popitem(last=False)
+
+    def add_hit(self, fingerprint: str) -> None:
+        self._set(fingerprint, True)
 
-THREAD_POOL_EXECUTOR = ThreadPoolExecutor(max_workers=10)
+    def add_miss(self, fingerprint: str) -> None:
+        # A fingerprint saved during its lookup must stay a hit.
+        if not self._stored.get(fingerprint):
+            self._set(fingerprint, False)
 
+    def to_stats(self, stats, prefix: str) -> None:
+        stats.set_value(f"{prefix}/hits", self.hits)
+        stats.set_value(f"{prefix}/misses", self.misses)
+        if self.hits + self.misses:
+            stats.set_value(
+                f"{prefix}/hit_rate", round(self.hits / (self.hits + self.misses), 4)
+            )
+
+
+class FingerprintsManager:
+    """Base class for storages of the fingerprints and URLs of items seen in
+    previous crawls.
+
+    Subclasses must implement :meth:`get_keys` and :meth:`save_items`, and
+    :meth:`iter_keys` to support prefetching. Fingerprints are read and
+    written in batches of ``INCREMENTAL_CRAWL_BATCH_SIZE`` fingerprints.
+
+    Subclasses get storage keys, in the ``INCREMENTAL_CRAWL_KEY_FORMAT``
+    format, rather than fingerprints (see :meth:`storage_key`).
+    """
 
-class CollectionsFingerprintsManager:
     def __init__(self, crawler: Crawler) -> None:
-        self.writer = None
-        self.collection = None
         self.crawler = crawler
 
         self.batch: Set[Tuple[str, str]] = set()
         self.batch_size = crawler.settings.getint("INCREMENTAL_CRAWL_BATCH_SIZE", 50)
 
-        project_id = get_project_id(crawler)
-        collection_name = self.get_collection_name(crawler)
+        self.key_format = crawler.settings.get("INCREMENTAL_CRAWL_KEY_FORMAT", "hex")
+        if self.key_format not in KEY_FORMATS:
+            raise ValueError(
+                f"Invalid INCREMENTAL_CRAWL_KEY_FORMAT value: {self.key_format!r}. "
+                f"Expected one of: {', '.join(KEY_FORMATS)}."
+            )
+        # Keys saved in the hex format by earlier crawls are also looked up.
+        self.read_legacy_keys = self.key_format != "hex" and crawler.settings.getbool(
+            "INCREMENTAL_CRAWL_READ_LEGACY_KEYS", True
+        )
+        self.store_urls = crawler.settings.getbool("INCREMENTAL_CRAWL_STORE_URLS", True)
 
-        self.init_collection(project_id, collection_name)
-        self.api_url = f"{COLLECTION_API_URL}/{project_id}/s/{collection_name}"
+        # Domain prefixes whose stored fingerprints are all in self.prefetched.
+        self.prefetched_prefixes: Set[str] = set()
+        self.prefetched = ScalableBloomFilterStore(error_rate=0.001)
 
-        logger.info(
-            f"Configuration of CollectionsFingerprintsManager for IncrementalCrawlMiddleware:\n"
-            f"batch_size: {self.batch_size},\n"
-            f"project: {project_id},\n"
-            f"collection_name: {collection_name}"
+        # Lookups started within lookup_window seconds of each other are
+        # merged into a single lookup.
+        self.lookup_window = crawler.settings.getfloat(
+            "INCREMENTAL_CRAWL_LOOKUP_WINDOW", 0.0
         )
+        self.lookup_window_max_keys = crawler.settings.getint(
+            "INCREMENTAL_CRAWL_LOOKUP_WINDOW_MAX_KEYS", 500
+        )
+        self._window_future: Optional[asyncio.Future] = None
+        self._window_timer: Optional[asyncio.TimerHandle] = None
+        self._window_fingerprints: Set[str] = set()
+        self._window_requested = 0
+
+        # Stored fingerprints older than their recrawl TTL, in seconds, are
+        # considered not seen. 0 means that they never expire.
+        self.recrawl_ttl = crawler.settings.getfloat(
+            "INCREMENTAL_CRAWL_RECRAWL_TTL", 0.0
+        )
+        self.recrawl_ttl_per_page_type: Dict[str, float] = {
+            page_type: float(ttl)
+            for page_type, ttl in crawler.settings.getdict(
+                "INCREMENTAL_CRAWL_RECRAWL_TTL_PER_PAGE_TYPE"
+            ).items()
+        }
+        self.recrawl_ttl_enabled = self.recrawl_ttl > 0 or any(
+            ttl > 0 for ttl in self.recrawl_ttl_per_page_type.values()
+        )
+
+        lookup_cache_size = crawler.settings.getint(
+            "INCREMENTAL_CRAWL_LOOKUP_CACHE_SIZE", 100_000
+        )
+        self.lookup_cache: Optional[LookupCache] = (
+            LookupCache(lookup_cache_size) if lookup_cache_size > 0 else None
+        )
+
+        # Set by subclasses whose writes should not block the reactor.
+        self.background_writer: Optional[BackgroundWriter] = None
 
+        self.spool: Optional[FingerprintSpool] = None
+        if spool_path := crawler.settings.get("INCREMENTAL_CRAWL_SPOOL_PATH"):
+            self.spool = FingerprintSpool(
+                spool_path,
+                crawler.settings.getint("INCREMENTAL_CRAWL_SPOOL_SYNC_SIZE", 100),
+            )
+            if replayed := self.spool.replay():
+                # Fingerprints left unsaved by a previous crawl.
+                self.batch.update(replayed)
+                crawler.stats.inc_value(  # type: ignore[union-attr]
+                    "incremental_crawling/spool_replayed", len(replayed)
+                )
+                logger.info(
+                    f"Replayed {len(replayed)} unsaved fingerprints from {spool_path}."
+                )
+
+        # Created on the first lookup, see the executor property.
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.lookup_queue_wait = LatencyHistogram()
+        self.lookup_execution = LatencyHistogram()
+
+        self._flush_task: Optional[task.LoopingCall] = None
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
         crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
 
+    def prefetch_seed_domains(self) -> None:
+        """Loads the stored fingerprints of the domains of the start URLs of
+        the spider into a local Bloom filter."""
+        start_urls = getattr(self.crawler.spider, "start_urls", None) or []
+        self.prefetch({get_domain_fingerprint(url) for url in start_urls})
+
+    def prefetch(self, prefixes: Iterable[str]) -> None:
+        """Loads all stored fingerprints with any of the specified domain
+        *prefixes* into a local Bloom filter.
+
+        Afterwards, fingerprints with those prefixes that are not in the
+        filter are known not to be stored, and are not looked up in the
+        storage.
+        """
+        for prefix in sorted(set(prefixes) - self.prefetched_prefixes):
+            count = 0
+            for key in self.iter_keys(prefix):
+                self.prefetched.add(self._bloom_key(key))
+                count += 1
+            self.prefetched_prefixes.add(prefix)
+            self.crawler.stats.inc_value(  # type: ignore[union-attr]
+                "incremental_crawling/prefetched_fingerprints", count
+            )
+            logger.info(f"Prefetched {count} fingerprints with prefix {prefix}.")
+
+    @staticmethod
+    def _bloom_key(key: str) -> bytes:
+        # Keys start with a domain prefix, so they need hashing.
+        return blake2b(key.encode(), digest_size=16).digest()
+
+    def _may_be_stored(self, fingerprint: str) -> bool:
+        return fingerprint[:4] not in self.prefetched_prefixes or any(
+            self._bloom_key(key) in self.prefetched
+            for key in self._lookup_keys(fingerprint)
+        )
+
+    def storage_key(self, fingerprint: str) -> str:
+        """Returns the key under which *fingerprint* is saved, in the
+        ``INCREMENTAL_CRAWL_KEY_FORMAT`` format."""
+        if self.key_format == "compact":
+            return get_compact_fingerprint(fingerprint)
+        return fingerprint
+
+    def _lookup_keys(self, fingerprint: str) -> List[str]:
+        keys = [self.storage_key(fingerprint)]
+        if self.read_legacy_keys:
+            keys.append(fingerprint)
+        return keys
+
     def get_collection_name(self, crawler):
         return (
             crawler.settings.get("INCREMENTAL_CRAWL_COLLECTION_NAME")
             or f"{get_spider_name(crawler)}{INCREMENTAL_SUFFIX}"
         )
 
-    def init_collection(self, project_id, collection_name) -> None:
-        client = get_client()
-        collection = client.get_project(project_id).collections.get_store(
-            collection_name
+    def get_keys(self, keys: Set[str]) -> Set[str]:
+        """Returns the subset of *keys* found in the storage."""
+        raise NotImplementedError
+
+    def get_timestamps(self, keys: Set[str]) -> Dict[str, Optional[int]]:
+        """Returns the keys of *keys* found in the storage, mapped to the
+        time, as a Unix timestamp, when they were last saved, or to ``None``
+        if unknown."""
+        return dict.fromkeys(self.get_keys(keys))
+
+    def save_items(self, items_to_save: Iterable[Tuple[str, str]]) -> None:
+        """Saves pairs of keys and URLs to the storage, with the current time
+        as their last-seen timestamp.
+
+        URLs are empty if ``INCREMENTAL_CRAWL_STORE_URLS`` is ``False``.
+        """
+        raise NotImplementedError
+
+    def save_fingerprints(self, items_to_save: Iterable[Tuple[str, str]]) -> None:
+        """Saves pairs of fingerprints and URLs with :meth:`save_items`."""
+        self.save_items(
+            (self.storage_key(fp), url if self.store_urls else "")
+            for fp, url in items_to_save
         )
-        try:
-            # Trying to get a random key to make sure the collection exists.
-            collection.list(key=["init_key"])
-        except scrapinghub.client.exceptions.NotFound as e:
-            if f"unknown collection {collection_name}" in str(e):
-                logger.info(
-                    f"The collection: {collection_name} for {project_id=} doesn't exist"
-                    f" and will be created automatically"
-                )
-                # This trick forces the creation of a collection.
-                collection.set({"_key": "init", "value": "1"})
-                collection.delete("init")
-            else:
-                logger.error(f"The error {e} for {project_id=}")
-                raise RuntimeError("incremental_crawling__not_found_exception")
-        except Unauthorized:
-            logger.error("The api key (SH_APIKEY or SHUB_JOBAUTH) is not valid.")
-            raise ValueError("incremental_crawling__api_key_not_vaild")
 
-        self.collection = collection
-        self.writer = self.collection.create_writer()  # type: ignore
+    def iter_keys(self, prefix: str) -> Iterable[str]:
+        """Iterates over all stored fingerprints starting with *prefix*."""
+        raise NotImplementedError
 
-    def save_to_collection(self, items_to_save) -> None:
-        """Saves the current batch of fingerprints to the collection."""
-        items = [{"_key": key, "value": value} for key, value in items_to_save]
-        self.writer.write(items)  # type: ignore
-        self.writer.flush()  # type: ignore
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool of this crawler for storage lookups, with
+        ``INCREMENTAL_CRAWL_MAX_WORKERS`` threads."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(
+                    1, self.crawler.settings.getint("INCREMENTAL_CRAWL_MAX_WORKERS", 10)
+                ),
+                thread_name_prefix="incremental-crawl",
+            )
+        return self._executor
+
+    def read_keys(self, keys: Set[str]) -> Dict[str, Optional[int]]:
+        """Returns the keys of *keys* found in the storage, mapped to their
+        last-seen timestamps if a recrawl TTL is used."""
+        if self.recrawl_ttl_enabled:
+            return self.get_timestamps(keys)
+        return dict.fromkeys(self.get_keys(keys))
+
+    async def read_keys_async(self, keys: Set[str]) -> Dict[str, Optional[int]]:
+        """Asynchronously runs :meth:`read_keys` in the executor."""
+        submitted = perf_counter()
+
+        def read_keys() -> Tuple[Dict[str, Optional[int]], float, float]:
+            started = perf_counter()
+            return self.read_keys(keys), started, perf_counter()
+
+        found, started, finished = await asyncio.get_event_loop().run_in_executor(
+            self.executor, read_keys
+        )
+        # Recorded here rather than in the thread, histograms are not
+        # thread-safe.
+        self.lookup_queue_wait.record(started - submitted)
+        self.lookup_execution.record(finished - started)
+        return found
+
+    async def get_keys_async(self, keys: Set[str]) -> Set[str]:
+        """Asynchronously fetches a set of keys from the storage using an executor to run in separate threads."""
+        return set(await self.read_keys_async(keys))
 
     async def get_keys_from_collection_async(self, keys: Set[str]) -> Set[str]:
-        """Asynchronously fetches a set of keys from the collection using an executor to run in separate threads."""
-        return await asyncio.get_event_loop().run_in_executor(
-            THREAD_POOL_EXECUTOR, lambda: self.get_keys_from_collection(keys)
+        """Deprecated alias of :meth:`get_keys_async`."""
+        warn(
+            "get_keys_from_collection_async() is deprecated, use "
+            "get_keys_async() instead.",
+            DeprecationWarning,
+            stacklevel=2,
         )
+        return await self.get_keys_async(keys)
 
-    async def read_batches(self, fingerprints: List[str], batch_start: int) -> Set[str]:
+    async def read_batches(
+        self, fingerprints: List[str], batch_start: int
+    ) -> Dict[str, Optional[int]]:
         """Reads a specific batch of fingerprints and fetches corresponding keys asynchronously."""
-        return await self.get_keys_from_collection_async(
-            set(fingerprints[batch_start : batch_start + self.batch_size])
+        lookup_keys = {
+            fp: self._lookup_keys(fp)
+            for fp in fingerprints[batch_start : batch_start + self.batch_size]
+        }
+        found = await self.read_keys_async(
+            {key for keys in lookup_keys.values() for key in keys}
         )
+        timestamps: Dict[str, Optional[int]] = {}
+        for fp, keys in lookup_keys.items():
+            stored = [found[key] for key in keys if key in found]
+            if stored:
+                # If saved in both formats, the latest save counts.
+                timestamps[fp] = max(
+                    (timestamp for timestamp in stored if timestamp is not None),
+                    default=None,
+                )
+        return timestamps
 
-    def get_keys_from_collection(self, keys: Set[str]) -> Set[str]:
-        """Synchronously fetches a set of keys from the collection."""
-        return {item.get("_key", "") for item in self.collection.list(key=keys)}  # type: ignore
+    async def _lookup(
+        self, fingerprints: List[str]
+    ) -> Tuple[Dict[str, Optional[int]], bool]:
+        """Returns the fingerprints of *fingerprints* found in the storage,
+        mapped to their last-seen timestamps, and whether all of them could
+        be looked up."""
+        duplicated_fingerprints: Dict[str, Optional[int]] = {}
+        complete = True
+        tasks = [
+            self.read_batches(fingerprints, i)
+            for i in range(0, len(fingerprints), self.batch_size)
+        ]
+        for future in asyncio.as_completed(tasks):
+            try:
+                batch_keys = await future
+                duplicated_fingerprints.update(batch_keys)
+            except Exception as e:
+                logging.error(f"Error while processing batch: {e}")
+                complete = False
+        return duplicated_fingerprints, complete
 
-    async def get_existing_fingerprints_async(
+    async def _coalesced_lookup(
         self, fingerprints: List[str]
+    ) -> Tuple[Dict[str, Optional[int]], bool]:
+        """Looks up *fingerprints* together with those of other lookups
+        started within the lookup window."""
+        loop = asyncio.get_event_loop()
+        if self._window_future is None:
+            self._window_future = loop.create_future()
+            self._window_timer = loop.call_later(self.lookup_window, self._close_window)
+        future = self._window_future
+        self._window_requested += len(fingerprints)
+        self._window_fingerprints.update(fingerprints)
+        if len(self._window_fingerprints) >= self.lookup_window_max_keys:
+            self._close_window()
+        found, complete = await asyncio.shield(future)
+        return {fp: found[fp] for fp in fingerprints if fp in found}, complete
+
+    def _close_window(self) -> None:
+        future, fingerprints = self._window_future, self._window_fingerprints
+        assert future is not None
+        if self._window_timer is not None:
+            self._window_timer.cancel()
+        self.crawler.stats.inc_value("incremental_crawling/lookup_windows")  # type: ignore[union-attr]
+        self.crawler.stats.inc_value(  # type: ignore[union-attr]
+            "incremental_crawling/lookup_window_merged_fingerprints",
+            self._window_requested - len(fingerprints),
+        )
+        self._window_future, self._window_timer = None, None
+        self._window_fingerprints, self._window_requested = set(), 0
+
+        def fan_out(lookup: asyncio.Future) -> None:
+            if lookup.cancelled():
+                future.cancel()
+            elif lookup.exception() is not None:
+                future.set_exception(lookup.exception())  # type: ignore[arg-type]
+            else:
+                future.set_result(lookup.result())
+
+        asyncio.ensure_future(self._lookup(list(fingerprints))).add_done_callback(
+            fan_out
+        )
+
+    def get_recrawl_ttl(self, request: Request) -> float:
+        """Returns the recrawl TTL, in seconds, of the fingerprints of
+        *request*, based on its page type."""
+        page_type = request.meta.get("crawling_logs", {}).get("page_type")
+        return self.recrawl_ttl_per_page_type.get(page_type, self.recrawl_ttl)
+
+    def _is_fresh(self, timestamp: Optional[int], ttl: float, now: float) -> bool:
+        # Entries saved without a timestamp, by older versions, are of unknown
+        # age, and not expiring them keeps upgrades from recrawling everything.
+        return ttl <= 0 or timestamp is None or now - timestamp < ttl
+
+    def _cache_key(self, fingerprint: str, ttl: float) -> str:
+        # With per page type TTLs, a fingerprint may be fresh for a page type
+        # and expired for another.
+        if not self.recrawl_ttl_per_page_type:
+            return fingerprint
+        return f"{fingerprint} {ttl:g}"
+
+    def _cache_keys(self, fingerprint: str) -> Set[str]:
+        """Returns the lookup cache keys of *fingerprint* for every TTL."""
+        ttls = {self.recrawl_ttl, *self.recrawl_ttl_per_page_type.values()}
+        return {self._cache_key(fingerprint, ttl) for ttl in ttls}
+
+    async def get_existing_fingerprints_async(
+        self, fingerprints: List[str], ttls: Optional[Dict[str, float]] = None
     ) -> Set[str]:
-        """Asynchronously checks for duplicate fingerprints in both the collection and the local buffer.
-        Async interaction with the collection could be replaced by
-        https://github.com/scrapinghub/python-scrapinghub/issues/169 in the future"""
+        """Asynchronously checks for duplicate fingerprints in both the storage and the local buffer.
+
+        Stored fingerprints are not considered duplicates if they are older
+        than their recrawl TTL, from *ttls* or, by default, from the
+        ``INCREMENTAL_CRAWL_RECRAWL_TTL`` setting.
+        """
 
         fingerprints_size = len(fingerprints)
 
         if fingerprints_size == 0:
             return set()
 
+        to_query = fingerprints
+        if self.prefetched_prefixes:
+            to_query = [fp for fp in fingerprints if self._may_be_stored(fp)]
+            self.crawler.stats.inc_value(  # type: ignore[union-attr]
+                "incremental_crawling/prefetch_skipped_lookups",
+                fingerprints_size - len(to_query),
+            )
+
         duplicated_fingerprints = set()
+        ttls = ttls or {}
 
-        tasks = [
-            self.read_batches(fingerprints, i)
-            for i in range(0, fingerprints_size, self.batch_size)
-        ]
-        for future in asyncio.as_completed(tasks):
-            try:
-                batch_keys = await future
-                duplicated_fingerprints.update(batch_keys)
-            except Exception as e:
-                logging.error(f"Error while processing batch: {e}")
+        if self.lookup_cache is not None:
+            uncached = []
+            for fp in to_query:
+                stored = self.lookup_cache.get(
+                    self._cache_key(fp, ttls.get(fp, self.recrawl_ttl))
+                )
+                if stored is None:
+                    uncached.append(fp)
+                elif stored:
+                    duplicated_fingerprints.add(fp)
+            to_query = uncached
+
+        if to_query:
+            if self.lookup_window > 0:
+                found, complete = await self._coalesced_lookup(to_query)
+            else:
+                found, complete = await self._lookup(to_query)
+            if self.recrawl_ttl_enabled:
+                now = time()
+                expired = {
+                    fp
+                    for fp, timestamp in found.items()
+                    if not self._is_fresh(
+                        timestamp, ttls.get(fp, self.recrawl_ttl), now
+                    )
+                }
+                if expired:
+                    self.crawler.stats.inc_value(  # type: ignore[union-attr]
+                        "incremental_crawling/expired_fingerprints", len(expired)
+                    )
+                found = {fp: found[fp] for fp in found if fp not in expired}
+            duplicated_fingerprints.update(found)
+            if self.lookup_cache is not None:
+                for fp in to_query:
+                    key = self._cache_key(fp, ttls.get(fp, self.recrawl_ttl))
+                    if fp in found:
+                        self.lookup_cache.add_hit(key)
+                    elif complete:
+                        # Misses are only known if no batch failed. Expired
+                        # fingerprints are misses until saved again.
+                        self.lookup_cache.add_miss(key)
 
         # Check duplicates in the local buffer
         local_duplicates = set(fingerprints) & {fp for fp, _ in self.batch}
         duplicated_fingerprints.update(local_duplicates)
+        if self.background_writer:
+            duplicated_fingerprints.update(
+                self.background_writer.pending(set(fingerprints))
+            )
 
         return duplicated_fingerprints
 
@@ -143,10 +528,16 @@ class CollectionsFingerprintsManager:
         """
         for fp_url in fp_url_map:
             logger.debug(f"Adding fingerprint and URL ({fp_url}) to batch.")
+            if self.spool is not None:
+                # Spooled one by one, as save_batch may reset the spool.
+                self.spool.append([fp_url])
             self.crawler.stats.inc_value(  # type: ignore[union-attr]
                 "incremental_crawling/fingerprint_url_to_batch"
             )
             self.batch.add(fp_url)
+            if self.lookup_cache is not None:
+                for key in self._cache_keys(fp_url[0]):
+                    self.lookup_cache.add_hit(key)
             if len(self.batch) >= self.batch_size:
                 self.save_batch()
         self.crawler.stats.inc_value("incremental_crawling/add_to_batch")  # type: ignore[union-attr]
@@ -155,22 +546,352 @@ class CollectionsFingerprintsManager:
         if not self.batch:
             return
         logger.debug(
-            f"Saving {len(self.batch)} fingerprints to the Collection. "
+            f"Saving {len(self.batch)} fingerprints to the {type(self).__name__}. "
             f"The fingerprints are: {self.batch}."
         )
         self.crawler.stats.inc_value("incremental_crawling/batch_saved")  # type: ignore[union-attr]
-        self.save_to_collection(items_to_save=self.batch)
+        if self.background_writer:
+            if self.spool is not None and self.background_writer.idle():
+                # All spooled fingerprints but those of this batch, and of
+                # batches that could not be saved, are saved.
+                self.spool.reset(self._unsaved())
+            self.background_writer.write(list(self.batch))
+        else:
+            self.save_fingerprints(self.batch)
+        for fp, _ in self.batch:
+            if fp[:4] in self.prefetched_prefixes:
+                self.prefetched.add(self._bloom_key(self.storage_key(fp)))
         self.batch.clear()
+        if self.spool is not None and self.background_writer is None:
+            self.spool.reset()
 
-    def spider_closed(self) -> None:
+    def _pause_crawl(self) -> None:
+        # The engine does not exist yet while middlewares are built.
+        if self.crawler.engine is not None:
+            self.crawler.engine.pause()
+
+    def _resume_crawl(self) -> None:
+        if self.crawler.engine is not None:
+            self.crawler.engine.unpause()
+
+    def _unsaved(self) -> List[Tuple[str, str]]:
+        unsaved = list(self.batch)
+        if self.background_writer:
+            unsaved.extend(self.background_writer.failed())
+        return unsaved
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def spider_opened(self) -> None:
+        """Start saving the batch periodically, even if it is not full."""
+        flush_interval = self.crawler.settings.getfloat(
+            "INCREMENTAL_CRAWL_FLUSH_INTERVAL", 60.0
+        )
+        if flush_interval > 0:
+            self._flush_task = task.LoopingCall(self.save_batch)
+            self._flush_task.start(flush_interval, now=False)
+
+    def spider_closed(self) -> Optional[Deferred]:
         """Save fingerprints and corresponding URLs remaining in the batch, before spider closes."""
+        if self._flush_task is not None and self._flush_task.running:
+            self._flush_task.stop()
         self.save_batch()
+        if self.background_writer:
+            self.background_writer.close()
+        if self.spool is not None:
+            self.spool.reset(self._unsaved())
+        self.close()
+        if self.lookup_cache is not None:
+            self.lookup_cache.to_stats(
+                self.crawler.stats, "incremental_crawling/lookup_cache"
+            )
+        for name, histogram in (
+            ("queue_wait", self.lookup_queue_wait),
+            ("execution", self.lookup_execution),
+        ):
+            if histogram.count:
+                histogram.to_stats(
+                    self.crawler.stats, f"incremental_crawling/lookup_latency/{name}"
+                )
+        return None
+
+
+class CollectionsFingerprintsManager(FingerprintsManager):
+    """Stores fingerprints in a :ref:`Zyte Scrapy Cloud collection
+    <api-collections>`.
+
+    Async interaction with the collection could be replaced by
+    https://github.com/scrapinghub/python-scrapinghub/issues/169 in the future.
+    """
+
+    def __init__(self, crawler: Crawler) -> None:
+        self.writer = None
+        self.collection = None
+        super().__init__(crawler)
+
+        project_id = get_project_id(crawler)
+        collection_name = self.get_collection_name(crawler)
+
+        self.init_collection(project_id, collection_name)
+        self.api_url = f"{COLLECTION_API_URL}/{project_id}/s/{collection_name}"
+
+        # Lookups with aiohttp run in the event loop instead of in threads.
+        self.aiohttp_enabled = crawler.settings.getbool(
+            "INCREMENTAL_CRAWL_AIOHTTP_ENABLED", False
+        )
+        if self.aiohttp_enabled:
+            try:
+                import aiohttp  # noqa: F401
+            except ImportError:
+                raise ValueError(
+                    "INCREMENTAL_CRAWL_AIOHTTP_ENABLED requires aiohttp to be installed."
+                )
+        self._http_session: Optional["ClientSession"] = None
+
+        write_queue_size = crawler.settings.getint(
+            "INCREMENTAL_CRAWL_WRITE_QUEUE_SIZE", 10
+        )
+        if write_queue_size > 0:
+            self.background_writer = BackgroundWriter(
+                self.save_fingerprints,
+                write_queue_size,
+                crawler.stats,
+                pause=self._pause_crawl,
+                resume=self._resume_crawl,
+            )
+
+        logger.info(
+            f"Configuration of CollectionsFingerprintsManager for IncrementalCrawlMiddleware:\n"
+            f"batch_size: {self.batch_size},\n"
+            f"project: {project_id},\n"
+            f"collection_name: {collection_name}"
+        )
+
+    def init_collection(self, project_id, collection_name) -> None:
+        client = get_client()
+        collection = client.get_project(project_id).collections.get_store(
+            collection_name
+        )
+        try:
+            # Trying to get a random key to make sure the collection exists.
+            collection.list(key=["init_key"])
+        except scrapinghub.client.exceptions.NotFound as e:
+            if f"unknown collection {collection_name}" in str(e):
+                logger.info(
+                    f"The collection: {collection_name} for {project_id=} doesn't exist"
+                    f" and will be created automatically"
+                )
+                # This trick forces the creation of a collection.
+                collection.set({"_key": "init", "value": "1"})
+                collection.delete("init")
+            else:
+                logger.error(f"The error {e} for {project_id=}")
+                raise RuntimeError("incremental_crawling__not_found_exception")
+        except Unauthorized:
+            logger.error("The api key (SH_APIKEY or SHUB_JOBAUTH) is not valid.")
+            raise ValueError("incremental_crawling__api_key_not_vaild")
+
+        self.collection = collection
+        self.writer = self.collection.create_writer()  # type: ignore
+
+    def save_items(self, items_to_save: Iterable[Tuple[str, str]]) -> None:
+        self.save_to_collection(items_to_save)
+
+    def save_to_collection(self, items_to_save) -> None:
+        """Saves the current batch of fingerprints to the collection."""
+        # "t" is the last-seen Unix timestamp, used for recrawl TTLs.
+        now = int(time())
+        items = []
+        for key, value in items_to_save:
+            item = {"_key": key, "t": now}
+            if value:
+                item["value"] = value
+            items.append(item)
+        self.writer.write(items)  # type: ignore
+        self.writer.flush()  # type: ignore
+
+    def get_keys(self, keys: Set[str]) -> Set[str]:
+        return self.get_keys_from_collection(keys)
+
+    def get_keys_from_collection(self, keys: Set[str]) -> Set[str]:
+        """Synchronously fetches a set of keys from the collection."""
+        return {item.get("_key", "") for item in self.collection.list(key=keys)}  # type: ignore
+
+    def get_timestamps(self, keys: Set[str]) -> Dict[str, Optional[int]]:
+        return {
+            item.get("_key", ""): item.get("t")
+            for item in self.collection.list(key=keys)  # type: ignore
+        }
+
+    async def read_keys_async(self, keys: Set[str]) -> Dict[str, Optional[int]]:
+        if not self.aiohttp_enabled:
+            return await super().read_keys_async(keys)
+        started = perf_counter()
+        found = await self.get_keys_from_api(keys)
+        self.lookup_execution.record(perf_counter() - started)
+        return found
+
+    async def get_keys_from_api(self, keys: Set[str]) -> Dict[str, Optional[int]]:
+        """Asynchronously fetches a set of keys, mapped to their last-seen
+        timestamps, from the collections API with aiohttp."""
+        import aiohttp
+
+        if self._http_session is None:
+            self._http_session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(*parse_auth(None)),
+                raise_for_status=True,
+            )
+        params = [("key", key) for key in sorted(keys)]
+        params.append(("meta", "_key"))
+        async with self._http_session.get(self.api_url, params=params) as response:
+            body = await response.text()
+        found = {}
+        for line in body.splitlines():
+            if line.strip():
+                item = json.loads(line)
+                found[item.get("_key", "")] = item.get("t")
+        return found
+
+    def iter_keys(self, prefix: str) -> Iterable[str]:
+        for item in self.collection.iter(prefix=prefix):  # type: ignore
+            yield item["_key"]
+
+    def close(self) -> None:
+        super().close()
+        if self._http_session is not None:
+            session, self._http_session = self._http_session, None
+            try:
+                asyncio.get_event_loop().create_task(session.close())
+            except RuntimeError:
+                pass
+
+    def spider_closed(self) -> Optional[Deferred]:
+        # Closed here rather than in close(), so that Scrapy waits for it.
+        session, self._http_session = self._http_session, None
+        super().spider_closed()
+        if session is None:
+            return None
+        return deferred_from_coro(session.close())
+
+
+class SQLiteFingerprintsManager(FingerprintsManager):
+    """Stores fingerprints in a local SQLite database in WAL mode.
+
+    The database file is read from the ``INCREMENTAL_CRAWL_SQLITE_PATH``
+    setting, and defaults to a file named after the collection name in the
+    current working directory.
+    """
+
+    # Stay below the SQLITE_MAX_VARIABLE_NUMBER default of older SQLite
+    # versions.
+    max_query_keys = 900
+
+    def __init__(self, crawler: Crawler) -> None:
+        super().__init__(crawler)
+        self.path = (
+            crawler.settings.get("INCREMENTAL_CRAWL_SQLITE_PATH")
+            or f"{self.get_collection_name(crawler)}.sqlite3"
+        )
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, seen INTEGER) "
+                "WITHOUT ROWID"
+            )
+            columns = {
+                row[1]
+                for row in self.connection.execute("PRAGMA table_info(fingerprints)")
+            }
+            if "seen" not in columns:
+                # Databases created before last-seen timestamps were stored.
+                self.connection.execute(
+                    "ALTER TABLE fingerprints ADD COLUMN seen INTEGER"
+                )
+
+        logger.info(
+            f"Configuration of SQLiteFingerprintsManager for IncrementalCrawlMiddleware:\n"
+            f"batch_size: {self.batch_size},\n"
+            f"path: {self.path}"
+        )
+
+    def _select(self, keys: Set[str]) -> Iterator[Tuple[str, Optional[int]]]:
+        key_list = list(keys)
+        for start in range(0, len(key_list), self.max_query_keys):
+            chunk = key_list[start : start + self.max_query_keys]
+            placeholders = ",".join("?" * len(chunk))
+            yield from self.connection.execute(
+                f"SELECT key, seen FROM fingerprints WHERE key IN ({placeholders})",  # nosec
+                chunk,
+            )
+
+    def get_keys(self, keys: Set[str]) -> Set[str]:
+        return {key for key, _ in self._select(keys)}
+
+    def get_timestamps(self, keys: Set[str]) -> Dict[str, Optional[int]]:
+        return dict(self._select(keys))
+
+    async def read_keys_async(self, keys: Set[str]) -> Dict[str, Optional[int]]:
+        # Local lookups are faster than a round trip to a thread.
+        started = perf_counter()
+        found = self.read_keys(keys)
+        self.lookup_execution.record(perf_counter() - started)
+        return found
+
+    def save_items(self, items_to_save: Iterable[Tuple[str, str]]) -> None:
+        now = int(time())
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO fingerprints (key, value, seen) "
+                "VALUES (?, ?, ?)",
+                ((key, value, now) for key, value in items_to_save),
+            )
+
+    def iter_keys(self, prefix: str) -> Iterable[str]:
+        # A range condition, unlike LIKE, always uses the primary key index.
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        for row in self.connection.execute(
+            "SELECT key FROM fingerprints WHERE key >= ? AND key < ?", (prefix, end)
+        ):
+            yield row[0]
+
+    def close(self) -> None:
+        super().close()
+        self.connection.close()
+
+
+FINGERPRINTS_MANAGERS: Dict[str, Type[FingerprintsManager]] = {
+    "collection": CollectionsFingerprintsManager,
+    "sqlite": SQLiteFingerprintsManager,
+}
 
 
 class IncrementalCrawlingManager:
-    def __init__(self, crawler: Crawler, fm: CollectionsFingerprintsManager) -> None:
+    def __init__(self, crawler: Crawler, fm: FingerprintsManager) -> None:
         self.crawler = crawler
         self.fm = fm
+        # If the spider declares an item type, fingerprints are specific to
+        # it, and only requests for pages of that item type are checked, and
+        # only the items of those pages are recorded.
+        self.item_type: Optional[str] = getattr(
+            crawler.spider, "incremental_item_type", None
+        )
+
+    def _should_check(self, request: Request) -> bool:
+        return (
+            self.item_type is None
+            or request.meta.get("incremental_item_type") == self.item_type
+        )
+
+    def _get_fingerprint(self, request: Request, url: Optional[str] = None) -> str:
+        return get_request_fingerprint(
+            self.crawler, request, url, item_type=self.item_type
+        )
 
     async def process_incremental_async(
         self, request: Request, result: List
@@ -179,7 +900,7 @@ class IncrementalCrawlingManager:
         Processes the spider's parsing callbacks when IncrementalCrawlMiddleware is enabled.
 
         The function handles both requests and items returned by the spider.
-        - If an item is found:
+        - If an item is found, on a page of the spider's item type if it has one:
           - It saves the `request.url` and `item.url/item.canonicalURL` (if they differ) to the collection.
         - If the result is a Request:
           - It checks whether the request was processed previously.
@@ -187,15 +908,17 @@ class IncrementalCrawlingManager:
           - If it was not, the request remains in the result.
         """
         item: Optional[Item] = None
-        to_check = defaultdict(list)
+        to_check: Dict[str, List[int]] = defaultdict(list)
         fingerprint_to_url_map: Set[Tuple[str, str]] = set()
         for i, element in enumerate(result):
             if isinstance(element, Request):
+                if not self._should_check(element):
+                    continue
                 # The requests are only checked to see if the links exist in the Collection
-                fp = get_request_fingerprint(self.crawler, element)
+                fp = self._get_fingerprint(element)
                 to_check[fp].append(i)
                 self.crawler.stats.inc_value("incremental_crawling/requests_to_check")  # type: ignore[union-attr]
-            else:
+            elif self._should_check(request):
                 if item:
                     raise NotImplementedError(
                         f"Unexpected number of returned items for {request.url}. "
@@ -203,27 +926,131 @@ class IncrementalCrawlingManager:
                     )
 
                 item = element
-                unique_urls = self._get_unique_urls(request.url, item)
-                for url, url_field in unique_urls.items():
-                    fp = get_request_fingerprint(self.crawler, request.replace(url=url))
-                    if url_field != "request_url":
-                        to_check[fp].append(i)
-
-                    # Storing the fingerprint-to-URL mapping for the item only.
-                    # This will be used when storing the item in the Collection.
-                    fingerprint_to_url_map.add((fp, url))
-
-                    if url_field == "url":
-                        self.crawler.stats.inc_value(  # type: ignore[union-attr]
-                            "incremental_crawling/redirected_urls"
-                        )
-                        logger.debug(
-                            f"Request URL for the item {request.url} was redirected to {url}."
-                        )
+                item_fingerprints, fingerprints_to_check = self._get_item_fingerprints(
+                    request, element
+                )
+                for fp in fingerprints_to_check:
+                    to_check[fp].append(i)
+                fingerprint_to_url_map |= item_fingerprints
+
+        return await self._filter_seen(
+            request, result, to_check, fingerprint_to_url_map
+        )
+
+    async def process_incremental_stream(
+        self, request: Request, result: AsyncIterable
+    ) -> AsyncGenerator[Union[Request, Item], None]:
+        """Streaming counterpart of :meth:`process_incremental_async`.
+
+        Items whose URLs need no check are yielded as soon as they are
+        received, with no lookup. Requests, and
+        items with a redirect or canonical URL, are buffered until
+        ``batch_size`` fingerprints need a check, and are then checked
+        together and yielded if not seen before.
+        """
+        item_received = False
+        pending: List[Union[Request, Item, None]] = []
+        to_check: Dict[str, List[int]] = defaultdict(list)
+        fingerprint_to_url_map: Set[Tuple[str, str]] = set()
+        async for element in result:
+            if isinstance(element, Request):
+                if not self._should_check(element):
+                    yield element
+                    continue
+                fp = self._get_fingerprint(element)
+                to_check[fp].append(len(pending))
+                pending.append(element)
+                self.crawler.stats.inc_value("incremental_crawling/requests_to_check")  # type: ignore[union-attr]
+            elif not self._should_check(request):
+                # Not an item page, e.g. a navigation page with a product
+                # list, so its item is not recorded.
+                yield element
+                continue
+            else:
+                if item_received:
+                    raise NotImplementedError(
+                        f"Unexpected number of returned items for {request.url}. "
+                        f"None or one was expected."
+                    )
+                item_received = True
+                item_fingerprints, fingerprints_to_check = self._get_item_fingerprints(
+                    request, element
+                )
+                if not fingerprints_to_check:
+                    self.fm.add_to_batch(item_fingerprints)
+                    yield element
+                    continue
+                for fp in fingerprints_to_check:
+                    to_check[fp].append(len(pending))
+                pending.append(element)
+                fingerprint_to_url_map |= item_fingerprints
+
+            if len(to_check) >= self.fm.batch_size:
+                for element in await self._filter_seen(
+                    request, pending, to_check, fingerprint_to_url_map
+                ):
+                    yield element
+                pending, to_check, fingerprint_to_url_map = [], defaultdict(list), set()
+
+        if pending:
+            for element in await self._filter_seen(
+                request, pending, to_check, fingerprint_to_url_map
+            ):
+                yield element
+
+    def _get_item_fingerprints(
+        self, request: Request, item: Item
+    ) -> Tuple[Set[Tuple[str, str]], List[str]]:
+        """Returns the pairs of fingerprints and URLs of *item*, and the
+        fingerprints among them that need to be checked."""
+        item_fingerprints: Set[Tuple[str, str]] = set()
+        fingerprints_to_check: List[str] = []
+        unique_urls = self._get_unique_urls(request.url, item)
+        for url, url_field in unique_urls.items():
+            fp = self._get_fingerprint(request, url)
+            if url_field != "request_url":
+                fingerprints_to_check.append(fp)
+
+            # Storing the fingerprint-to-URL mapping for the item only.
+            # This will be used when storing the item in the Collection.
+            item_fingerprints.add((fp, url))
+
+            if url_field == "url":
+                self.crawler.stats.inc_value(  # type: ignore[union-attr]
+                    "incremental_crawling/redirected_urls"
+                )
+                logger.debug(
+                    f"Request URL for the item {request.url} was redirected to {url}."
+                )
+        return item_fingerprints, fingerprints_to_check
+
+    async def _filter_seen(
+        self,
+        request: Request,
+        result: List,
+        to_check: Dict[str, List[int]],
+        fingerprint_to_url_map: Set[Tuple[str, str]],
+    ) -> List[Union[Request, Item]]:
+        """Returns *result* without the elements at the *to_check* indexes of
+        fingerprints seen before, and adds the new fingerprints of
+        *fingerprint_to_url_map* to the batch.
+
+        *request* is the request whose callback output is *result*.
+        """
+        ttls: Optional[Dict[str, float]] = None
+        if self.fm.recrawl_ttl_per_page_type:
+            # Item URLs have the page type of the request of the item.
+            ttls = {
+                fp: self.fm.get_recrawl_ttl(
+                    element if isinstance(element, Request) else request
+                )
+                for fp, indexes in to_check.items()
+                for element in (result[indexes[0]],)
+            }
 
         # Prepare list of duplications
         duplicated_fingerprints = await self.fm.get_existing_fingerprints_async(
-            list(to_check.keys())
+            list(to_check.keys()), ttls
         )
 
         if duplicated_fingerprints:
@@ -265,9 +1092,13 @@ class IncrementalCrawlingManager:
 
         url_fields = ["url", "canonicalUrl"]
 
+        if isinstance(item, dict) and self.item_type in item:
+            # Items with custom attributes wrap the item of the spider.
+            item = item[self.item_type]
         adapter = ItemAdapter(item)
         for url_field in url_fields:
-            if (url := adapter[url_field]) and url not in urls:
+            # Not every item type has every URL field.
+            if (url := adapter.get(url_field)) and url not in urls:
                 urls[url] = url_field
 
         if discard_request_url:
@@ -1,4 +1,5 @@
 import logging
+import sqlite3
 from typing import AsyncGenerator, Union
 
 from scrapinghub.client.exceptions import Unauthorized
@@ -7,7 +8,7 @@ from scrapy.exceptions import CloseSpider, NotConfigured
 from scrapy.http import Request
 from zyte_common_items import Item
 
-from .manager import CollectionsFingerprintsManager, IncrementalCrawlingManager
+from .manager import FINGERPRINTS_MANAGERS, IncrementalCrawlingManager
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +26,28 @@ class IncrementalCrawlMiddleware:
 
     Use :setting:`INCREMENTAL_CRAWL_BATCH_SIZE` to fine-tune interactions with
     the collection for performance.
+
+    Set :setting:`INCREMENTAL_CRAWL_STORAGE` to ``"sqlite"`` to keep that
+    record in a local SQLite database instead.
+
+    Set :setting:`INCREMENTAL_CRAWL_PREFETCH_ENABLED` to ``True`` to load the
+    record for the domains of start URLs at startup, so that most lookups are
+    answered locally.
+
+    Set :setting:`INCREMENTAL_CRAWL_RECRAWL_TTL` to crawl again URLs that were
+    last seen longer ago than that.
+
+    Set :setting:`INCREMENTAL_CRAWL_STREAMING_ENABLED` to ``True`` to yield
+    items as soon as they are received, and check requests in batches, instead
+    of waiting for the whole callback output.
+
+    Set :setting:`INCREMENTAL_CRAWL_SPOOL_PATH` to keep URLs of crawled items
+    in a local file until they are saved, so that they are not lost if the
+    crawl is interrupted.
+
+    Set :setting:`INCREMENTAL_CRAWL_KEY_FORMAT` to ``"compact"`` and
+    :setting:`INCREMENTAL_CRAWL_STORE_URLS` to ``False`` to reduce the size of
+    that record.
     """
 
     def __init__(self, crawler: Crawler):
@@ -34,19 +57,38 @@ class IncrementalCrawlMiddleware:
         self.inc_manager: IncrementalCrawlingManager = self.prepare_incremental_manager(
             crawler
         )
+        self.streaming_enabled = crawler.settings.getbool(
+            "INCREMENTAL_CRAWL_STREAMING_ENABLED", False
+        )
 
     @staticmethod
     def prepare_incremental_manager(crawler):
+        storage = crawler.settings.get("INCREMENTAL_CRAWL_STORAGE", "collection")
         try:
-            collection_fp = CollectionsFingerprintsManager(crawler)
-        except (AttributeError, Unauthorized, RuntimeError, ValueError) as exc_info:
+            manager_cls = FINGERPRINTS_MANAGERS[storage]
+        except KeyError:
+            raise ValueError(
+                f"Unsupported INCREMENTAL_CRAWL_STORAGE value: {storage!r}. "
+                f"Supported values: {', '.join(FINGERPRINTS_MANAGERS)}."
+            )
+        try:
+            fingerprints_manager = manager_cls(crawler)
+            if crawler.settings.getbool("INCREMENTAL_CRAWL_PREFETCH_ENABLED", False):
+                fingerprints_manager.prefetch_seed_domains()
+        except (
+            AttributeError,
+            Unauthorized,
+            RuntimeError,
+            ValueError,
+            sqlite3.Error,
+        ) as exc_info:
             logger.error(
-                f"IncrementalCrawlMiddleware is enabled, but something went wrong with Collections.\n"
+                f"IncrementalCrawlMiddleware is enabled, but something went wrong with {manager_cls.__name__}.\n"
                 f"The reason: {exc_info}"
             )
             raise CloseSpider("incremental_crawling_middleware_collection_issue")
 
-        return IncrementalCrawlingManager(crawler, collection_fp)
+        return IncrementalCrawlingManager(crawler, fingerprints_manager)
 
     @classmethod
     def from_crawler(cls, crawler: Crawler):
@@ -55,6 +97,13 @@ class IncrementalCrawlMiddleware:
     async def process_spider_output(
         self, response, result, spider
     ) -> AsyncGenerator[Union[Request, Item], None]:
+        if self.streaming_enabled:
+            async for item_or_request in self.inc_manager.process_incremental_stream(
+                response.request, result
+            ):
+                yield item_or_request
+            return
+
         result_list = []
         async for item_or_request in result:
             result_list.append(item_or_request)
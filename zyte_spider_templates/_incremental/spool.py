@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+from typing import IO, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FingerprintSpool:
+    """Append-only local file of fingerprints and URLs that may not be saved
+    to the storage yet, so that they survive a crash and can be replayed by
+    the next crawl.
+
+    Entries are written to the operating system as soon as they are
+    appended, so they survive the crawl process being killed, and synced to
+    disk every *sync_size* entries, so that they survive most system crashes
+    at a fraction of the cost of syncing every entry.
+    """
+
+    def __init__(self, path: str, sync_size: int = 100):
+        self.path = path
+        self.sync_size = max(sync_size, 1)
+        self._file: Optional[IO[str]] = None
+        self._unsynced = 0
+
+    def replay(self) -> List[Tuple[str, str]]:
+        """Returns the entries of the spool."""
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    fp, url = json.loads(line)
+                except (TypeError, ValueError):
+                    # A line cut short by a crash.
+                    logger.warning(f"Ignoring invalid spool line: {line!r}")
+                    continue
+                entries.append((fp, url))
+        return entries
+
+    def append(self, entries: Iterable[Tuple[str, str]]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        for fp, url in entries:
+            self._file.write(json.dumps([fp, url]) + "\n")
+            self._unsynced += 1
+        self._file.flush()
+        if self._unsynced >= self.sync_size:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._file is None or not self._unsynced:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def reset(self, entries: Iterable[Tuple[str, str]] = ()) -> None:
+        """Replaces the entries of the spool with *entries*, once all other
+        entries are saved to the storage.
+
+        If there are no *entries*, the spool file is removed.
+        """
+        self.close()
+        entries = list(entries)
+        if not entries:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            for fp, url in entries:
+                file.write(json.dumps([fp, url]) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
@@ -0,0 +1,131 @@
+import logging
+from collections import deque
+from queue import Full, Queue
+from threading import Lock, Thread
+from typing import Any, Callable, Deque, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    """Saves batches of fingerprints and URLs with *save* from a background
+    thread, so that storage writes do not block the reactor.
+
+    Up to *queue_size* batches wait to be saved. If the queue is full,
+    :meth:`write` does not block: the batch is kept in an overflow queue and
+    *pause* is called, e.g. to pause the engine, so that unsaved fingerprints
+    do not pile up in memory. Once the overflow queue is emptied, *resume* is
+    called from the reactor thread.
+
+    Until a batch is saved, its fingerprints are reported by :meth:`pending`,
+    so that they can be considered seen. Batches that could not be saved are
+    reported by :meth:`failed`.
+    """
+
+    def __init__(
+        self,
+        save: Callable[[List[Tuple[str, str]]], None],
+        queue_size: int,
+        stats: Any = None,
+        pause: Optional[Callable[[], None]] = None,
+        resume: Optional[Callable[[], None]] = None,
+    ):
+        self._save = save
+        self._stats = stats
+        self._pause = pause
+        self._resume = resume
+        self._queue: Queue = Queue(maxsize=max(queue_size, 1))
+        # Batches, in write order, that did not fit in the queue.
+        self._overflow: Deque[Any] = deque()
+        self._paused = False
+        self._pending: Deque[Set[str]] = deque()
+        self._failed: List[Tuple[str, str]] = []
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+
+    def write(self, batch: List[Tuple[str, str]]) -> None:
+        if self._thread is None:
+            self._thread = Thread(
+                target=self._run, name="incremental-crawl-writer", daemon=True
+            )
+            self._thread.start()
+        with self._lock:
+            self._pending.append({fp for fp, _ in batch})
+            if not self._overflow:
+                try:
+                    self._queue.put_nowait(batch)
+                    return
+                except Full:
+                    pass
+            self._overflow.append(batch)
+            if self._paused:
+                return
+            self._paused = True
+        logger.debug("The incremental crawl write queue is full, pausing.")
+        if self._stats:
+            self._stats.inc_value("incremental_crawling/write_backpressure")
+        if self._pause:
+            self._pause()
+
+    def pending(self, fingerprints: Set[str]) -> Set[str]:
+        """Returns the subset of *fingerprints* that are waiting to be
+        saved."""
+        with self._lock:
+            return set().union(*(fingerprints & batch for batch in self._pending))
+
+    def idle(self) -> bool:
+        """Returns whether all written batches have been processed."""
+        with self._lock:
+            return not self._pending
+
+    def failed(self) -> List[Tuple[str, str]]:
+        """Returns the fingerprints and URLs of batches that could not be
+        saved."""
+        with self._lock:
+            return list(self._failed)
+
+    def _refill(self) -> None:
+        with self._lock:
+            while self._overflow and not self._queue.full():
+                self._queue.put_nowait(self._overflow.popleft())
+            if not self._paused or self._overflow:
+                return
+            self._paused = False
+        if self._resume:
+            from twisted.internet import reactor
+
+            reactor.callFromThread(self._resume)  # type: ignore[attr-defined]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            self._refill()
+            if batch is _STOP:
+                break
+            try:
+                self._save(batch)
+            except Exception:
+                logger.exception(f"Could not save {len(batch)} fingerprints.")
+                if self._stats:
+                    self._stats.inc_value("incremental_crawling/write_errors")
+                with self._lock:
+                    self._failed.extend(batch)
+            finally:
+                with self._lock:
+                    self._pending.popleft()
+
+    def close(self) -> None:
+        """Saves pending batches and stops the background thread."""
+        if self._thread is None:
+            return
+        with self._lock:
+            # After any overflowing batch.
+            overflow = bool(self._overflow)
+            if overflow:
+                self._overflow.append(_STOP)
+        if not overflow:
+            self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,193 @@
+import math
+from collections import defaultdict
+from inspect import isasyncgenfunction
+from time import perf_counter
+from typing import Any, AsyncIterable, Callable, Dict, Iterable, Optional, Type
+
+from scrapy import Request, signals
+from scrapy.crawler import Crawler
+
+# Each power of 2 is split into this many buckets, i.e. recorded values are
+# rounded up by at most 2 ** (1 / _BUCKETS_PER_OCTAVE) - 1 ≈ 9%.
+_BUCKETS_PER_OCTAVE = 8
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of durations.
+
+    Durations are recorded in seconds and reported in microseconds. Memory
+    usage depends on the spread of recorded values, not on their count: a
+    histogram covering from 1µs to 1 hour needs less than 300 buckets.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = defaultdict(int)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        microseconds = seconds * 1_000_000
+        if microseconds <= 1:
+            bucket = 0
+        else:
+            bucket = math.ceil(math.log2(microseconds) * _BUCKETS_PER_OCTAVE)
+        self.buckets[bucket] += 1
+        self.count += 1
+
+    def percentile(self, percent: float) -> int:
+        """Return the upper bound, in microseconds, of the bucket that
+        contains the specified percentile."""
+        if not self.count:
+            return 0
+        threshold = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                break
+        return round(2 ** (bucket / _BUCKETS_PER_OCTAVE))
+
+    def to_stats(self, stats, prefix: str) -> None:
+        stats.set_value(f"{prefix}/count", self.count)
+        for percent in (50, 95, 99):
+            stats.set_value(f"{prefix}/p{percent}", self.percentile(percent))
+
+
+class MiddlewareLatency:
+    """Latency histograms of a spider middleware, exported to crawler stats
+    when the spider closes."""
+
+    def __init__(self, crawler: Crawler, name: str):
+        self.stats = crawler.stats
+        self.name = name
+        self.per_response = LatencyHistogram()
+        self.per_request = LatencyHistogram()
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    def spider_closed(self, spider) -> None:
+        assert self.stats
+        prefix = f"middleware_latency/{self.name}"
+        self.per_response.to_stats(self.stats, f"{prefix}/per_response")
+        self.per_request.to_stats(self.stats, f"{prefix}/per_request")
+
+    def wrap_output(
+        self, process: Callable[..., Iterable], response, result: Iterable, spider
+    ) -> Iterable:
+        """Run the *process* spider output method, recording its own time,
+        i.e. excluding the time spent iterating *result*, which includes the
+        spider callback and spider middlewares closer to the spider."""
+        upstream = 0.0
+
+        def timed_result() -> Iterable:
+            nonlocal upstream
+            iterator = iter(result)
+            while True:
+                start = perf_counter()
+                try:
+                    item_or_request = next(iterator)
+                except StopIteration:
+                    upstream += perf_counter() - start
+                    return
+                upstream += perf_counter() - start
+                yield item_or_request
+
+        response_time = 0.0
+        start, upstream_start = perf_counter(), upstream
+        for item_or_request in process(response, timed_result(), spider):
+            elapsed = perf_counter() - start - (upstream - upstream_start)
+            response_time += elapsed
+            if isinstance(item_or_request, Request):
+                self.per_request.record(elapsed)
+            yield item_or_request
+            start, upstream_start = perf_counter(), upstream
+        response_time += perf_counter() - start - (upstream - upstream_start)
+        self.per_response.record(response_time)
+
+    async def wrap_output_async(
+        self,
+        process: Callable[..., AsyncIterable],
+        response,
+        result: AsyncIterable,
+        spider,
+    ) -> AsyncIterable:
+        """Asynchronous counterpart of :meth:`wrap_output`.
+
+        Time spent awaiting, e.g. I/O done in a thread pool, counts as time of
+        the middleware that awaits it."""
+        upstream = 0.0
+
+        async def timed_result() -> AsyncIterable:
+            nonlocal upstream
+            iterator = result.__aiter__()
+            while True:
+                start = perf_counter()
+                try:
+                    item_or_request = await iterator.__anext__()
+                except StopAsyncIteration:
+                    upstream += perf_counter() - start
+                    return
+                upstream += perf_counter() - start
+                yield item_or_request
+
+        response_time = 0.0
+        start, upstream_start = perf_counter(), upstream
+        async for item_or_request in process(response, timed_result(), spider):
+            elapsed = perf_counter() - start - (upstream - upstream_start)
+            response_time += elapsed
+            if isinstance(item_or_request, Request):
+                self.per_request.record(elapsed)
+            yield item_or_request
+            start, upstream_start = perf_counter(), upstream
+        response_time += perf_counter() - start - (upstream - upstream_start)
+        self.per_response.record(response_time)
+
+
+_TIMED_CLASSES: Dict[Type, Type] = {}
+
+
+def timed_spider_middleware(cls: Type) -> Type:
+    """Return a subclass of the *cls* spider middleware that records the
+    latency of its spider output processing with :class:`MiddlewareLatency`.
+
+    Only the output processing methods that *cls* defines are wrapped, so that
+    the subclass keeps the sync or async nature of *cls*.
+    """
+    if cls in _TIMED_CLASSES:
+        return _TIMED_CLASSES[cls]
+
+    def from_crawler(timed_cls, crawler):
+        middleware = cls.from_crawler.__func__(timed_cls, crawler)
+        middleware._latency = MiddlewareLatency(crawler, cls.__name__)
+        return middleware
+
+    namespace: Dict[str, Any] = {
+        "__doc__": cls.__doc__,
+        "from_crawler": classmethod(from_crawler),
+    }
+    for method_name in ("process_spider_output", "process_spider_output_async"):
+        method: Optional[Callable] = getattr(cls, method_name, None)
+        if method is None:
+            continue
+        if method_name.endswith("_async") or isasyncgenfunction(method):
+            namespace[method_name] = _async_wrapper(method)
+        else:
+            namespace[method_name] = _sync_wrapper(method)
+    timed_cls = type(f"Timed{cls.__name__}", (cls,), namespace)
+    _TIMED_CLASSES[cls] = timed_cls
+    return timed_cls
+
+
+def _sync_wrapper(method: Callable) -> Callable:
+    def process_spider_output(self, response, result, spider):
+        return self._latency.wrap_output(method.__get__(self), response, result, spider)
+
+    return process_spider_output
+
+
+def _async_wrapper(method: Callable) -> Callable:
+    async def process_spider_output(self, response, result, spider):
+        async for item_or_request in self._latency.wrap_output_async(
+            method.__get__(self), response, result, spider
+        ):
+            yield item_or_request
+
+    return process_spider_output
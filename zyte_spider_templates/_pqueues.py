@@ -0,0 +1,277 @@
+import logging
+import os
+from collections import OrderedDict, deque
+from hashlib import md5
+from typing import Any, Deque, Dict, Iterable, Mapping, Optional, Protocol, Type
+from weakref import WeakKeyDictionary
+
+from scrapy import Request, signals
+from scrapy.crawler import Crawler
+from scrapy.pqueues import DownloaderAwarePriorityQueue, ScrapyPriorityQueue
+
+from zyte_spider_templates._seeds import PerSeedValues, get_seed_registry
+
+try:
+    from scrapy.utils.misc import build_from_crawler
+except ImportError:  # Scrapy < 2.12
+    from scrapy.utils.misc import create_instance
+
+    def build_from_crawler(objcls, crawler, /, *args, **kwargs):  # type: ignore[misc]
+        return create_instance(objcls, None, crawler, *args, **kwargs)
+
+
+logger = logging.getLogger(__name__)
+
+_NO_SEED = "none"
+
+# Seed disk queues kept open at a time by a priority queue, as each disk queue
+# keeps file handles open.
+_MAX_OPEN_DISK_QUEUES = 256
+
+# Requests enqueued per seed, shared by the memory and disk queues of a crawler,
+# only while MAX_REQUESTS_PER_SEED applies to enqueued requests.
+_ENQUEUED: "WeakKeyDictionary[Crawler, PerSeedValues[int]]" = WeakKeyDictionary()
+
+
+class _Queue(Protocol):
+    def push(self, request: Request) -> None:
+        ...
+
+    def pop(self) -> Optional[Request]:
+        ...
+
+    def close(self) -> None:
+        ...
+
+    def __len__(self) -> int:
+        ...
+
+
+def release_request(crawler: Crawler, request: Request) -> None:
+    """Stop counting *request* towards the ``MAX_REQUESTS_PER_SEED`` budget
+    of enqueued requests of its seed, e.g. because it was filtered out before
+    being downloaded."""
+    enqueued = _ENQUEUED.get(crawler)
+    if enqueued is None or (seed := request.meta.get("seed")) is None:
+        return
+    seed_id = enqueued.registry.get_id(seed)
+    enqueued.set_by_id(seed_id, max(0, enqueued.get_by_id(seed_id) - 1))
+
+
+def _seed_queue_name(seed: Any) -> str:
+    if seed is None:
+        return _NO_SEED
+    return md5(str(seed).encode()).hexdigest()  # nosec
+
+
+class _OpenQueues:
+    """Downstream queues of a priority queue, by path.
+
+    If *size* is set, only that many queues are kept open, and the least
+    recently used ones are closed, to be opened again from disk when needed.
+    """
+
+    def __init__(
+        self, crawler: Crawler, downstream_queue_cls: Type[Any], size: Optional[int]
+    ):
+        self.crawler = crawler
+        self.downstream_queue_cls = downstream_queue_cls
+        self.size = size
+        self._queues: "OrderedDict[str, _Queue]" = OrderedDict()
+
+    def get(self, path: str) -> _Queue:
+        queue = self._queues.get(path)
+        if queue is not None:
+            self._queues.move_to_end(path)
+            return queue
+        queue = self._queues[path] = build_from_crawler(
+            self.downstream_queue_cls, self.crawler, path
+        )
+        if self.size is not None and len(self._queues) > self.size:
+            self._queues.popitem(last=False)[1].close()
+        return queue
+
+    def close(self, path: str) -> None:
+        if (queue := self._queues.pop(path, None)) is not None:
+            queue.close()
+
+
+class _SeedRoundRobinQueue:
+    """Downstream queue of a single priority that keeps a queue per seed and
+    pops from them in turns."""
+
+    def __init__(self, open_queues: _OpenQueues, key: str, restore: bool = False):
+        self.open_queues = open_queues
+        self.key = key
+        # Number of requests of each non-empty seed queue.
+        self.lengths: Dict[str, int] = {}
+        # Names of non-empty seed queues, in pop order.
+        self.turns: Deque[str] = deque()
+        self._len = 0
+        if restore and os.path.isdir(key):
+            for name in sorted(os.listdir(key)):
+                length = len(self.open_queues.get(self._path(name)))
+                if length:
+                    self.lengths[name] = length
+                    self.turns.append(name)
+                    self._len += length
+                else:
+                    self.open_queues.close(self._path(name))
+
+    def _path(self, name: str) -> str:
+        return f"{self.key}/{name}"
+
+    def push(self, request: Request) -> None:
+        name = _seed_queue_name(request.meta.get("seed"))
+        self.open_queues.get(self._path(name)).push(request)
+        if name not in self.lengths:
+            self.lengths[name] = 0
+            self.turns.append(name)
+        self.lengths[name] += 1
+        self._len += 1
+
+    def pop(self) -> Optional[Request]:
+        if not self.turns:
+            return None
+        name = self.turns.popleft()
+        request = self.open_queues.get(self._path(name)).pop()
+        self._len -= 1
+        self.lengths[name] -= 1
+        if self.lengths[name]:
+            self.turns.append(name)
+        else:
+            del self.lengths[name]
+            self.open_queues.close(self._path(name))
+        return request
+
+    def peek(self) -> Optional[Request]:
+        if not self.turns:
+            return None
+        queue = self.open_queues.get(self._path(self.turns[0]))
+        return queue.peek()  # type: ignore[attr-defined]
+
+    def close(self) -> None:
+        for name in self.lengths:
+            self.open_queues.close(self._path(name))
+        self.lengths.clear()
+        self.turns.clear()
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+
+class _SeedRoundRobinPriorityQueue(ScrapyPriorityQueue):
+    def __init__(
+        self,
+        crawler: Crawler,
+        downstream_queue_cls: Type[Any],
+        key: str,
+        startprios: Iterable[int],
+        open_queues: _OpenQueues,
+    ):
+        self.open_queues = open_queues
+        super().__init__(crawler, downstream_queue_cls, key, startprios)
+
+    def init_prios(self, startprios: Iterable[int]) -> None:
+        if not startprios:
+            return
+        for priority in startprios:
+            self.queues[priority] = self.qfactory(priority, restore=True)
+        self.curprio = min(startprios)
+
+    def qfactory(self, key: int, restore: bool = False) -> Any:
+        return _SeedRoundRobinQueue(
+            self.open_queues, f"{self.key}/{key}", restore=restore
+        )
+
+
+class SeedAwarePriorityQueue(DownloaderAwarePriorityQueue):
+    """Drop-in replacement for
+    :class:`~scrapy.pqueues.DownloaderAwarePriorityQueue` that is aware of
+    the seed of each request, as set by
+    :class:`~zyte_spider_templates.TrackSeedsSpiderMiddleware`.
+
+    Within each download slot and priority, requests of different seeds are
+    dequeued in turns, so that a seed with many requests does not delay the
+    requests of other seeds with the same priority. With ``JOBDIR``, each seed
+    gets its own disk queue, and only the 256 most recently used ones are
+    kept open, to limit open files.
+
+    If the ``MAX_REQUESTS_PER_SEED`` setting is positive, requests of a seed
+    that already has that many requests enqueued are dropped when they are
+    enqueued, instead of being stored in the scheduler until
+    :class:`~zyte_spider_templates.MaxRequestsPerSeedDownloaderMiddleware`
+    drops them before download. The ``request_dropped`` signal is sent
+    for them, and they are counted in the ``seeds/max_requests_dropped``
+    stat; since the scheduler cannot tell, they are also counted in its
+    ``scheduler/enqueued`` stats. Requests that downloader middlewares filter
+    out, e.g. offsite requests, do not count towards the limit if
+    :class:`~zyte_spider_templates.MaxRequestsPerSeedDownloaderMiddleware` is
+    enabled. This does not apply if ``MAX_REQUESTS_PER_SEED_ADAPTIVE`` is
+    ``True``.
+
+    To use it, set the ``SCHEDULER_PRIORITY_QUEUE`` setting to
+    ``"zyte_spider_templates.SeedAwarePriorityQueue"``.
+    """
+
+    def __init__(
+        self,
+        crawler: Crawler,
+        downstream_queue_cls: Type[Any],
+        key: str,
+        slot_startprios: Optional[Mapping[str, Iterable[int]]] = None,
+    ):
+        # The scheduler uses an empty key for its memory queue.
+        self._open_queues = _OpenQueues(
+            crawler, downstream_queue_cls, _MAX_OPEN_DISK_QUEUES if key else None
+        )
+        self._seeds = get_seed_registry(crawler)
+        self._max_requests_per_seed = max(
+            0, crawler.settings.getint("MAX_REQUESTS_PER_SEED", 0)
+        )
+        if crawler.settings.getbool("MAX_REQUESTS_PER_SEED_ADAPTIVE", False):
+            # Seeds may use more than their share of the budget.
+            self._max_requests_per_seed = 0
+        if self._max_requests_per_seed and crawler not in _ENQUEUED:
+            _ENQUEUED[crawler] = PerSeedValues.counters(self._seeds)
+        self._enqueued = _ENQUEUED.get(crawler)
+        super().__init__(
+            crawler,
+            downstream_queue_cls,
+            key,
+            dict(slot_startprios) if slot_startprios is not None else None,
+        )
+
+    def pqfactory(
+        self, slot: str, startprios: Iterable[int] = ()
+    ) -> ScrapyPriorityQueue:
+        return _SeedRoundRobinPriorityQueue(
+            self.crawler,
+            self.downstream_queue_cls,
+            f"{self.key}/{_seed_queue_name(slot)}",
+            startprios,
+            self._open_queues,
+        )
+
+    def push(self, request: Request) -> None:
+        seed = request.meta.get("seed")
+        if seed is None or self._enqueued is None:
+            super().push(request)
+            return
+        seed_id = self._seeds.get_id(seed)
+        count = self._enqueued.get_by_id(seed_id)
+        if count >= self._max_requests_per_seed:
+            logger.debug(
+                f"The request {request} is dropped as "
+                f"{self._max_requests_per_seed} max requests per seed have been "
+                f"enqueued for seed {self._seeds.get_seed(seed)}."
+            )
+            assert self.crawler.stats
+            self.crawler.stats.inc_value("seeds/max_requests_dropped")
+            self.crawler.signals.send_catch_log(
+                signals.request_dropped, request=request, spider=self.crawler.spider
+            )
+            return
+        super().push(request)
+        self._enqueued.set_by_id(seed_id, count + 1)
@@ -0,0 +1,219 @@
+import logging
+import os
+import pickle  # nosec
+from array import array
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    TypeVar,
+)
+from weakref import WeakKeyDictionary
+
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.utils.job import job_dir
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+_REGISTRIES: "WeakKeyDictionary[Crawler, SeedRegistry]" = WeakKeyDictionary()
+
+
+class SeedRegistry:
+    """Assigns a compact integer ID to every seed of a crawl.
+
+    Per-seed state can then be kept in arrays indexed by seed ID, and, if
+    *ids_in_meta* is ``True``, :attr:`Request.meta <scrapy.http.Request.meta>`
+    stores seed IDs instead of seed URLs (see :setting:`SEED_IDS_ENABLED`), in
+    which case any integer ``"seed"`` meta value is a seed ID.
+
+    If *path* is set, seeds are appended to that file as they are registered,
+    and seeds already in that file are registered first, so that seed IDs in
+    requests restored from a previous run of the same job keep their meaning.
+    """
+
+    def __init__(self, ids_in_meta: bool = False, path: Optional[str] = None):
+        self.ids_in_meta = ids_in_meta
+        self.seeds: List[Any] = []
+        self._ids: Dict[Any, int] = {}
+        self._file: Optional[IO[bytes]] = None
+        self._warned_unknown_id = False
+        #: Number of seeds of start requests, set once all start requests have
+        #: been read.
+        self.start_seed_count: Optional[int] = None
+        if path is not None:
+            self._file = open(path, "a+b")
+            self._load(self._file)
+
+    def _load(self, file: IO[bytes]) -> None:
+        file.seek(0)
+        while True:
+            end = file.tell()
+            try:
+                seed = pickle.load(file)  # nosec
+            except (EOFError, pickle.UnpicklingError):
+                break
+            self._ids[seed] = len(self.seeds)
+            self.seeds.append(seed)
+        if file.seek(0, os.SEEK_END) != end:
+            # A seed cut short by a crash, registered again when found again.
+            logger.warning(f"Ignoring an incomplete seed in {file.name}.")
+            file.truncate(end)
+
+    def __len__(self) -> int:
+        return len(self.seeds)
+
+    def _is_id(self, seed: Any) -> bool:
+        return self.ids_in_meta and type(seed) is int and seed >= 0
+
+    def get_id(self, seed: Any) -> int:
+        """Return the ID of *seed*, a seed URL or ``"seed"`` meta value,
+        registering it if needed."""
+        if self._is_id(seed):
+            if seed >= len(self.seeds):
+                self._register_unknown_ids(seed)
+            return seed
+        try:
+            return self._ids[seed]
+        except KeyError:
+            return self._register(seed)
+
+    def _register(self, seed: Any) -> int:
+        seed_id = self._ids[seed] = len(self.seeds)
+        self.seeds.append(seed)
+        if self._file is not None:
+            pickle.dump(seed, self._file)
+            self._file.flush()
+        return seed_id
+
+    def _register_unknown_ids(self, seed_id: int) -> None:
+        # Registering placeholders keeps the unknown ID, and any other ID,
+        # pointing to a single seed.
+        if not self._warned_unknown_id:
+            self._warned_unknown_id = True
+            logger.warning(
+                f"Found unknown seed ID {seed_id}. Seed IDs can only be used by "
+                f"the crawl that assigned them, or by a later run of the same "
+                f"job (see the JOBDIR setting)."
+            )
+        while len(self.seeds) <= seed_id:
+            self._register(self._unknown_seed(len(self.seeds)))
+
+    @staticmethod
+    def _unknown_seed(seed_id: int) -> str:
+        return f"<unknown seed {seed_id}>"
+
+    def find_id(self, seed: Any) -> Optional[int]:
+        """Return the ID of *seed*, or ``None`` if it has not been
+        registered."""
+        if self._is_id(seed):
+            return seed if seed < len(self.seeds) else None
+        return self._ids.get(seed)
+
+    def get_seed(self, seed: Any) -> Any:
+        """Return the seed URL of *seed*, a ``"seed"`` meta value."""
+        if self._is_id(seed):
+            if seed < len(self.seeds):
+                return self.seeds[seed]
+            return self._unknown_seed(seed)
+        return seed
+
+    def to_meta(self, seed: Any) -> Any:
+        """Return the value to store in the ``"seed"`` meta key for
+        *seed*."""
+        if self.ids_in_meta and seed is not None:
+            return self.get_id(seed)
+        return seed
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def get_seed_registry(crawler: Crawler) -> SeedRegistry:
+    """Return the seed registry of *crawler*, shared by all its
+    components.
+
+    If seed IDs are stored in requests and the crawl has a job directory,
+    the registry is kept in that directory, so that a resumed job can
+    understand the seed IDs of requests restored from its disk queues.
+    """
+    try:
+        return _REGISTRIES[crawler]
+    except KeyError:
+        ids_in_meta = crawler.settings.getbool("SEED_IDS_ENABLED", False)
+        path = None
+        if ids_in_meta and (jobdir := job_dir(crawler.settings)):
+            path = os.path.join(jobdir, "seed_registry")
+        registry = _REGISTRIES[crawler] = SeedRegistry(ids_in_meta, path)
+        if path is not None:
+            crawler.signals.connect(registry.close, signal=signals.spider_closed)
+        return registry
+
+
+class PerSeedValues(MutableMapping, Generic[V]):
+    """Mapping of seeds to values, backed by a sequence indexed by seed ID.
+
+    Seeds without a value, or whose value is *missing*, are not part of the
+    mapping. Use :meth:`get_by_id` and :meth:`set_by_id` on hot paths.
+    """
+
+    def __init__(
+        self,
+        registry: SeedRegistry,
+        values: Optional[MutableSequence] = None,
+        missing: Any = None,
+    ):
+        self.registry = registry
+        self._values: MutableSequence = [] if values is None else values
+        self.missing = missing
+
+    @staticmethod
+    def counters(registry: SeedRegistry) -> "PerSeedValues[int]":
+        return PerSeedValues[int](registry, array("L"), 0)
+
+    def get_by_id(self, seed_id: Optional[int]) -> Any:
+        if seed_id is None or seed_id >= len(self._values):
+            return self.missing
+        return self._values[seed_id]
+
+    def set_by_id(self, seed_id: int, value: Any) -> None:
+        if seed_id >= len(self._values):
+            self._values.extend([self.missing] * (seed_id + 1 - len(self._values)))
+        self._values[seed_id] = value
+
+    def __getitem__(self, seed: Any) -> V:
+        value = self.get_by_id(self.registry.find_id(seed))
+        if value == self.missing:
+            raise KeyError(seed)
+        return value
+
+    def __setitem__(self, seed: Any, value: V) -> None:
+        self.set_by_id(self.registry.get_id(seed), value)
+
+    def __delitem__(self, seed: Any) -> None:
+        seed_id = self.registry.find_id(seed)
+        if self.get_by_id(seed_id) == self.missing:
+            raise KeyError(seed)
+        assert seed_id is not None
+        self._values[seed_id] = self.missing
+
+    def __iter__(self) -> Iterator[Any]:
+        for seed_id, value in enumerate(self._values):
+            if value != self.missing:
+                yield self.registry.seeds[seed_id]
+
+    def __len__(self) -> int:
+        return sum(1 for value in self._values if value != self.missing)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
@@ -0,0 +1,60 @@
+import os
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Tuple, Union
+
+from duplicate_url_discarder.processors import UrlProcessorBase
+from duplicate_url_discarder.url_canonicalizer import UrlCanonicalizer
+from url_matcher.util import get_domain
+
+_Rule = Tuple[Callable[[str], bool], UrlProcessorBase]
+
+
+class DomainRuleIndex:
+    """URL canonicalizer equivalent to
+    :class:`duplicate_url_discarder.url_canonicalizer.UrlCanonicalizer`, with
+    its rules compiled into a per-domain index.
+
+    The rules of a domain, and the domain of a host, are looked up once per
+    host instead of once per URL, so canonicalizing a URL only involves
+    matching it against the rules of its domain.
+    """
+
+    def __init__(self, rule_paths: Iterable[Union[str, os.PathLike]]):
+        canonicalizer = UrlCanonicalizer(rule_paths)
+        processors = canonicalizer.processors
+        url_matcher = canonicalizer.url_matcher
+        self._rules_by_domain: Dict[str, Tuple[_Rule, ...]] = {
+            domain: tuple(
+                (matcher.match, processors[matcher.identifier]) for matcher in matchers
+            )
+            for domain, matchers in url_matcher.matchers_by_domain.items()
+            if domain
+        }
+        self._universal_processors: Tuple[UrlProcessorBase, ...] = tuple(
+            processors[identifier] for identifier in url_matcher.match_universal()
+        )
+        # Bounded, as a crawl may reach any number of hosts.
+        self.rules_for = lru_cache(maxsize=4096)(self._rules_for)
+
+    def __len__(self) -> int:
+        """Return the number of domains with domain-specific rules."""
+        return len(self._rules_by_domain)
+
+    def _rules_for(self, host: str) -> Tuple[_Rule, ...]:
+        return self._rules_by_domain.get(get_domain(host), ())
+
+    def process_url(self, url: str, host: str) -> str:
+        """Return the canonical form of *url*, whose network location is
+        *host*."""
+        original_url = url
+        matched = False
+        # Like UrlCanonicalizer, match rules against the original URL and
+        # chain their processors.
+        for match, processor in self.rules_for(host):
+            if match(original_url):
+                matched = True
+                url = processor.process(url)
+        if not matched:
+            for processor in self._universal_processors:
+                url = processor.process(url)
+        return url
@@ -0,0 +1,456 @@
+"""Compact binary format for :class:`~zyte_spider_templates.CrawlingLogsMiddleware`
+records, and tools to read it back.
+
+Set :setting:`CRAWLING_LOGS_FORMAT` to ``"binary"`` to write crawling logs in
+this format, and run ``python -m zyte_spider_templates.crawl_graph <file>`` to
+get per-page-type fan-out statistics from the resulting file.
+
+A file is a sequence of records, each made of its payload size as an unsigned
+LEB128 varint followed by its payload, whose first byte is the record type:
+
+-   ``HEADER``: ``ZSTCG`` followed by the format version. It starts every
+    crawl written to the file, and resets the URL, page type and node tables.
+
+-   ``URL`` and ``PAGE_TYPE``: a UTF-8 string, which gets the next ID of the
+    corresponding table, starting at 0.
+
+-   ``NODE``: a request, i.e. a URL ID and a fingerprint, which gets the next
+    node ID, starting at 0.
+
+-   ``PAGE``: a parsed response: a Unix timestamp, the node ID of its request,
+    the URL ID of its URL, its page type and probability, and, for each
+    request to crawl from it, its node ID, page type, probability and
+    priority.
+
+-   ``SUMMARY``: a crawling logs summary as UTF-8 JSON.
+
+Integers are unsigned LEB128 varints, except priorities, which are
+zigzag-encoded first. Page type IDs are stored plus 1, with 0 meaning no page
+type. Probabilities are stored as 2-byte unsigned integers, the probability
+multiplied by 10000, with 0xFFFF meaning no probability.
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import struct
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import IO, Any, Dict, Generator, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ZSTCG"
+VERSION = 1
+
+HEADER = 0
+URL = 1
+PAGE_TYPE = 2
+NODE = 3
+PAGE = 4
+SUMMARY = 5
+
+_NO_PROBABILITY = 0xFFFF
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _encode_varint(value: int, buffer: bytearray) -> None:
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _encode_probability(probability: Optional[float], buffer: bytearray) -> None:
+    if probability is None:
+        value = _NO_PROBABILITY
+    else:
+        value = min(max(round(probability * 10000), 0), 10000)
+    buffer += struct.pack("<H", value)
+
+
+def _decode_probability(data: bytes, pos: int) -> Tuple[Optional[float], int]:
+    (value,) = struct.unpack_from("<H", data, pos)
+    return (None if value == _NO_PROBABILITY else value / 10000), pos + 2
+
+
+class CrawlGraphEncoder:
+    """Encodes :class:`~zyte_spider_templates.CrawlingLogsMiddleware` records
+    into the binary crawl graph format.
+
+    It keeps the tables of URLs, page types and nodes written so far, so a
+    single instance must be used per file, and records must be written in the
+    order in which they are encoded.
+    """
+
+    def __init__(self):
+        self._urls: Dict[str, int] = {}
+        self._page_types: Dict[str, int] = {}
+        self._nodes: Dict[bytes, int] = {}
+        self._started = False
+        # Table entries added by the record being encoded.
+        self._added: List[Tuple[Dict[Any, int], Any]] = []
+
+    def __call__(self, record: Dict[str, Any]) -> bytes:
+        self._added.clear()
+        try:
+            output = self._encode(record)
+        except BaseException:
+            # The record is not written, so neither are its table entries.
+            for table, key in reversed(self._added):
+                del table[key]
+            raise
+        finally:
+            self._added.clear()
+        self._started = True
+        return output
+
+    def _encode(self, record: Dict[str, Any]) -> bytes:
+        output = bytearray()
+        if not self._started:
+            self._write(output, bytes([HEADER]) + MAGIC + bytes([VERSION]))
+        if "summary" in record:
+            payload = bytes([SUMMARY]) + json.dumps(record["summary"]).encode()
+            self._write(output, payload)
+            return bytes(output)
+
+        current = record["current"]
+        payload = bytearray([PAGE])
+        _encode_varint(self._timestamp(record.get("time")), payload)
+        _encode_varint(
+            self._node(current["request_url"], current["request_fingerprint"], output),
+            payload,
+        )
+        _encode_varint(self._url(current["url"], output), payload)
+        _encode_varint(self._page_type(current["page_type"], output), payload)
+        _encode_probability(current["probability"], payload)
+        children = [
+            child for requests in record["to_crawl"].values() for child in requests
+        ]
+        _encode_varint(len(children), payload)
+        for child in children:
+            _encode_varint(
+                self._node(child["request_url"], child["request_fingerprint"], output),
+                payload,
+            )
+            _encode_varint(self._page_type(child.get("page_type"), output), payload)
+            _encode_probability(child.get("probability"), payload)
+            priority = child.get("request_priority", 0)
+            _encode_varint((priority << 1) ^ (priority >> 63), payload)
+        self._write(output, payload)
+        return bytes(output)
+
+    @staticmethod
+    def _write(output: bytearray, payload: bytes) -> None:
+        _encode_varint(len(payload), output)
+        output += payload
+
+    @staticmethod
+    def _timestamp(value: Optional[str]) -> int:
+        if not value:
+            return int(time.time())
+        return int(datetime.strptime(value, _TIME_FORMAT).timestamp())
+
+    def _add(self, table: Dict[Any, int], key: Any) -> int:
+        value = table[key] = len(table)
+        self._added.append((table, key))
+        return value
+
+    def _url(self, url: str, output: bytearray) -> int:
+        if (url_id := self._urls.get(url)) is None:
+            url_id = self._add(self._urls, url)
+            self._write(output, bytes([URL]) + url.encode())
+        return url_id
+
+    def _page_type(self, page_type: Optional[str], output: bytearray) -> int:
+        if not page_type:
+            return 0
+        if (page_type_id := self._page_types.get(page_type)) is None:
+            page_type_id = self._add(self._page_types, page_type)
+            self._write(output, bytes([PAGE_TYPE]) + page_type.encode())
+        return page_type_id + 1
+
+    def _node(self, url: str, fingerprint: str, output: bytearray) -> int:
+        key = bytes.fromhex(fingerprint)
+        if (node_id := self._nodes.get(key)) is None:
+            payload = bytearray([NODE])
+            _encode_varint(self._url(url, output), payload)
+            payload += key
+            node_id = self._add(self._nodes, key)
+            self._write(output, payload)
+        return node_id
+
+
+def read_records(file: IO[bytes]) -> Generator[Dict[str, Any], None, None]:
+    """Read a binary crawl graph file, yielding its records in the same shape
+    as the JSON records of
+    :class:`~zyte_spider_templates.CrawlingLogsMiddleware`.
+
+    Only the fields stored in the binary format are included.
+
+    Files on disk are memory-mapped rather than read into memory.
+
+    If the file ends with an incomplete record, e.g. because the crawl that
+    wrote it was killed, a warning is logged and reading stops at the last
+    complete record. Other invalid data raises :exc:`ValueError`.
+    """
+    try:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # Not a file on disk, or an empty one.
+        yield from _read_records(file.read())
+        return
+    with data:
+        yield from _read_records(data)
+
+
+def _read_records(data: Any) -> Iterator[Dict[str, Any]]:
+    pos = 0
+    urls: List[str] = []
+    page_types: List[Optional[str]] = [None]
+    nodes: List[Tuple[str, str]] = []
+    while pos < len(data):
+        start = pos
+        try:
+            size, pos = _decode_varint(data, pos)
+        except IndexError:
+            # The record size itself is incomplete.
+            end = len(data) + 1
+        else:
+            end = pos + size
+        if end > len(data):
+            logger.warning(
+                f"Ignoring the incomplete crawl graph record at byte {start}, "
+                f"the file is truncated."
+            )
+            return
+        if size == 0:
+            raise ValueError(f"Invalid crawl graph record at byte {start}.")
+        try:
+            record = _read_record(data, pos, end, urls, page_types, nodes)
+        except (IndexError, struct.error) as exception:
+            raise ValueError(
+                f"Invalid crawl graph record at byte {start}."
+            ) from exception
+        if record is not None:
+            yield record
+        pos = end
+
+
+def _read_record(
+    data: Any,
+    pos: int,
+    end: int,
+    urls: List[str],
+    page_types: List[Optional[str]],
+    nodes: List[Tuple[str, str]],
+) -> Optional[Dict[str, Any]]:
+    """Read the record from *pos* to *end*, updating the *urls*, *page_types*
+    and *nodes* tables in place, and return it if it is a page or summary
+    record."""
+    record_type = data[pos]
+    pos += 1
+    if record_type == HEADER:
+        if bytes(data[pos : pos + len(MAGIC)]) != MAGIC:
+            raise ValueError(f"Invalid crawl graph header at byte {pos - 1}.")
+        version = data[pos + len(MAGIC)]
+        if version != VERSION:
+            raise ValueError(f"Unsupported crawl graph version {version}.")
+        del urls[:], nodes[:], page_types[1:]
+    elif record_type == URL:
+        urls.append(data[pos:end].decode())
+    elif record_type == PAGE_TYPE:
+        page_types.append(data[pos:end].decode())
+    elif record_type == NODE:
+        url_id, pos = _decode_varint(data, pos)
+        nodes.append((urls[url_id], bytes(data[pos:end]).hex()))
+    elif record_type == SUMMARY:
+        return {"summary": json.loads(data[pos:end])}
+    elif record_type == PAGE:
+        return _read_page(data, pos, urls, page_types, nodes)
+    else:
+        raise ValueError(f"Unknown crawl graph record type {record_type}.")
+    return None
+
+
+def _read_page(
+    data: Any,
+    pos: int,
+    urls: List[str],
+    page_types: List[Optional[str]],
+    nodes: List[Tuple[str, str]],
+) -> Dict[str, Any]:
+    timestamp, pos = _decode_varint(data, pos)
+    node_id, pos = _decode_varint(data, pos)
+    url_id, pos = _decode_varint(data, pos)
+    page_type_id, pos = _decode_varint(data, pos)
+    probability, pos = _decode_probability(data, pos)
+    request_url, fingerprint = nodes[node_id]
+    to_crawl: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    children, pos = _decode_varint(data, pos)
+    for _ in range(children):
+        child_node_id, pos = _decode_varint(data, pos)
+        child_page_type_id, pos = _decode_varint(data, pos)
+        child_probability, pos = _decode_probability(data, pos)
+        zigzag_priority, pos = _decode_varint(data, pos)
+        child_url, child_fingerprint = nodes[child_node_id]
+        child: Dict[str, Any] = {}
+        if child_page_type := page_types[child_page_type_id]:
+            child["page_type"] = child_page_type
+        if child_probability is not None:
+            child["probability"] = child_probability
+        child["request_url"] = child_url
+        child["request_priority"] = (zigzag_priority >> 1) ^ -(zigzag_priority & 1)
+        child["request_fingerprint"] = child_fingerprint
+        to_crawl[child_page_type or "unknown"].append(child)
+    return {
+        "time": datetime.fromtimestamp(timestamp).strftime(_TIME_FORMAT),
+        "current": {
+            "url": urls[url_id],
+            "request_url": request_url,
+            "request_fingerprint": fingerprint,
+            "page_type": page_types[page_type_id],
+            "probability": probability,
+        },
+        "to_crawl": dict(to_crawl),
+    }
+
+
+class CrawlGraph:
+    """Crawl graph rebuilt from crawling logs records.
+
+    Nodes are request fingerprints, and there is an edge from the request of
+    every parsed response to each request to crawl from that response.
+    """
+
+    def __init__(self):
+        #: Request fingerprint → request URL.
+        self.urls: Dict[str, str] = {}
+        #: Request fingerprint → page type, as parsed or, for requests not
+        #: parsed, as expected by the parent response.
+        self.page_types: Dict[str, Optional[str]] = {}
+        #: Parent request fingerprint → child request fingerprints.
+        self.edges: Dict[str, List[str]] = defaultdict(list)
+        #: Fingerprints of parsed requests.
+        self.parsed: Dict[str, None] = {}
+
+    @classmethod
+    def from_records(cls, records: Iterator[Dict[str, Any]]) -> "CrawlGraph":
+        graph = cls()
+        for record in records:
+            if "current" in record:
+                graph.add_record(record)
+        return graph
+
+    def add_record(self, record: Dict[str, Any]) -> None:
+        current = record["current"]
+        parent = current["request_fingerprint"]
+        self.urls[parent] = current["request_url"]
+        self.page_types[parent] = current["page_type"]
+        self.parsed[parent] = None
+        for page_type, children in record["to_crawl"].items():
+            for child in children:
+                fingerprint = child["request_fingerprint"]
+                self.urls.setdefault(fingerprint, child["request_url"])
+                self.page_types.setdefault(fingerprint, page_type)
+                self.edges[parent].append(fingerprint)
+
+    def fan_out_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return, for each page type of parsed responses, the number of
+        responses, the total, mean and maximum number of requests to crawl per
+        response, and the number of requests to crawl per page type."""
+        stats: Dict[str, Dict[str, Any]] = {}
+        for parent in self.parsed:
+            page_type = self.page_types[parent] or "unknown"
+            children = self.edges.get(parent, [])
+            entry = stats.setdefault(
+                page_type,
+                {"responses": 0, "requests": 0, "max": 0, "to_crawl": {}},
+            )
+            entry["responses"] += 1
+            entry["requests"] += len(children)
+            entry["max"] = max(entry["max"], len(children))
+            for child in children:
+                child_page_type = self.page_types[child] or "unknown"
+                entry["to_crawl"][child_page_type] = (
+                    entry["to_crawl"].get(child_page_type, 0) + 1
+                )
+        for entry in stats.values():
+            entry["mean"] = entry["requests"] / entry["responses"]
+        return stats
+
+
+def _format_fan_out_stats(stats: Dict[str, Dict[str, Any]]) -> str:
+    lines = []
+    for page_type, entry in sorted(stats.items()):
+        lines.append(
+            f"{page_type}: {entry['responses']} responses, "
+            f"{entry['requests']} requests "
+            f"(mean {entry['mean']:.2f}, max {entry['max']} per response)"
+        )
+        for child_page_type, count in sorted(entry["to_crawl"].items()):
+            lines.append(f"  - {child_page_type}: {count}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m zyte_spider_templates.crawl_graph",
+        description="Read a binary crawling logs file and print per-page-type "
+        "fan-out statistics of its crawl graph.",
+    )
+    parser.add_argument("path", help="Path of a binary crawling logs file.")
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print fan-out statistics as JSON.",
+    )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Instead of statistics, print the records of the file as JSON Lines.",
+    )
+    parser.add_argument(
+        "--edges",
+        metavar="PATH",
+        help="Also write the edges of the crawl graph to PATH, one "
+        "tab-separated parent and child request URL pair per line.",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.path, "rb") as file:
+            records = read_records(file)
+            if args.jsonl:
+                for record in records:
+                    sys.stdout.write(json.dumps(record, separators=(",", ":")) + "\n")
+                return
+            graph = CrawlGraph.from_records(records)
+    except ValueError as exception:
+        parser.exit(1, f"{parser.prog}: error: {args.path}: {exception}\n")
+
+    if args.edges:
+        with open(args.edges, "w") as edges_file:
+            for parent, children in graph.edges.items():
+                for child in children:
+                    edges_file.write(f"{graph.urls[parent]}\t{graph.urls[child]}\n")
+    stats = graph.fan_out_stats()
+    print(json.dumps(stats, indent=2) if args.json else _format_fan_out_stats(stats))
+
+
+if __name__ == "__main__":
+    main()
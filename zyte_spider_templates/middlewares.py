@@ -6,24 +6,29 @@ from datetime import datetime
 from typing import (
     Any,
     AsyncIterable,
+    Callable,
     Dict,
     Generator,
     Iterable,
     List,
+    MutableMapping,
     Optional,
     Set,
+    Tuple,
     Union,
+    cast,
 )
 from warnings import warn
 
-from scrapy import Request, Spider
+from duplicate_url_discarder_rules import RULE_PATHS
+from scrapy import Request, Spider, signals
 from scrapy.crawler import Crawler
 from scrapy.dupefilters import RFPDupeFilter
 from scrapy.exceptions import IgnoreRequest, NotConfigured
 from scrapy.http import Response
 from scrapy.utils.httpobj import urlparse_cached
-from scrapy.utils.url import url_is_from_any_domain
 from scrapy_poet import DynamicDeps
+from twisted.internet import task
 from zyte_common_items import Article, ArticleNavigation, Item
 
 try:
@@ -31,7 +36,21 @@ try:
 except ImportError:
     from scrapy.spidermiddlewares.offsite import OffsiteMiddleware  # type: ignore[assignment]
 
-from zyte_spider_templates.utils import get_domain
+from zyte_spider_templates._crawling_logs import (
+    CrawlingLogsSummary,
+    CrawlingLogsWriter,
+    encode_json_line,
+)
+from zyte_spider_templates._dupefilters import (
+    FINGERPRINT_STORES,
+    FingerprintStore,
+    SetFingerprintStore,
+)
+from zyte_spider_templates._pqueues import release_request
+from zyte_spider_templates._seeds import PerSeedValues, get_seed_registry
+from zyte_spider_templates._url_rules import DomainRuleIndex
+from zyte_spider_templates.crawl_graph import CrawlGraphEncoder
+from zyte_spider_templates.utils import get_domain, get_fingerprint
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +65,19 @@ class CrawlingLogsMiddleware:
     what went wrong. Apart from high-level summarized information, this also includes
     JSON-formatted data so that it can easily be parsed later on.
 
+    If the :setting:`CRAWLING_LOGS_FILE` setting is set, the JSON-formatted
+    data is written to that file as `JSON Lines`_, or in a compact binary
+    format (see :setting:`CRAWLING_LOGS_FORMAT`), from a background thread
+    instead of being logged.
+
+    .. _JSON Lines: https://jsonlines.org/
+
+    If neither a file is set nor the INFO log level is enabled for this
+    module, no crawling logs data is built at all, and nothing is counted in
+    the summary of :setting:`CRAWLING_LOGS_SAMPLE_RATE`.
+
+    To log only some responses, see :setting:`CRAWLING_LOGS_SAMPLE_RATE`.
+
     Some notes:
         - ``scrapy.utils.request.request_fingerprint`` is used to match what
           https://github.com/scrapinghub/scrapinghub-entrypoint-scrapy uses.
@@ -54,6 +86,13 @@ class CrawlingLogsMiddleware:
     """
 
     unknown_page_type = "unknown"
+    _encoders: Dict[str, Callable[[], Callable[[Any], bytes]]] = {
+        "binary": CrawlGraphEncoder,
+        "jsonl": lambda: encode_json_line,
+    }
+    _writer: Optional[CrawlingLogsWriter] = None
+    _summary: Optional[CrawlingLogsSummary] = None
+    _summary_task: Optional[task.LoopingCall] = None
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -74,20 +113,119 @@ class CrawlingLogsMiddleware:
 
     def __init__(self, crawler=None):
         self._crawler = crawler
+        if crawler is None:
+            return
+        settings = crawler.settings
+        if path := settings.get("CRAWLING_LOGS_FILE"):
+            log_format = settings.get("CRAWLING_LOGS_FORMAT", "jsonl")
+            if log_format not in self._encoders:
+                raise ValueError(
+                    f"Unsupported CRAWLING_LOGS_FORMAT value {log_format!r}. "
+                    f"Supported values: {', '.join(sorted(self._encoders))}."
+                )
+            self._writer = CrawlingLogsWriter(
+                path,
+                settings.getint("CRAWLING_LOGS_QUEUE_SIZE", 10000),
+                self._encoders[log_format](),
+            )
+        self._sample_rate = settings.getint("CRAWLING_LOGS_SAMPLE_RATE", 1)
+        self._sample_rates = {
+            page_type: int(rate)
+            for page_type, rate in settings.getdict(
+                "CRAWLING_LOGS_SAMPLE_RATES"
+            ).items()
+        }
+        if self._sample_rate != 1 or self._sample_rates:
+            self._sample_counts: Dict[str, int] = defaultdict(int)
+            self._summary = CrawlingLogsSummary(self.unknown_page_type)
+            interval = settings.getfloat("CRAWLING_LOGS_SUMMARY_INTERVAL", 60.0)
+            if interval > 0:
+                self._summary_task = task.LoopingCall(self._emit_summary)
+                crawler.signals.connect(
+                    self.spider_opened, signal=signals.spider_opened
+                )
+                self._summary_interval = interval
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    def spider_opened(self, spider) -> None:
+        if self._summary_task is not None:
+            self._summary_task.start(self._summary_interval, now=False)
+
+    def spider_closed(self, spider) -> None:
+        if self._summary_task is not None and self._summary_task.running:
+            self._summary_task.stop()
+        if self._summary is not None:
+            self._emit_summary()
+        if self._writer is not None:
+            self._writer.close()
 
     def _fingerprint(self, request):
-        return self._crawler.request_fingerprinter.fingerprint(request).hex()
+        return get_fingerprint(self._crawler, request).hex()
+
+    def _is_enabled(self) -> bool:
+        return self._writer is not None or logger.isEnabledFor(logging.INFO)
 
     def process_spider_output(self, response, result, spider):
-        result = list(result)
-        crawl_logs = self.crawl_logs(response, result)
-        logger.info(crawl_logs)
-        return result
+        if not self._is_enabled():
+            yield from result
+            return
+        data = self._start_crawl_logs(response)
+        for entry in result:
+            self._process_entry(data, entry)
+            yield entry
+        if data is not None:
+            self._emit_crawl_logs(response, data)
+
+    async def process_spider_output_async(self, response, result, spider):
+        if not self._is_enabled():
+            async for entry in result:
+                yield entry
+            return
+        data = self._start_crawl_logs(response)
+        async for entry in result:
+            self._process_entry(data, entry)
+            yield entry
+        if data is not None:
+            self._emit_crawl_logs(response, data)
 
     def crawl_logs(self, response, result):
+        data = self._build_crawl_logs(response)
+        for entry in result or ():
+            self._add_to_crawl_logs(data, entry)
+        return self._format_crawl_logs(response, data)
+
+    def _start_crawl_logs(self, response) -> Optional[Dict[str, Any]]:
+        """Return the structured crawling logs data for *response*, or
+        ``None`` if *response* is sampled out."""
+        if self._summary is None:
+            return self._build_crawl_logs(response)
+        page_type = response.meta.get("crawling_logs", {}).get("page_type")
+        sampled = self._is_sampled(page_type or self.unknown_page_type)
+        self._summary.add_response(page_type, logged=sampled)
+        if not sampled:
+            assert self._crawler.stats
+            self._crawler.stats.inc_value("crawling_logs/sampled_out")
+            return None
+        return self._build_crawl_logs(response)
+
+    def _is_sampled(self, page_type: str) -> bool:
+        rate = self._sample_rates.get(page_type, self._sample_rate)
+        if rate < 1:
+            return False
+        count = self._sample_counts[page_type]
+        self._sample_counts[page_type] += 1
+        return count % rate == 0
+
+    def _process_entry(self, data: Optional[Dict[str, Any]], entry: Any) -> None:
+        if data is not None:
+            self._add_to_crawl_logs(data, entry)
+        if self._summary is not None and isinstance(entry, Request):
+            self._summary.add_request(entry.meta.get("crawling_logs", {}))
+
+    def _build_crawl_logs(self, response) -> Dict[str, Any]:
         current_page_type = response.meta.get("crawling_logs", {}).get("page_type")
         fingerprint = self._fingerprint(response.request)
-        data: Dict[str, Any] = {
+        return {
             "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "current": {
                 "url": response.url,
@@ -103,27 +241,48 @@ class CrawlingLogsMiddleware:
             "to_crawl": defaultdict(list),
         }
 
-        if result:
-            for entry in result:
-                if not isinstance(entry, Request):
-                    continue
-
-                crawling_logs = entry.meta.get("crawling_logs", {})
-                entry_fingerprint = self._fingerprint(entry)
-                crawling_logs.update(
-                    {
-                        "request_url": entry.url,
-                        "request_priority": entry.priority,
-                        "request_fingerprint": entry_fingerprint,
-                    }
-                )
+    def _add_to_crawl_logs(self, data: Dict[str, Any], entry: Any) -> None:
+        if not isinstance(entry, Request):
+            return
 
-                page_type = crawling_logs.get("page_type")
-                if not page_type:
-                    page_type = self.unknown_page_type
+        # A copy, since records can be written from another thread while
+        # the request meta keeps changing.
+        crawling_logs = {
+            **entry.meta.get("crawling_logs", {}),
+            "request_url": entry.url,
+            "request_priority": entry.priority,
+            "request_fingerprint": self._fingerprint(entry),
+        }
 
-                data["to_crawl"][page_type].append(crawling_logs)
+        page_type = crawling_logs.get("page_type")
+        if not page_type:
+            page_type = self.unknown_page_type
+
+        data["to_crawl"][page_type].append(crawling_logs)
+
+    def _emit_crawl_logs(self, response, data: Dict[str, Any]) -> None:
+        if self._writer is None:
+            logger.info(self._format_crawl_logs(response, data))
+        elif not self._writer.write(data):
+            assert self._crawler.stats
+            self._crawler.stats.inc_value("crawling_logs/dropped")
+
+    def _emit_summary(self) -> None:
+        assert self._summary is not None
+        summary = self._summary.to_dict()
+        if self._writer is None:
+            logger.info(f"Crawling Logs Summary:\n{json.dumps(summary, indent=2)}")
+            return
+        record = {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "summary": summary,
+        }
+        if not self._writer.write(record):
+            assert self._crawler.stats
+            self._crawler.stats.inc_value("crawling_logs/dropped")
 
+    def _format_crawl_logs(self, response, data: Dict[str, Any]) -> str:
+        current_page_type = data["current"]["page_type"]
         if data["to_crawl"]:
             summary = ["Number of Requests per page type:"]
             for page_type, requests in data["to_crawl"].items():
@@ -152,6 +311,9 @@ class AllowOffsiteMiddleware(OffsiteMiddleware):
         return super().should_follow(request, spider)
 
 
+_PENDING_META_KEY = "_max_requests_per_seed_pending"
+
+
 class MaxRequestsPerSeedDownloaderMiddleware:
     """This middleware limits the number of requests that each seed request can subsequently
     have.
@@ -164,6 +326,19 @@ class MaxRequestsPerSeedDownloaderMiddleware:
     requests are not.
 
     Please note that you also need to enable TrackSeedsSpiderMiddleware to make this work.
+
+    To also drop requests over the limit before they are scheduled, use
+    :class:`~zyte_spider_templates.SeedAwarePriorityQueue`. Requests that
+    other downloader middlewares filter out then stop counting towards the
+    limit of enqueued requests.
+
+    If the ``MAX_REQUESTS_PER_SEED_ADAPTIVE`` setting is ``True``,
+    ``MAX_REQUESTS_PER_SEED`` is the share of each seed in a budget common
+    to all seeds of start requests. Seeds that run out of requests to send,
+    or whose ratio of scraped items per request is below the ratio of the
+    whole crawl, release the unused rest of their share, and seeds that have
+    used their share can use released budget as long as their ratio is not
+    below the ratio of the whole crawl.
     """
 
     def __init__(self, crawler: Crawler):
@@ -174,10 +349,44 @@ class MaxRequestsPerSeedDownloaderMiddleware:
         if not max_requests_per_seed:
             raise NotConfigured
         self.crawler = crawler
-        self.requests_per_seed: defaultdict = defaultdict(int)
+        self._seeds = get_seed_registry(crawler)
+        self.requests_per_seed = {}
         self.seeds_reached_limit: Set[str] = set()
         self.max_requests_per_seed = max_requests_per_seed
 
+        self.adaptive = crawler.spider.settings.getbool(
+            "MAX_REQUESTS_PER_SEED_ADAPTIVE", False
+        )
+        if self.adaptive:
+            # Scheduled requests not sent nor dropped yet, per seed ID.
+            self._pending = PerSeedValues.counters(self._seeds)
+            self._items = PerSeedValues.counters(self._seeds)
+            # Share of each seed ID not used yet, while the seed has pending
+            # requests and a ratio of items per request not below that of the
+            # crawl. The share of seeds without requests yet is reserved too.
+            self._reserved = PerSeedValues.counters(self._seeds)
+            self._started = PerSeedValues[int](self._seeds, bytearray(), 0)
+            self._started_seeds = 0
+            self._total_requests = 0
+            self._total_items = 0
+            self._total_reserved = 0
+            crawler.signals.connect(
+                self.request_scheduled, signal=signals.request_scheduled
+            )
+            crawler.signals.connect(
+                self.request_dropped, signal=signals.request_dropped
+            )
+            crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+
+    @property
+    def requests_per_seed(self) -> MutableMapping[Any, int]:
+        return self._requests_per_seed
+
+    @requests_per_seed.setter
+    def requests_per_seed(self, value: MutableMapping[Any, int]) -> None:
+        self._requests_per_seed = PerSeedValues.counters(self._seeds)
+        self._requests_per_seed.update(value)
+
     @classmethod
     def from_crawler(cls, crawler: Crawler):
         return cls(crawler)
@@ -186,27 +395,117 @@ class MaxRequestsPerSeedDownloaderMiddleware:
         seed = request.meta.get("seed")
         if seed is None:
             return
-        if self.max_requests_per_seed_reached(seed):
-            self.seeds_reached_limit.add(seed)
+        seed_id = self._seeds.get_id(seed)
+        count = self._requests_per_seed.get_by_id(seed_id)
+        if self.adaptive:
+            self._release_pending(request)
+            allowed = self._can_send(seed_id, count)
+        else:
+            allowed = count < self.max_requests_per_seed
+        if not allowed:
+            self.seeds_reached_limit.add(self._seeds.get_seed(seed))
             logging.debug(
                 f"The request {request} is skipped as {self.max_requests_per_seed} "
-                f"max requests per seed have been reached for seed {seed}."
+                f"max requests per seed have been reached for seed "
+                f"{self._seeds.get_seed(seed)}."
             )
             assert self.crawler.stats
             self.crawler.stats.set_value(
                 "seeds/max_requests_reached", len(self.seeds_reached_limit)
             )
             raise IgnoreRequest("max_requests_per_seed_reached")
-        self.requests_per_seed[seed] += 1
+        self._requests_per_seed.set_by_id(seed_id, count + 1)
+        if self.adaptive:
+            self._total_requests += 1
+            self._update_reserved(seed_id)
+            if count >= self.max_requests_per_seed:
+                assert self.crawler.stats
+                self.crawler.stats.inc_value("seeds/released_budget_requests")
         return
 
-    def max_requests_per_seed_reached(self, seed: str) -> bool:
+    def process_exception(self, request, exception, spider):
+        if self.adaptive:
+            # Still pending if an earlier downloader middleware dropped it.
+            self._release_pending(request)
+        if isinstance(exception, IgnoreRequest) and exception.args != (
+            "max_requests_per_seed_reached",
+        ):
+            # Filtered out by another downloader middleware, e.g. as offsite.
+            release_request(self.crawler, request)
+
+    def max_requests_per_seed_reached(self, seed: Any) -> bool:
         return self.requests_per_seed.get(seed, 0) >= self.max_requests_per_seed
 
+    def request_scheduled(self, request: Request, spider: Spider) -> None:
+        if (seed := request.meta.get("seed")) is not None:
+            # Flagged in meta to survive disk queues and to release each
+            # request once, whatever happens to it first.
+            request.meta[_PENDING_META_KEY] = True
+            self._add_pending(self._seeds.get_id(seed), 1)
+
+    def request_dropped(self, request: Request, spider: Spider) -> None:
+        self._release_pending(request)
+
+    def item_scraped(self, item: Any, response: Response, spider: Spider) -> None:
+        if response is None or (seed := response.meta.get("seed")) is None:
+            return
+        seed_id = self._seeds.get_id(seed)
+        self._items.set_by_id(seed_id, self._items.get_by_id(seed_id) + 1)
+        self._total_items += 1
+        self._update_reserved(seed_id)
+
+    def _release_pending(self, request: Request) -> None:
+        if not request.meta.pop(_PENDING_META_KEY, False):
+            return
+        if (seed := request.meta.get("seed")) is not None:
+            self._add_pending(self._seeds.get_id(seed), -1)
+
+    def _add_pending(self, seed_id: int, delta: int) -> None:
+        pending = max(0, self._pending.get_by_id(seed_id) + delta)
+        self._pending.set_by_id(seed_id, pending)
+        self._update_reserved(seed_id)
+
+    def _update_reserved(self, seed_id: int) -> None:
+        # The reserved share of a seed only follows the ratio of the crawl
+        # when the seed itself changes, to keep this O(1).
+        if not self._started.get_by_id(seed_id):
+            self._started.set_by_id(seed_id, 1)
+            self._started_seeds += 1
+        reserved = 0
+        if self._pending.get_by_id(seed_id) and not self._below_average(seed_id):
+            used = self._requests_per_seed.get_by_id(seed_id)
+            reserved = max(0, self.max_requests_per_seed - used)
+        self._total_reserved += reserved - self._reserved.get_by_id(seed_id)
+        self._reserved.set_by_id(seed_id, reserved)
+
+    def _below_average(self, seed_id: int) -> bool:
+        # items / requests < total items / total requests
+        requests = self._requests_per_seed.get_by_id(seed_id)
+        items = self._items.get_by_id(seed_id)
+        return requests > 0 and items * self._total_requests < (
+            self._total_items * requests
+        )
+
+    def _can_send(self, seed_id: int, count: int) -> bool:
+        below_average = self._below_average(seed_id)
+        if count < self.max_requests_per_seed and not below_average:
+            return True
+        seed_count = self._seeds.start_seed_count
+        if seed_count is None:
+            # The budget is unknown until all start requests have been read.
+            return count < self.max_requests_per_seed
+        unstarted_seeds = max(0, seed_count - self._started_seeds)
+        budget = self.max_requests_per_seed * (seed_count - unstarted_seeds)
+        if self._total_requests + self._total_reserved >= budget:
+            return False
+        # Seeds below the average can still use what is left of their share.
+        return count < self.max_requests_per_seed or not below_average
+
 
 class TrackSeedsSpiderMiddleware:
     def __init__(self, crawler: Crawler):
         self.crawler = crawler
+        self._seeds = get_seed_registry(crawler)
 
     @classmethod
     def from_crawler(cls, crawler: Crawler):
@@ -215,10 +514,14 @@ class TrackSeedsSpiderMiddleware:
     def process_start_requests(
         self, start_requests: Iterable[Request], spider: Spider
     ) -> Iterable[Request]:
+        seed_ids = set()
         for request in start_requests:
-            request.meta.setdefault("seed", request.url)
+            seed = request.meta.get("seed", request.url)
+            seed_ids.add(self._seeds.get_id(seed))
+            request.meta["seed"] = self._seeds.to_meta(seed)
             request.meta.setdefault("is_seed_request", True)
             yield request
+        self._seeds.start_seed_count = len(seed_ids)
 
     def process_spider_output(
         self,
@@ -256,7 +559,7 @@ class TrackSeedsSpiderMiddleware:
             yield request
             return
 
-        request.meta["seed"] = seed
+        request.meta["seed"] = self._seeds.to_meta(seed)
         yield request
 
 
@@ -416,6 +719,19 @@ class OnlyFeedsMiddleware(PageParamsMiddlewareBase):
         )
 
 
+def _host_matches_any_suffix(host: str, suffixes: Set[str]) -> bool:
+    """Return ``True`` if *host* or any of its parent domains is in
+    *suffixes*, with the same semantics as
+    :func:`~scrapy.utils.url.url_is_from_any_domain`."""
+    while True:
+        if host in suffixes:
+            return True
+        dot = host.find(".")
+        if dot == -1:
+            return False
+        host = host[dot + 1 :]
+
+
 class OffsiteRequestsPerSeedMiddleware:
     """This middleware ensures that subsequent requests for each seed do not go outside
     the original seed's domain.
@@ -454,9 +770,26 @@ class OffsiteRequestsPerSeedMiddleware:
             raise NotConfigured
 
         self.stats = crawler.stats
-        self.allowed_domains_per_seed: Dict[str, Set[str]] = defaultdict(set)
+        self._seeds = get_seed_registry(crawler)
+        self.allowed_domains_per_seed = {}
         self.domains_seen: Set[str] = set()
 
+    @property
+    def allowed_domains_per_seed(self) -> MutableMapping[Any, Set[str]]:
+        return self._allowed_domains_per_seed
+
+    @allowed_domains_per_seed.setter
+    def allowed_domains_per_seed(self, value: MutableMapping[Any, Set[str]]) -> None:
+        self._allowed_domains_per_seed: PerSeedValues[Set[str]] = PerSeedValues(
+            self._seeds
+        )
+        # Lowercase domains per seed ID, matched against every suffix of a URL
+        # host, so that the cost of a check does not depend on the number of
+        # allowed domains.
+        self._domain_suffixes_per_seed: List[Optional[Set[str]]] = []
+        for seed, domains in value.items():
+            self._add_allowed_domains(seed, domains)
+
     @classmethod
     def from_crawler(cls, crawler):
         return cls(crawler)
@@ -521,13 +854,29 @@ class OffsiteRequestsPerSeedMiddleware:
 
         if not response.meta.get("is_seed_request"):
             if domains_for_update := response.meta.get("seed_domains"):
-                self.allowed_domains_per_seed[seed].update(domains_for_update)
+                self._add_allowed_domains(seed, domains_for_update)
             return
 
         domains_for_update = response.meta.get(
             "seed_domains", self._get_allowed_domains(response)
         )
-        self.allowed_domains_per_seed[seed].update(domains_for_update)
+        self._add_allowed_domains(seed, domains_for_update)
+
+    def _add_allowed_domains(self, seed: Any, domains: Iterable[str]) -> None:
+        # Iterated twice below.
+        domains = list(domains)
+        seed_id = self._seeds.get_id(seed)
+        allowed_domains = self._allowed_domains_per_seed.get_by_id(seed_id)
+        if allowed_domains is None:
+            allowed_domains = set()
+            self._allowed_domains_per_seed.set_by_id(seed_id, allowed_domains)
+            suffixes = self._domain_suffixes_per_seed
+            suffixes.extend([None] * (seed_id + 1 - len(suffixes)))
+            suffixes[seed_id] = set()
+        allowed_domains.update(domains)
+        self._domain_suffixes_per_seed[seed_id].update(  # type: ignore[union-attr]
+            domain.lower() for domain in domains
+        )
 
     def _is_domain_per_seed_allowed(
         self, req_or_resp: Union[Request, Response]
@@ -536,8 +885,13 @@ class OffsiteRequestsPerSeedMiddleware:
         if seed is None:
             return True
 
-        if allowed_domains := self.allowed_domains_per_seed.get(seed):
-            return url_is_from_any_domain(req_or_resp.url, allowed_domains)
+        seed_id = self._seeds.find_id(seed)
+        if seed_id is None or seed_id >= len(self._domain_suffixes_per_seed):
+            return False
+        if suffixes := self._domain_suffixes_per_seed[seed_id]:
+            return _host_matches_any_suffix(
+                urlparse_cached(req_or_resp).netloc.lower(), suffixes
+            )
 
         return False
 
@@ -588,12 +942,62 @@ class DupeFilterSpiderMiddleware:
     leveraging the `DummyDupeFilter` to bypass global deduplication. Instead,
     deduplication is managed within the middleware itself, filtering out duplicate requests
     before they reach other middlewares.
+
+    Use the ``DUPE_FILTER_BACKEND`` setting to store fingerprints in a compact
+    hash table (``"hash_table"``), in a scalable Bloom filter (``"bloom"``) or
+    on disk (``"disk"``) instead of in a Python set (``"set"``, default).
+
+    Fingerprints are tracked per crawler and released when the spider closes,
+    unless the ``DUPE_FILTER_SHARED`` setting is ``True``, in which case they
+    are shared with other crawlers of the same process that also enable that
+    setting with the same backend and backend settings, e.g. the same
+    ``JOBDIR`` for the ``"disk"`` backend.
     """
 
+    # Only its request fingerprinter is used.
     dupe_filter: RFPDupeFilter = RFPDupeFilter()
 
+    _shared_fingerprints: Dict[Tuple[Any, ...], FingerprintStore] = {}
+    _shared_users: Dict[Tuple[Any, ...], int] = defaultdict(int)
+
     def __init__(self, crawler):
         self.crawler = crawler
+        backend = crawler.settings.get("DUPE_FILTER_BACKEND", "set")
+        try:
+            store_cls = FINGERPRINT_STORES[backend]
+        except KeyError:
+            raise ValueError(
+                f"Unsupported DUPE_FILTER_BACKEND value: {backend!r}. Supported "
+                f"values: {', '.join(FINGERPRINT_STORES)}."
+            )
+        self._shared = crawler.settings.getbool("DUPE_FILTER_SHARED", False)
+        # Stores built from different settings, e.g. disk stores of
+        # different jobs, are not shared.
+        self._sharing_key = (backend, *store_cls.sharing_key(crawler.settings))
+        self.fingerprints: FingerprintStore
+        if self._shared:
+            key = self._sharing_key
+            if key not in self._shared_fingerprints:
+                self._shared_fingerprints[key] = store_cls.from_settings(
+                    crawler.settings
+                )
+            self._shared_users[key] += 1
+            self.fingerprints = self._shared_fingerprints[key]
+        else:
+            self.fingerprints = store_cls.from_settings(crawler.settings)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    def spider_closed(self, spider) -> None:
+        self.fingerprints.to_stats(self.crawler.stats, "dupe_filter_spider_mw")
+        if not self._shared:
+            self.fingerprints.close()
+        else:
+            self._shared_users[self._sharing_key] -= 1
+            if not self._shared_users[self._sharing_key]:
+                del self._shared_users[self._sharing_key]
+                self._shared_fingerprints.pop(self._sharing_key).close()
+        # Release fingerprints even if the crawler outlives its crawl.
+        self.fingerprints = SetFingerprintStore()
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -628,10 +1032,86 @@ class DupeFilterSpiderMiddleware:
 
     def url_already_seen(self, response: Optional[Response], request: Request) -> bool:
         """A custom replacement for the default duplicate filtering, tracking URLs seen in this run."""
-        if not request.dont_filter and self.dupe_filter.request_seen(request):
+        if not request.dont_filter and self._request_seen(request):
             logger.debug(
                 f"URL is duplicated {request.url}, for the response {response.url if response else 'start_request'}."
             )
             self.crawler.stats.inc_value("dupe_filter_spider_mw/url_already_seen")
             return True
         return False
+
+    def _request_seen(self, request: Request) -> bool:
+        fingerprint = get_fingerprint(
+            self.crawler,
+            request,
+            request.meta.get("dud_canonical_url"),
+            fingerprinter=self.dupe_filter.fingerprinter,
+        )
+        return self.fingerprints.add(fingerprint)
+
+
+class CanonicalizeUrlsSpiderMiddleware:
+    """Canonicalizes the URL of requests yielded by spider callbacks with the
+    ``duplicate-url-discarder`` rules read from the ``DUD_LOAD_RULE_PATHS``
+    setting, so that URL variants, e.g. with tracking query parameters, become
+    duplicates before any other spider middleware processes them.
+
+    Requests keep their original URL, which is the one sent. The canonical
+    URL is stored in the ``dud_canonical_url`` :attr:`Request.meta
+    <scrapy.http.Request.meta>` key, which
+    :class:`~zyte_spider_templates.middlewares.DupeFilterSpiderMiddleware`
+    uses instead of the request URL to compute request fingerprints.
+
+    Rules are compiled once into a per-domain index, and each URL is only
+    matched against the rules of its domain.
+
+    Requests with the ``dud`` :attr:`Request.meta
+    <scrapy.http.Request.meta>` key set to ``False`` are not canonicalized.
+
+    To deduplicate canonical URLs, enable this middleware with a higher value
+    than :class:`~zyte_spider_templates.middlewares.DupeFilterSpiderMiddleware`
+    in the ``SPIDER_MIDDLEWARES`` setting.
+    """
+
+    def __init__(self, crawler: Crawler):
+        self.crawler = crawler
+        # RULE_PATHS is typed as Optional, but is always a list.
+        rule_paths = crawler.settings.getlist("DUD_LOAD_RULE_PATHS") or cast(
+            List[str], RULE_PATHS
+        )
+        self.rule_index = DomainRuleIndex(rule_paths)
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler)
+
+    def process_spider_output(
+        self, response, result, spider
+    ) -> Iterable[Union[Request, Item]]:
+        for item_or_request in result:
+            if isinstance(item_or_request, Request):
+                yield self.canonicalize(item_or_request)
+            else:
+                yield item_or_request
+
+    async def process_spider_output_async(
+        self, response, result, spider
+    ) -> AsyncIterable[Union[Request, Item]]:
+        async for item_or_request in result:
+            if isinstance(item_or_request, Request):
+                yield self.canonicalize(item_or_request)
+            else:
+                yield item_or_request
+
+    def canonicalize(self, request: Request) -> Request:
+        """Return *request* with the canonical form of its URL in the
+        ``dud_canonical_url`` meta key, if it differs from its URL."""
+        if not request.meta.get("dud", True):
+            return request
+        url = self.rule_index.process_url(request.url, urlparse_cached(request).netloc)
+        if url == request.url:
+            return request
+        assert self.crawler.stats
+        self.crawler.stats.inc_value("canonicalize_urls_spider_mw/url_canonicalized")
+        request.meta["dud_canonical_url"] = url
+        return request
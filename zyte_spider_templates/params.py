@@ -405,3 +405,28 @@ class MaxRequestsPerSeedParam(BaseModel):
         ),
         default=None,
     )
+
+
+class IncrementalParam(BaseModel):
+    incremental: bool = Field(
+        description=(
+            "Skip items with URLs already stored in the specified Zyte Scrapy Cloud Collection. "
+            "This feature helps avoid reprocessing previously crawled items and requests by comparing "
+            "their URLs against the stored collection."
+        ),
+        default=False,
+    )
+    incremental_collection_name: Optional[str] = Field(
+        description=(
+            "Name of the Zyte Scrapy Cloud Collection used during an incremental crawl."
+            "By default, a Collection named after the spider (or virtual spider) is used, "
+            "meaning that matching URLs from previous runs of the same spider are skipped, "
+            "provided those previous runs had `incremental` argument set to `true`."
+            "Using a different collection name makes sense, for example, in the following cases:"
+            "- different spiders share a collection."
+            "- the same spider uses different collections (e.g., for development runs vs. production runs). "
+            "Only ASCII alphanumeric characters and underscores are allowed in the collection name."
+        ),
+        default=None,
+        pattern="^[a-zA-Z0-9_]+$",
+    )
@@ -28,6 +28,7 @@ from zyte_spider_templates.params import (
     ExtractFrom,
     ExtractFromParam,
     GeolocationParam,
+    IncrementalParam,
     MaxRequestsParam,
     MaxRequestsPerSeedParam,
     UrlParam,
@@ -78,31 +79,6 @@ class RequestType(Enum):
     )
 
 
-class IncrementalParam(BaseModel):
-    incremental: bool = Field(
-        description=(
-            "Skip items with URLs already stored in the specified Zyte Scrapy Cloud Collection. "
-            "This feature helps avoid reprocessing previously crawled items and requests by comparing "
-            "their URLs against the stored collection."
-        ),
-        default=False,
-    )
-    incremental_collection_name: Optional[str] = Field(
-        description=(
-            "Name of the Zyte Scrapy Cloud Collection used during an incremental crawl."
-            "By default, a Collection named after the spider (or virtual spider) is used, "
-            "meaning that matching URLs from previous runs of the same spider are skipped, "
-            "provided those previous runs had `incremental` argument set to `true`."
-            "Using a different collection name makes sense, for example, in the following cases:"
-            "- different spiders share a collection."
-            "- the same spider uses different collections (e.g., for development runs vs. production runs). "
-            "Only ASCII alphanumeric characters and underscores are allowed in the collection name."
-        ),
-        default=None,
-        pattern="^[a-zA-Z0-9_]+$",
-    )
-
-
 @document_enum
 class ArticleCrawlStrategy(str, Enum):
     full: str = "full"
@@ -183,7 +159,6 @@ class ArticleSpider(Args[ArticleSpiderParams], BaseSpider):
         spider = super(ArticleSpider, cls).from_crawler(crawler, *args, **kwargs)
         spider._init_input()
         spider._init_extract_from()
-        spider._init_incremental()
 
         if spider.args.max_requests_per_seed:
             spider.settings.set(
@@ -224,11 +199,7 @@ class ArticleSpider(Args[ArticleSpiderParams], BaseSpider):
             )
 
     def _init_incremental(self):
-        self.settings.set(
-            "INCREMENTAL_CRAWL_ENABLED",
-            self.args.incremental,
-            priority=ARG_SETTING_PRIORITY,
-        )
+        super()._init_incremental()
         if self.args.incremental:
             self.settings.set(
                 "NAVIGATION_DEPTH_LIMIT",
@@ -238,15 +209,6 @@ class ArticleSpider(Args[ArticleSpiderParams], BaseSpider):
             self.logger.info(
                 "NAVIGATION_DEPTH_LIMIT=1 is set because the incremental crawling is enabled."
             )
-            if self.args.incremental_collection_name:
-                self.settings.set(
-                    "INCREMENTAL_CRAWL_COLLECTION_NAME",
-                    self.args.incremental_collection_name,
-                    priority=ARG_SETTING_PRIORITY,
-                )
-                self.logger.info(
-                    f"INCREMENTAL_CRAWL_COLLECTION_NAME={self.args.incremental_collection_name} "
-                )
 
     def _update_inject_meta(self, meta: Dict[str, Any], is_feed: bool) -> None:
         """
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from importlib.metadata import version
-from typing import TYPE_CHECKING, Annotated, Any, Dict
+from typing import TYPE_CHECKING, Annotated, Any, Dict, Optional
 from warnings import warn
 
 import scrapy
@@ -92,6 +92,15 @@ class BaseSpider(scrapy.Spider):
 
     _NEXT_PAGE_PRIORITY: int = 100
 
+    #: Type of the items of the spider, used to namespace the fingerprints of
+    #: incremental crawls. If set, only requests with the same
+    #: ``incremental_item_type`` meta key are checked against previous crawls.
+    incremental_item_type: Optional[str] = None
+
+    #: Spider arguments, set by subclasses of
+    #: :class:`scrapy_spider_metadata.Args`.
+    args: Any
+
     _custom_attrs_dep = None
     _log_request_exception: _LogExceptionsContextManager = None  # type: ignore[assignment]
 
@@ -139,6 +148,31 @@ class BaseSpider(scrapy.Spider):
                 custom_attrs(custom_attrs_input, custom_attrs_options),
             ]
 
+        if hasattr(spider.args, "incremental"):
+            spider._init_incremental()
+
         spider._log_request_exception = _LogExceptionsContextManager(spider, ValueError)
 
         return spider
+
+    def _init_incremental(self):
+        self.settings.set(
+            "INCREMENTAL_CRAWL_ENABLED",
+            self.args.incremental,
+            priority=ARG_SETTING_PRIORITY,
+        )
+        if self.args.incremental and self.args.incremental_collection_name:
+            self.settings.set(
+                "INCREMENTAL_CRAWL_COLLECTION_NAME",
+                self.args.incremental_collection_name,
+                priority=ARG_SETTING_PRIORITY,
+            )
+            self.logger.info(
+                f"INCREMENTAL_CRAWL_COLLECTION_NAME={self.args.incremental_collection_name} "
+            )
+
+    def _set_incremental_item_type(self, meta: Dict[str, Any]) -> None:
+        """Marks the request with *meta* as a request for an item page, to be
+        skipped by incremental crawls if seen before."""
+        if getattr(self.args, "incremental", False) and self.incremental_item_type:
+            meta["incremental_item_type"] = self.incremental_item_type
@@ -45,6 +45,7 @@ from ..params import (
     CustomAttrsMethodParam,
     ExtractFromParam,
     GeolocationParam,
+    IncrementalParam,
     MaxRequestsParam,
     SearchQueriesParam,
     UrlParam,
@@ -215,6 +216,7 @@ class EcommerceSpiderParams(
     EcommerceCrawlStrategyParam,
     EcommerceExtractParam,
     EcommerceSearchQueriesParam,
+    IncrementalParam,
     UrlsFileParam,
     UrlsParam,
     UrlParam,
@@ -264,6 +266,8 @@ class EcommerceSpider(Args[EcommerceSpiderParams], BaseSpider):
 
     name = "ecommerce"
 
+    incremental_item_type = "product"
+
     metadata: Dict[str, Any] = {
         **BaseSpider.metadata,
         "title": "E-commerce",
@@ -311,6 +315,8 @@ class EcommerceSpider(Args[EcommerceSpiderParams], BaseSpider):
             meta.setdefault("inject", []).append(self._custom_attrs_dep)
         if self.args.extract == EcommerceExtract.productList:
             meta.setdefault("inject", []).append(ProductList)
+        if callback == self.parse_product:
+            self._set_incremental_item_type(meta)
 
         if self.args.crawl_strategy == EcommerceCrawlStrategy.full:
             meta["page_params"] = {"full_domain": get_domain(url)}
@@ -571,6 +577,7 @@ class EcommerceSpider(Args[EcommerceSpiderParams], BaseSpider):
             meta=meta,
         )
         scrapy_request.meta["allow_offsite"] = True
+        self._set_incremental_item_type(scrapy_request.meta)
         return scrapy_request
 
     def _modify_page_params_for_heuristics(
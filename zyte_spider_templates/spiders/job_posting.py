@@ -40,6 +40,7 @@ from ..params import (
     ExtractFrom,
     ExtractFromParam,
     GeolocationParam,
+    IncrementalParam,
     MaxRequestsParam,
     SearchQueriesParam,
     UrlParam,
@@ -110,6 +111,7 @@ class JobPostingSpiderParams(
     GeolocationParam,
     JobPostingCrawlStrategyParam,
     JobPostingSearchQueriesParam,
+    IncrementalParam,
     UrlsFileParam,
     UrlsParam,
     UrlParam,
@@ -135,6 +137,8 @@ class JobPostingSpider(Args[JobPostingSpiderParams], BaseSpider):
 
     name = "job_posting"
 
+    incremental_item_type = "jobPosting"
+
     metadata: Dict[str, Any] = {
         **BaseSpider.metadata,
         "title": "Job posting",
@@ -182,6 +186,8 @@ class JobPostingSpider(Args[JobPostingSpiderParams], BaseSpider):
             meta["inject"] = [
                 self._custom_attrs_dep,
             ]
+        if self.args.crawl_strategy == JobPostingCrawlStrategy.direct_item:
+            self._set_incremental_item_type(meta)
         return scrapy.Request(
             url=url,
             callback=callback,
@@ -324,4 +330,5 @@ class JobPostingSpider(Args[JobPostingSpiderParams], BaseSpider):
             meta=meta,
         )
         scrapy_request.meta["allow_offsite"] = True
+        self._set_incremental_item_type(scrapy_request.meta)
         return scrapy_request
@@ -1,8 +1,12 @@
+import base64
 import hashlib
 import logging
 import os
 import re
-from typing import List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+from weakref import WeakKeyDictionary
 
 import scrapinghub
 import tldextract
@@ -46,7 +50,12 @@ def get_domain_fingerprint(url: str) -> str:
     Create a consistent 2-byte domain fingerprint by combining partial hashes
     of the main domain (without TLD) and the subdomain components.
     """
-    extracted = tldextract.extract(url)
+    return _get_netloc_fingerprint(urlsplit(url).netloc or url)
+
+
+@lru_cache(maxsize=4096)
+def _get_netloc_fingerprint(netloc: str) -> str:
+    extracted = tldextract.extract(netloc)
     main_domain = extracted.domain
     subdomains = extracted.subdomain
 
@@ -59,14 +68,71 @@ def get_domain_fingerprint(url: str) -> str:
     return main_domain_hash + subdomain_hash
 
 
-def get_request_fingerprint(crawler: Crawler, request: Request) -> str:
-    """Create a fingerprint by including a domain-specific part."""
+_URL_FINGERPRINT_CACHES: "WeakKeyDictionary[Any, WeakKeyDictionary[Request, Dict[str, bytes]]]" = (
+    WeakKeyDictionary()
+)
+
+
+def get_fingerprint(
+    crawler: Crawler,
+    request: Request,
+    url: Optional[str] = None,
+    *,
+    fingerprinter: Any = None,
+) -> bytes:
+    """Return the fingerprint of *request*, or of a copy of *request* with
+    *url* as URL, as returned by *fingerprinter*, which defaults to the
+    request fingerprinter of *crawler*.
+
+    Request fingerprinters already cache the fingerprint of each request, but
+    a copy with a different URL would be a new request every time, so
+    fingerprints for *url* are cached per fingerprinter for as long as
+    *request* is in memory. Hits of that cache are counted in the
+    ``fingerprint_cache/hits`` stat.
+    """
+    fingerprinter = fingerprinter or crawler.request_fingerprinter
+    if url is None or url == request.url:
+        return fingerprinter.fingerprint(request)
+    if fingerprinter not in _URL_FINGERPRINT_CACHES:
+        _URL_FINGERPRINT_CACHES[fingerprinter] = WeakKeyDictionary()
+    cache = _URL_FINGERPRINT_CACHES[fingerprinter]
+    if (fingerprints := cache.get(request)) is None:
+        fingerprints = cache[request] = {}
+    if (fingerprint := fingerprints.get(url)) is not None:
+        if crawler.stats:
+            crawler.stats.inc_value("fingerprint_cache/hits")
+        return fingerprint
+    fingerprint = fingerprints[url] = fingerprinter.fingerprint(
+        request.replace(url=url)
+    )
+    return fingerprint
+
+
+def get_request_fingerprint(
+    crawler: Crawler,
+    request: Request,
+    url: Optional[str] = None,
+    item_type: Optional[str] = None,
+) -> str:
+    """Create a fingerprint by including a domain-specific part.
+
+    If *url* is specified, the fingerprint is that of a copy of *request* with
+    *url* as URL.
+
+    If *item_type* is specified, the fingerprint is specific to that item
+    type, i.e. the same URL has a different fingerprint for each item type.
+    """
 
     # Calculate domain fingerprint
-    domain_fingerprint = get_domain_fingerprint(request.url)
+    domain_fingerprint = get_domain_fingerprint(url or request.url)
 
     # Calculate request fingerprint
-    request_fingerprint = crawler.request_fingerprinter.fingerprint(request).hex()  # type: ignore[union-attr]
+    fingerprint = get_fingerprint(crawler, request, url)
+    if item_type:
+        fingerprint = hashlib.sha1(  # nosec
+            item_type.encode() + b"\0" + fingerprint
+        ).digest()
+    request_fingerprint = fingerprint.hex()
 
     # Combine the fingerprints by taking the 2-bytes (4 chars) domain fingerprint
     # to create a domain-specific identifier.
@@ -75,6 +141,20 @@ def get_request_fingerprint(crawler: Crawler, request: Request) -> str:
     return domain_fingerprint + request_fingerprint
 
 
+def get_compact_fingerprint(fingerprint: str, size: int = 12) -> str:
+    """Return a shorter form of a fingerprint returned by
+    :func:`get_request_fingerprint`.
+
+    It keeps the domain-specific part, followed by the first *size* bytes of
+    the request fingerprint encoded as URL-safe base64 without padding, i.e.
+    20 characters instead of 44 by default.
+    """
+    request_fingerprint = bytes.fromhex(fingerprint[4:])[:size]
+    return fingerprint[:4] + base64.urlsafe_b64encode(
+        request_fingerprint
+    ).decode().rstrip("=")
+
+
 def get_project_id(crawler: Crawler) -> Optional[str]:
     """
     Retrieve the project ID required for IncrementalCrawlMiddleware.